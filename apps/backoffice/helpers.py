@@ -1,18 +1,37 @@
+import json
 import secrets
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
 from typing import Annotated
-from fastapi import Depends, HTTPException
+from uuid import UUID
+from fastapi import Depends, HTTPException, Request, Response
 from sqlalchemy.orm import Session
 
-from apps.backoffice.models import StaffUser
-from core.db.session import get_db
+from apps.backoffice.models import PermissionPolicy, StaffUser
+from apps.backoffice.permissions import PERMISSIONS
+from apps.backoffice.utils import get_formatted_permissions
+from core.config import config
+from core.db.session import get_db, request_session
 from core.lib.authentication import (
     AUTHENTICATION_EXCEPTION,
     decode_token,
-    verify_password,
+    password_hasher,
     pwd_context
 )
-from core.lib.exceptions import BadRequest
-from core.lib.permissions import oauth2_scheme
+from core.lib.cache import MISSING, TTLCache, invalidate_on_commit
+from core.lib.exceptions import AuthenticationError, BadRequest
+from core.lib import permissions as core_permissions
+from core.lib.permissions import (
+    compile_permissions,
+    get_remote_permission_mask,
+    oauth2_scheme,
+    route_requires_authentication,
+)
+from core.lib.principals import PrincipalCache
+
+ALL_PERMISSIONS = frozenset(PERMISSIONS)
+NO_PERMISSIONS = frozenset()
+ALL_PERMISSIONS_MASK = compile_permissions(ALL_PERMISSIONS)
 
 
 def get_staff_user(db: Session, username: str):
@@ -22,9 +41,9 @@ def get_staff_user(db: Session, username: str):
     return user
 
 
-def authenticate_staff_user(db: Session, username: str, password: str):
+async def authenticate_staff_user(db: Session, username: str, password: str):
     user = get_staff_user(db, username)
-    if not verify_password(password, user.password):
+    if not await password_hasher.verify(password, user.password):
         user.login_attempt += 1
         if user.login_attempt >= 5:
             user.status = "Password Locked"
@@ -33,8 +52,9 @@ def authenticate_staff_user(db: Session, username: str, password: str):
             exception_type="user.invalid_credentials",
             msg="Invalid username or password",
         )
-    user.login_attempt = 0
-    db.commit()
+    if user.login_attempt:
+        user.login_attempt = 0
+        db.commit()
     return user
 
 
@@ -61,4 +81,234 @@ def generate_hash(plain_text):
 
 
 def generate_password_reset_token():
-    return secrets.token_urlsafe(30)
\ No newline at end of file
+    return secrets.token_urlsafe(30)
+
+
+@dataclass(frozen=True, slots=True)
+class StaffPrincipal:
+    """What backoffice requests need to know about their staff user."""
+
+    id: UUID
+    name: str
+    username: str
+    role: str
+    status: str
+    is_superuser: bool
+    force_change_password: bool
+    permission_policy_id: int | None
+
+    @property
+    def is_active(self) -> bool:
+        return self.status == "Active"
+
+    @classmethod
+    def from_model(cls, user: StaffUser) -> "StaffPrincipal":
+        return cls(**{field: getattr(user, field) for field in cls.__slots__})
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "StaffPrincipal":
+        return cls(**{**data, "id": UUID(data["id"])})
+
+
+@dataclass(frozen=True, slots=True)
+class PolicyPermissions:
+    id: int
+    is_active: bool
+    permissions: frozenset[tuple[str, str]]
+    mask: int = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "mask", compile_permissions(self.permissions))
+
+    @classmethod
+    def from_model(cls, policy: PermissionPolicy) -> "PolicyPermissions":
+        return cls(
+            id=policy.id,
+            is_active=policy.is_active,
+            permissions=frozenset(tuple(x) for x in policy.permissions or []),
+        )
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PolicyPermissions":
+        return cls(
+            id=data["id"],
+            is_active=data["is_active"],
+            permissions=frozenset(tuple(x) for x in data["permissions"]),
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "is_active": self.is_active,
+            "permissions": sorted(self.permissions),
+        }
+
+
+def load_staff_principal(db: Session, user_id: UUID) -> StaffPrincipal | None:
+    # Skip the eager join, the policy is cached on its own
+    user = db.query(StaffUser).filter_by(id=user_id).enable_eagerloads(False).first()
+    return StaffPrincipal.from_model(user) if user else None
+
+
+def load_policy_permissions(db: Session, policy_id: int) -> PolicyPermissions | None:
+    policy = db.query(PermissionPolicy).filter_by(id=policy_id).first()
+    return PolicyPermissions.from_model(policy) if policy else None
+
+
+staff_principals = PrincipalCache(
+    "staff",
+    load=load_staff_principal,
+    dump=asdict,
+    restore=StaffPrincipal.from_dict,
+    ttl=config.auth_token.principal_cache_seconds,
+    negative_ttl=config.auth_token.principal_negative_cache_seconds,
+    maxsize=config.auth_token.principal_cache_size,
+)
+policy_permissions = PrincipalCache(
+    "policy",
+    load=load_policy_permissions,
+    dump=PolicyPermissions.to_dict,
+    restore=PolicyPermissions.from_dict,
+    ttl=config.auth_token.principal_cache_seconds,
+    negative_ttl=config.auth_token.principal_negative_cache_seconds,
+    maxsize=config.auth_token.principal_cache_size,
+)
+
+invalidate_on_commit(StaffUser, lambda user: [staff_principals.key(user.id)])
+invalidate_on_commit(
+    PermissionPolicy, lambda policy: [policy_permissions.key(policy.id)]
+)
+
+
+async def get_active_policy(
+    user: StaffPrincipal, db: Session | None = None
+) -> PolicyPermissions | None:
+    if user.role != "Backoffice" or user.permission_policy_id is None:
+        return None
+    policy = await policy_permissions.get(user.permission_policy_id, db)
+    return policy if policy and policy.is_active else None
+
+
+async def resolve_permissions(user: StaffPrincipal) -> frozenset[tuple[str, str]]:
+    """
+    The `(model, action)` pairs `user` is granted, see `PERMISSIONS`.
+    Inactive users are granted nothing, as by `load_granted_permissions`.
+    """
+    if not user.is_active:
+        return NO_PERMISSIONS
+    if user.is_superuser:
+        return ALL_PERMISSIONS
+    policy = await get_active_policy(user)
+    return policy.permissions if policy else NO_PERMISSIONS
+
+
+async def resolve_permission_mask(user: StaffPrincipal, db: Session | None = None) -> int:
+    """Same as `resolve_permissions`, compiled to permission bits."""
+    if not user.is_active:
+        return 0
+    if user.is_superuser:
+        return ALL_PERMISSIONS_MASK
+    policy = await get_active_policy(user, db)
+    return policy.mask if policy else 0
+
+
+def load_granted_permissions(db: Session, user_id: UUID) -> frozenset[tuple[str, str]]:
+    """What `resolve_permissions` grants, straight from the database, for
+    the permission service. Inactive users are granted nothing."""
+    user = load_staff_principal(db, user_id)
+    if not user or not user.is_active or user.role != "Backoffice":
+        return NO_PERMISSIONS
+    if user.is_superuser:
+        return ALL_PERMISSIONS
+    if user.permission_policy_id is None:
+        return NO_PERMISSIONS
+    policy = load_policy_permissions(db, user.permission_policy_id)
+    return policy.permissions if policy and policy.is_active else NO_PERMISSIONS
+
+
+async def attach_staff_user(request: Request):
+    if request.user.is_authenticated and "Staff" in request.auth.scopes:
+        if request.get("route") and request["route"].dependencies:
+            if not route_requires_authentication(request["route"]):
+                return
+        db = request_session(request)
+        user = await staff_principals.get(request.user.id, db)
+        if not user:
+            raise BadRequest(msg="User not found", exception_type="user.not_found")
+        if not user.is_active:
+            # The token outlives a block, the cached principal does not
+            raise AuthenticationError(
+                exception_type="user.inactive",
+                msg="User is not active",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        request.state.user = user
+        if core_permissions.permission_client is not None:
+            request.state.permission_mask = await get_remote_permission_mask(
+                request, str(user.id)
+            )
+        else:
+            request.state.permission_mask = await resolve_permission_mask(user, db)
+
+
+def dump_json(content) -> bytes:
+    # Same encoding as JSONResponse, so spliced fragments stay valid
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+EMPTY_PERMISSIONS_JSON = b"{}"
+SUPERUSER_PERMISSIONS_JSON = dump_json(get_formatted_permissions(PERMISSIONS))
+login_permissions = TTLCache(maxsize=config.auth_token.principal_cache_size)
+
+
+def get_login_permissions_json(user: StaffUser) -> bytes:
+    """
+    The `permissions` member of the login response, serialized once per
+    version of the user's policy. Entries are keyed by the policy id and
+    checked against its `updated_at`, so an edited policy is rebuilt on the
+    next login without waiting for an invalidation.
+    """
+    if user.role != "Backoffice":
+        return EMPTY_PERMISSIONS_JSON
+    if user.is_superuser:
+        return SUPERUSER_PERMISSIONS_JSON
+    policy = user.permission_policy
+    if policy is None or not policy.is_active:
+        return EMPTY_PERMISSIONS_JSON
+    cached = login_permissions.get(policy.id)
+    if cached is not MISSING and cached[0] == policy.updated_at:
+        return cached[1]
+    payload = dump_json(get_formatted_permissions(policy.permissions or []))
+    login_permissions.set(policy.id, (policy.updated_at, payload))
+    return payload
+
+
+def render_login_response(user: StaffUser) -> Response:
+    """
+    Encode `LoginResponse` for `user` without a validation pass. Both tokens
+    share the claims and the clock read, and the permissions come from
+    `get_login_permissions_json`.
+    """
+    now = datetime.now()
+    claims = user.token_claims()
+    head = dump_json(
+        {
+            "access_token": user.create_token(claims=claims, now=now),
+            "refresh_token": user.create_token(
+                token_type="refresh",
+                expires_delta=now.replace(hour=23, minute=59, second=59) - now,
+                claims=claims,
+                now=now,
+            ),
+            "token_type": "bearer",
+            "user": {
+                "id": str(user.id),
+                "name": user.name,
+                "force_change_password": user.force_change_password,
+            },
+        }
+    )
+    return Response(
+        head[:-1] + b',"permissions":' + get_login_permissions_json(user) + b"}",
+        media_type="application/json",
+    )
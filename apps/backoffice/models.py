@@ -12,7 +12,7 @@ from uuid import UUID
 from core.db import Base
 from core.lib.authentication import (
     generate_random_password,
-    pwd_context,
+    password_hasher,
     create_access_token,
 )
 from core.lib.exceptions import ConflictError
@@ -57,19 +57,23 @@ class StaffUser(Base):
     )
     is_superuser: Mapped[bool] = mapped_column(server_default=false())
 
-    def create_token(self, expires_delta=None, token_type="access"):
+    def token_claims(self) -> dict:
+        return {
+            "sub": self.name,
+            "sid": str(self.id),
+            "is_active": self.is_active,
+            "mdi": self.phone_number,
+            "udi": self.username,
+            "emi": self.username,
+            "scopes": [self.role, "Staff"],
+        }
+
+    def create_token(self, expires_delta=None, token_type="access", claims=None, now=None):
         return create_access_token(
-            data={
-                "sub": self.name,
-                "sid": str(self.id),
-                "is_active": self.is_active,
-                "mdi": self.phone_number,
-                "udi": self.username,
-                "emi": self.username,
-                "scopes": [self.role, "Staff"],
-            },
+            data=claims or self.token_claims(),
             expires_delta=expires_delta,
             token_type=token_type,
+            now=now,
         )
 
     @classmethod
@@ -98,7 +102,7 @@ class StaffUser(Base):
             password_history=password_history,
         )
         password = generate_random_password()
-        hashed_password = pwd_context.hash(password)
+        hashed_password = password_hasher.hash_sync(password)
         obj.password = hashed_password
         obj.password_updated_at = datetime.now()
         obj.password_history = [hashed_password]
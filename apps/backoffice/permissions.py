@@ -1,3 +1,5 @@
+from core.lib.permissions import register_permissions
+
 PERMISSIONS = [
     ('DeviceBindingConfiguration', 'List'),
     ('DeviceBindingConfiguration', 'Create'),
@@ -151,3 +153,5 @@ PERMISSIONS = [
     ('EPayTransaction', 'Update'),
     ('EPayTransaction', 'Delete')
 ]
+
+register_permissions(PERMISSIONS)
@@ -21,20 +21,33 @@ from apps.backoffice.schemas import (
 )
 from apps.backoffice.utils import get_formatted_permissions
 from core.db.session import get_db
-from core.lib.authentication import REFRESH_TOKEN_EXCEPTION, decode_token, get_password_hash, verify_password
+from core.lib.authentication import REFRESH_TOKEN_EXCEPTION, decode_token, password_hasher
 from core.lib.decorators import action
 from core.lib.exceptions import BadRequest
 from core.lib.permissions import AllowAny, IsBackofficeUser
+from core.lib.ratelimit import RateLimit, rate_limit_dependencies
 from core.lib.viewsets import ListViewSetProtocol, ModelViewSet, ViewSetProtocol
 from sqlalchemy.orm import Session
-from .helpers import authenticate_staff_user, generate_password_reset_token
+from .helpers import (
+    authenticate_staff_user,
+    generate_password_reset_token,
+    render_login_response,
+)
 from .utils import dummyemailservice
 
 
 router = APIRouter(prefix="/user")
 
+FORMATTED_PERMISSIONS = get_formatted_permissions(PERMISSIONS)
+
 
-@router.post("/token", response_model=LoginResponse)
+@router.post(
+    "/token",
+    response_model=LoginResponse,
+    dependencies=rate_limit_dependencies(
+        [RateLimit("20/minute", key="ip"), RateLimit("5/minute", key="username")]
+    ),
+)
 async def login_for_access_token(
     form_data: Annotated[
         OAuth2PasswordRequestForm,
@@ -42,7 +55,7 @@ async def login_for_access_token(
     ],
     db: Session = Depends(get_db),
 ):
-    user = authenticate_staff_user(db, form_data.username, form_data.password)
+    user = await authenticate_staff_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=400,
@@ -55,35 +68,11 @@ async def login_for_access_token(
             msg=f"Sorry, your user status is {user.status}. "
                 "Please contact the system administrator to reactivate your account.",
         )
-    if user.password_updated_at:
+    if user.password_updated_at and not user.force_change_password:
         if user.password_updated_at < datetime.now() - timedelta(days=90):
             user.force_change_password = True
             db.commit()
-
-    response = {
-        "access_token": user.create_token(),
-        "refresh_token": user.create_token(
-            token_type="refresh",
-            expires_delta=datetime.now().replace(hour=23, minute=59, second=59) - datetime.now(),
-        ),
-        "token_type": "bearer",
-        "password_expiry_date": user.password_updated_at + timedelta(days=90) if user.password_updated_at else None,
-        "user": {
-            "name": user.name,
-            "id": user.id,
-            "force_change_password": user.force_change_password,
-        },
-    }
-    if user.role == "Backoffice":
-        if user.is_superuser:
-            response["permissions"] = get_formatted_permissions(PERMISSIONS)
-        elif user.permission_policy_id and user.permission_policy.is_active:
-            response["permissions"] = get_formatted_permissions(
-                user.permission_policy.permissions
-            )
-        elif user.permission_policy_id and not user.permission_policy.is_active:
-            response["permissions"] = []
-    return response
+    return render_login_response(user)
 
 
 class PermissionPolicyViewSet(ModelViewSet):
@@ -97,8 +86,7 @@ class PermissionPolicyViewSet(ModelViewSet):
 
     @action(method="GET", detail=False, permission_classes=[AllowAny])
     def default(self):
-        permissions = get_formatted_permissions(PERMISSIONS)
-        return {"msg": "list of all available permissions", "data": permissions}
+        return {"msg": "list of all available permissions", "data": FORMATTED_PERMISSIONS}
 
 
 def get_user(db, username: str):
@@ -203,22 +191,21 @@ class StaffUserViewSet(ModelViewSet):
     @action(detail=False, method="POST")
     def reset_password(self, body: ResetPasswordSchema, request: Request):
         user = get_user(self.db, request.user.username)
-        if not verify_password(body.old_password, user.password):
+        if not password_hasher.verify_sync(body.old_password, user.password):
             raise BadRequest(
                 msg="Password did not match",
                 exception_type="login_error.invalid_password",
             )
         if user.password_history is None:
             user.password_history = [user.password]
-        if any(
-            verify_password(body.new_password, password)
-            for password in user.password_history[-5:]
+        if password_hasher.verify_any_sync(
+            body.new_password, user.password_history[-5:]
         ):
             raise BadRequest(
                 msg="New password cannot be the same as any of the last 5 passwords",
                 exception_type="login_error.invalid_password",
             )
-        user.password = get_password_hash(body.new_password)
+        user.password = password_hasher.hash_sync(body.new_password)
         user.force_change_password = False
         user.password_updated_at = datetime.now()
         user.password_history.append(user.password)
@@ -227,7 +214,12 @@ class StaffUserViewSet(ModelViewSet):
         self.db.commit()
         return {"msg": "Password has been reset successfully."}
 
-    @action(detail=False, method="POST", permission_classes=[AllowAny])
+    @action(
+        detail=False,
+        method="POST",
+        permission_classes=[AllowAny],
+        rate_limit=[RateLimit("10/hour", key="ip"), RateLimit("3/hour", key="username")],
+    )
     def forgot_password(self, body: ForgotPasswordSchema):
         user = get_user(self.db, body.username)
         if not user:
@@ -272,7 +264,12 @@ class StaffUserViewSet(ModelViewSet):
             )
         return {"msg": "Password Reset token is valid."}
 
-    @action(detail=False, method="POST", permission_classes=[AllowAny])
+    @action(
+        detail=False,
+        method="POST",
+        permission_classes=[AllowAny],
+        rate_limit=RateLimit("10/minute", key="ip"),
+    )
     def set_password(self, body: PasswordChangeSchema, request):
         reset_token = (
             self.db.query(PasswordResetToken)
@@ -287,15 +284,14 @@ class StaffUserViewSet(ModelViewSet):
         user = reset_token.staff_user
         if user.password_history is None:
             user.password_history = [user.password]
-        if any(
-            verify_password(body.new_password, password)
-            for password in user.password_history[-5:]
+        if password_hasher.verify_any_sync(
+            body.new_password, user.password_history[-5:]
         ):
             raise BadRequest(
                 msg="New password cannot be the same as any of the last 5 passwords",
                 exception_type="login_error.invalid_password",
             )
-        user.password = get_password_hash(body.new_password)
+        user.password = password_hasher.hash_sync(body.new_password)
         user.force_change_password = False
         user.password_updated_at = datetime.now()
         user.password_history.append(user.password)
@@ -0,0 +1,50 @@
+from dataclasses import asdict, dataclass
+from uuid import UUID
+
+from sqlalchemy.orm import Session
+
+from core.config import config
+from core.lib.cache import invalidate_on_commit
+from core.lib.principals import PrincipalCache
+
+from .models import User
+
+
+@dataclass(frozen=True, slots=True)
+class UserPrincipal:
+    """What authenticated mobile requests need to know about their user."""
+
+    id: UUID
+    name: str
+    email: str | None
+    phone_number: str
+    profile_picture: str | None
+    is_active: bool
+    is_locked: bool
+    status: str | None
+
+    @classmethod
+    def from_model(cls, user: User) -> "UserPrincipal":
+        return cls(**{field: getattr(user, field) for field in cls.__slots__})
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "UserPrincipal":
+        return cls(**{**data, "id": UUID(data["id"])})
+
+
+def load_user_principal(db: Session, user_id: UUID) -> UserPrincipal | None:
+    user = db.query(User).filter_by(id=user_id).first()
+    return UserPrincipal.from_model(user) if user else None
+
+
+user_principals = PrincipalCache(
+    "user",
+    load=load_user_principal,
+    dump=asdict,
+    restore=UserPrincipal.from_dict,
+    ttl=config.auth_token.principal_cache_seconds,
+    negative_ttl=config.auth_token.principal_negative_cache_seconds,
+    maxsize=config.auth_token.principal_cache_size,
+)
+
+invalidate_on_commit(User, lambda user: [user_principals.key(user.id)])
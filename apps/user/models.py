@@ -13,8 +13,7 @@ from typing import Literal
 from core.config import config
 from core.db import Base
 from core.db.session import get_db
-from core.lib.authentication import create_access_token
-from core.redis import cache
+from core.lib.authentication import create_access_token, set_session_token
 
 
 class User(Base):
@@ -65,7 +64,7 @@ class User(Base):
     def refresh_token(self, db: Session):
         self.access_token_id = uuid.uuid4().hex
         db.commit()
-        cache.set(f"jti:{self.id}", self.access_token_id)
+        set_session_token(self.id, self.access_token_id)
         return self.access_token_id
     
     @classmethod
@@ -9,7 +9,8 @@ from sqlalchemy.orm import Session
 from apps.user.schemas.manage import (
     UserListSchema,
     UserLoginSessionRecord,
-    UserReadSchema, )
+    UserReadSchema,
+    UserWriteSchema, )
 from core.db.session import get_db
 from core.lib.decorators import action
 from core.lib.exceptions import BadRequest
@@ -28,7 +29,7 @@ class ManageUserViewSet(ModelViewSet):
     model = User
     read_schema = UserReadSchema
     list_schema = UserListSchema
-    schema = UserReadSchema
+    schema = UserWriteSchema
     permission_classes = [IsBackofficeUser]
 
     def update(self: UpdateViewProtocol, id: int | UUID, body: BaseModel):
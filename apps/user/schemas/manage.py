@@ -2,10 +2,23 @@ from datetime import datetime
 from pydantic import EmailStr
 from uuid import UUID
 
-from core.lib.pydantic import Schema
+from core.lib.pydantic import MediaURL, Schema
 
 
 class UserReadSchema(Schema):
+    id: UUID
+    name: str
+    email: EmailStr
+    password: str | None = None
+    profile_picture: MediaURL | None = None
+    phone_number: str
+    is_active: bool
+    last_login: datetime | None = None
+    is_locked: bool
+
+
+class UserWriteSchema(Schema):
+    # Create and update bodies: `profile_picture` stays the stored key
     id: UUID
     name: str
     email: EmailStr
@@ -21,6 +34,7 @@ class UserListSchema(Schema):
     id: UUID
     name: str
     email: EmailStr | None
+    profile_picture: MediaURL | None = None
     phone_number: str
     is_active: bool
     last_login: datetime | None = None
@@ -0,0 +1,92 @@
+"""
+Rows per second loading login-session history: `session.add_all` plus a
+flush, against `bulk_copy` in CSV and binary, plain and as an upsert.
+Needs `DATABASE_URL` to point at a database it may create a table in;
+the table is dropped at the end.
+
+    python -m benchmarks.bench_bulk_copy
+"""
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import String, create_engine
+from sqlalchemy.orm import DeclarativeBase, Mapped, Session, mapped_column
+
+from core.config import config
+from core.db.bulk import bulk_copy
+from core.db.drivers import engine_url
+
+ROWS = 20000
+
+
+class BenchBase(DeclarativeBase):
+    pass
+
+
+class BenchLoginSession(BenchBase):
+    __tablename__ = "bench_login_session"
+
+    id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default=uuid.uuid4)
+    user_id: Mapped[uuid.UUID | None]
+    phone_number: Mapped[str] = mapped_column(String(20))
+    name: Mapped[str | None]
+    otp_tries: Mapped[int] = mapped_column(server_default="0")
+    login_time: Mapped[datetime | None]
+
+
+def make_rows() -> list[dict]:
+    now = datetime(2024, 1, 1)
+    return [
+        {
+            "id": uuid.uuid4(),
+            "user_id": uuid.uuid4(),
+            "phone_number": f"+95{i:09d}",
+            "name": f"User {i}",
+            "otp_tries": i % 3,
+            "login_time": now + timedelta(seconds=i),
+        }
+        for i in range(ROWS)
+    ]
+
+
+def timed(engine, load) -> float:
+    BenchBase.metadata.drop_all(engine)
+    BenchBase.metadata.create_all(engine)
+    with Session(engine) as db:
+        started_at = time.perf_counter()
+        load(db)
+        db.commit()
+        return time.perf_counter() - started_at
+
+
+def add_all(db: Session, rows: list[dict]):
+    db.add_all(BenchLoginSession(**row) for row in rows)
+    db.flush()
+
+
+def main():
+    rows = make_rows()
+    print(f"{ROWS} rows")
+    for driver in ["psycopg2", "psycopg"]:
+        engine = create_engine(engine_url(config.database_url, driver))
+        cases = {
+            "session.add_all": lambda db: add_all(db, rows),
+            "bulk_copy csv": lambda db: bulk_copy(db, BenchLoginSession, rows),
+            "bulk_copy csv upsert": lambda db: bulk_copy(
+                db, BenchLoginSession, rows, conflict_columns=["id"]
+            ),
+        }
+        if driver == "psycopg":
+            cases["bulk_copy binary"] = lambda db: bulk_copy(
+                db, BenchLoginSession, rows, format="binary"
+            )
+        for name, load in cases.items():
+            elapsed = timed(engine, load)
+            print(f"{driver:<9} {name:<22} {elapsed:7.2f}s {ROWS / elapsed:9.0f} rows/s")
+        BenchBase.metadata.drop_all(engine)
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Latency of a hot lookup by indexed key, the shape of `StaffUser` by
+username or `User` by phone, through psycopg2 and through psycopg 3 with
+and without server-side prepared statements. Every execution is one round
+trip on all three; preparing saves the parse and plan on the server. Needs
+`DATABASE_URL` to point at a database it may create a temp table in.
+
+    python -m benchmarks.bench_db_driver
+"""
+import time
+
+from sqlalchemy import create_engine, text
+
+from core.config import config
+from core.db.drivers import connect_args, engine_url
+
+ROWS = 10000
+ROUNDS = 5000
+LOOKUP = text(
+    "SELECT id, username, full_name, is_active, login_attempt "
+    "FROM bench_staff WHERE username = :username"
+)
+SETUP = [
+    "CREATE TEMP TABLE bench_staff (id serial PRIMARY KEY, username text UNIQUE, "
+    "full_name text, is_active bool, login_attempt int)",
+    f"INSERT INTO bench_staff (username, full_name, is_active, login_attempt) "
+    f"SELECT 'user' || i, 'User ' || i, true, 0 FROM generate_series(1, {ROWS}) i",
+    "ANALYZE bench_staff",
+]
+
+
+def run(name: str, driver: str, prepare_threshold: int | None):
+    engine = create_engine(
+        engine_url(config.database_url, driver),
+        connect_args=connect_args(driver, prepare_threshold, pgbouncer=False),
+    )
+    with engine.connect() as connection:
+        for statement in SETUP:
+            connection.execute(text(statement))
+        # Warm up, past the prepare threshold
+        for i in range(10):
+            connection.execute(LOOKUP, {"username": f"user{i + 1}"}).one()
+        started_at = time.perf_counter()
+        for i in range(ROUNDS):
+            connection.execute(LOOKUP, {"username": f"user{i % ROWS + 1}"}).one()
+        elapsed = time.perf_counter() - started_at
+        prepared = connection.execute(
+            text("SELECT count(*) FROM pg_prepared_statements")
+        ).scalar()
+    engine.dispose()
+    print(
+        f"{name:<28} {elapsed / ROUNDS * 1e6:8.1f} µs/query "
+        f"{ROUNDS / elapsed:9.0f} queries/s  prepared: {prepared}"
+    )
+
+
+def main():
+    print(f"{ROUNDS} lookups over {ROWS} rows, one connection")
+    run("psycopg2", "psycopg2", None)
+    run("psycopg, not prepared", "psycopg", None)
+    run("psycopg, prepared", "psycopg", 5)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Staff logins per second per core: one bcrypt verification plus building the
+login response, before and after precomputing the permission payload and
+the token signing inputs. Runs in-process, so the numbers are for a single
+core; the writes the old path committed on every login are not timed.
+
+    python -m benchmarks.bench_login
+"""
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from jose import jwt
+
+from apps.backoffice.helpers import render_login_response
+from apps.backoffice.models import PermissionPolicy, StaffUser
+from apps.backoffice.permissions import PERMISSIONS
+from apps.backoffice.schemas import LoginResponse
+from apps.backoffice.utils import get_formatted_permissions
+from core.config import config
+from core.lib.authentication import (
+    ALGORITHM,
+    REFRESH_SECRET_KEY,
+    SECRET_KEY,
+    pwd_context,
+)
+
+ROUNDS = 2000
+HASH_ROUNDS = 10
+
+
+def legacy_token(user: StaffUser, expires_delta, secret: str) -> str:
+    now = datetime.now()
+    claims = user.token_claims()
+    claims.update({"exp": now + expires_delta, "iat": datetime.now()})
+    return jwt.encode(claims, secret, algorithm=ALGORITHM)
+
+
+def legacy_response(user: StaffUser):
+    response = {
+        "access_token": legacy_token(
+            user,
+            timedelta(minutes=config.auth_token.bo_access_token_expiry_minutes),
+            SECRET_KEY,
+        ),
+        "refresh_token": legacy_token(
+            user,
+            datetime.now().replace(hour=23, minute=59, second=59) - datetime.now(),
+            REFRESH_SECRET_KEY,
+        ),
+        "token_type": "bearer",
+        "user": {
+            "name": user.name,
+            "id": user.id,
+            "force_change_password": user.force_change_password,
+        },
+        "permissions": get_formatted_permissions(user.permission_policy.permissions),
+    }
+    # What FastAPI does with response_model=LoginResponse
+    content = jsonable_encoder(LoginResponse.parse_obj(response))
+    return JSONResponse(content)
+
+
+def timed(func, *args, rounds=ROUNDS):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func(*args)
+    return (time.perf_counter() - start) / rounds
+
+
+def main():
+    user = StaffUser(
+        id=uuid.uuid4(),
+        role="Backoffice",
+        name="Backoffice Admin",
+        username="boadmin@example.com",
+        phone_number="60984019692",
+        status="Active",
+        is_superuser=False,
+        force_change_password=False,
+        permission_policy=PermissionPolicy(
+            id=1,
+            is_active=True,
+            permissions=[list(x) for x in PERMISSIONS],
+            updated_at=datetime.now(),
+        ),
+    )
+    hashed = pwd_context.hash("TestPW123!@#")
+    verify = timed(pwd_context.verify, "TestPW123!@#", hashed, rounds=HASH_ROUNDS)
+    legacy = timed(legacy_response, user)
+    current = timed(render_login_response, user)
+
+    print(f"bcrypt verify:           {verify * 1e3:.1f} ms")
+    print(f"legacy login response:   {legacy * 1e6:.1f} us")
+    print(f"current login response:  {current * 1e6:.1f} us")
+    print(f"legacy logins/s/core:    {1 / (verify + legacy):.2f}")
+    print(f"current logins/s/core:   {1 / (verify + current):.2f}")
+    print("commits per login:       legacy 1-2, current 0 without state change")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Signing cost of the media URLs of a 100 row user list page.
+
+    python -m benchmarks.bench_media_urls
+"""
+import tempfile
+import time
+import uuid
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from apps.user.schemas.manage import UserListSchema
+from core.lib import media
+from core.lib.media import MediaURLSigner, presign_media
+
+ROWS = 100
+ROUNDS = 200
+
+
+def make_signer():
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    key_file = tempfile.NamedTemporaryFile(suffix=".pem", delete=False)
+    key_file.write(
+        key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+    )
+    key_file.close()
+    return MediaURLSigner(
+        base_url="https://cdn.example.com",
+        key_pair_id="KBENCH",
+        private_key_path=key_file.name,
+    )
+
+
+def make_page():
+    return [
+        {
+            "id": uuid.uuid4(),
+            "name": f"User {i}",
+            "email": None,
+            "profile_picture": f"user/{uuid.uuid4().hex}.png",
+            "phone_number": f"60123{i:06}",
+            "is_active": True,
+            "is_locked": False,
+        }
+        for i in range(ROWS)
+    ]
+
+
+def render(page):
+    presign_media(UserListSchema, page)
+    return [UserListSchema(**row) for row in page]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    media.media_signer = make_signer()
+    page = make_page()
+    unsigned = [dict(row, profile_picture=None) for row in page]
+
+    cold = timed(render, page)
+    warm = min(timed(render, page) for _ in range(ROUNDS))
+    baseline = min(timed(render, unsigned) for _ in range(ROUNDS))
+    print(f"{ROWS} rows, first page view (signing): {cold:.2f} ms")
+    print(f"{ROWS} rows, cached signatures:         {warm:.2f} ms")
+    print(f"{ROWS} rows, without media field:       {baseline:.2f} ms")
+    print(f"signing overhead per cached page:      {warm - baseline:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Per-request middleware overhead of a route on an app mounted inside
+another one, like `/onboarding/manage/...`.
+
+    python -m benchmarks.bench_mounted_apps
+"""
+import asyncio
+import time
+import uuid
+
+from fastapi import FastAPI
+from starlette.middleware.authentication import (
+    AuthenticationMiddleware as BaseAuthMiddleware,
+)
+
+from core.config import config
+from core.lib.authentication import AuthenticationMiddleware, create_access_token
+from core.main import create_app
+
+ROUNDS = 5000
+
+
+def make_app(inner_mounted: bool) -> FastAPI:
+    app = create_app()
+    manage_app = create_app(mounted=inner_mounted)
+
+    @manage_app.get("/ping")
+    def ping():
+        return {}
+
+    app.mount("/manage", manage_app)
+    return app
+
+
+def make_scope(token: str, path: str = "/manage/ping") -> dict:
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [
+            (b"host", b"testserver"),
+            (b"origin", b"http://localhost:3000"),
+            (b"access-token", token.encode()),
+        ],
+        "client": ("127.0.0.1", 1234),
+        "server": ("testserver", 80),
+    }
+
+
+async def request(app: FastAPI, token: str, path: str = "/manage/ping"):
+    messages = [{"type": "http.request", "body": b"", "more_body": False}]
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await asyncio.Event().wait()  # the client never disconnects
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            assert message["status"] == 200, message
+
+    await app(make_scope(token, path), receive, send)
+
+
+async def timed(app: FastAPI, token: str) -> float:
+    await request(app, token)  # build the middleware stack
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        await request(app, token)
+    return (time.perf_counter() - start) * 1e6 / ROUNDS
+
+
+async def main():
+    token = create_access_token(
+        {
+            "udi": "staff@example.com",
+            "sid": str(uuid.uuid4()),
+            "scopes": ["Backoffice", "Staff"],
+        }
+    )
+    reuse_auth = AuthenticationMiddleware.__call__
+    size = config.auth_token.token_cache_size
+    for cache_size in (0, size):
+        config.auth_token.token_cache_size = cache_size
+        # every app authenticates and runs CORS on its own
+        AuthenticationMiddleware.__call__ = BaseAuthMiddleware.__call__
+        stacked = await timed(make_app(inner_mounted=False), token)
+        AuthenticationMiddleware.__call__ = reuse_auth
+        single = await timed(make_app(inner_mounted=True), token)
+        cache = "on" if cache_size else "off"
+        print(f"token cache {cache}, middleware in both apps: {stacked:.1f} us")
+        print(f"token cache {cache}, middleware once:         {single:.1f} us")
+    config.auth_token.token_cache_size = size
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
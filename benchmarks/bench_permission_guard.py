@@ -0,0 +1,72 @@
+"""
+Per-request cost of the permission dependencies of a viewset route, one
+dependency per permission class versus one compiled guard.
+
+    python -m benchmarks.bench_permission_guard
+"""
+import asyncio
+import time
+import uuid
+
+from fastapi import Depends, FastAPI
+
+from benchmarks.bench_mounted_apps import request
+from core.lib import viewsets
+from core.lib.authentication import create_access_token
+from core.lib.decorators import action
+from core.lib.permissions import (
+    IsBackofficeUser,
+    IsStaffUser,
+    permission_dependencies,
+)
+from core.main import create_app
+
+ROUNDS = 5000
+PATH = "/report/ping"
+
+
+class ReportViewSet(viewsets.GenericViewSet):
+    permission_classes = [IsStaffUser, IsBackofficeUser]
+
+    @action(detail=False, method="GET")
+    def ping(self):
+        return {}
+
+
+def make_app(compiled: bool) -> FastAPI:
+    viewsets.permission_dependencies = (
+        permission_dependencies
+        if compiled
+        else lambda classes: [Depends(x) for x in classes]
+    )
+    app = create_app()
+    ReportViewSet.add_to(app)
+    viewsets.permission_dependencies = permission_dependencies
+    return app
+
+
+async def timed(app: FastAPI, token: str) -> float:
+    await request(app, token, PATH)
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        await request(app, token, PATH)
+    return (time.perf_counter() - start) * 1e6 / ROUNDS
+
+
+async def main():
+    token = create_access_token(
+        {
+            "udi": "staff@example.com",
+            "sid": str(uuid.uuid4()),
+            "is_active": True,
+            "scopes": ["Backoffice", "Staff"],
+        }
+    )
+    per_class = await timed(make_app(compiled=False), token)
+    guard = await timed(make_app(compiled=True), token)
+    print(f"one dependency per permission class: {per_class:.1f} us")
+    print(f"one compiled guard:                  {guard:.1f} us")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,76 @@
+"""
+What the `report` settings profile buys a report-style query, totals
+over more groups than fit in the default `work_mem`, and what applying a
+profile costs a transaction that does not need one. Each case runs in sessions whose
+transactions start the way a request's do. Needs `DATABASE_URL` to point
+at a database it may create a temp table in.
+
+    python -m benchmarks.bench_settings_profile
+"""
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+import core.db.session  # noqa: F401, registers the session hook
+from core.config import config
+from core.db.drivers import engine_url
+from core.db.profiles import resolve_profile
+
+ROWS = 300000
+REPORT_ROUNDS = 10
+LOOKUP_ROUNDS = 2000
+SETUP = [
+    "CREATE TEMP TABLE bench_order (id serial PRIMARY KEY, merchant_id int, "
+    "note text, amount numeric, created_at timestamp)",
+    f"INSERT INTO bench_order (merchant_id, note, amount, created_at) "
+    f"SELECT i % 500, md5(i::text) || md5((i * 7)::text), i % 9973, "
+    f"now() - i * interval '1 minute' FROM generate_series(1, {ROWS}) i",
+    "ANALYZE bench_order",
+]
+# Totals per distinct value, counted on the server so the hash aggregate
+# dominates rather than the fetch
+REPORT = text(
+    "SELECT count(*) FROM (SELECT note, sum(amount) AS total "
+    "FROM bench_order GROUP BY note) report"
+)
+LOOKUP = text("SELECT id, amount FROM bench_order WHERE id = :id")
+
+
+def timed(connection, settings: dict, rounds: int, work) -> float:
+    # One session per round, a transaction each, as in a request
+    started_at = time.perf_counter()
+    for i in range(rounds):
+        with Session(bind=connection, join_transaction_mode="create_savepoint") as db:
+            db.info["db_settings"] = settings
+            work(db, i)
+    return (time.perf_counter() - started_at) / rounds
+
+
+def main():
+    engine = create_engine(engine_url(config.database_url, config.database.driver))
+    report = resolve_profile("report")
+    with engine.connect() as connection:
+        for statement in SETUP:
+            connection.execute(text(statement))
+        connection.commit()
+        print(f"Report over {ROWS} rows, {report}")
+        for name, settings in [("defaults", {}), ("report profile", report)]:
+            elapsed = timed(
+                connection, settings, REPORT_ROUNDS, lambda db, i: db.execute(REPORT).scalar()
+            )
+            print(f"  {name:<16} {elapsed * 1000:8.1f} ms/query")
+        print("Primary key lookup, one transaction each")
+        for name, settings in [("defaults", {}), ("report profile", report)]:
+            elapsed = timed(
+                connection,
+                settings,
+                LOOKUP_ROUNDS,
+                lambda db, i: db.execute(LOOKUP, {"id": i + 1}).one(),
+            )
+            print(f"  {name:<16} {elapsed * 1e6:8.1f} µs/transaction")
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -33,16 +33,104 @@ class RedisConfig(BaseSettings):
     port: int = 6379
     db: int = 0
     password: str | None = None
+    max_connections: int = 50  # per worker, for the asyncio client
 
 
 class DatabaseConfig(BaseSettings):
-    # TODO  place db connection string and connection pool setting here
-    pass
+    # DBAPI driver, whatever the scheme of `database_url`
+    driver: Literal["psycopg2", "psycopg"] = "psycopg2"
+    # psycopg only: executions of a statement on a connection before it is
+    # prepared on the server, None never prepares
+    prepare_threshold: int | None = 5
+    # Behind PgBouncer in transaction mode, no server-side prepared statements
+    pgbouncer: bool = False
+    # Per process, see `core/db/session.py`
+    pool_size: int = 10
+    max_overflow: int = 20
+    # Seconds a checkout waits for a free connection before TimeoutError
+    pool_timeout: float = 30
+    # Seconds before a connection is replaced, -1 keeps them forever
+    pool_recycle: int = 1800
+    # always: ping on every checkout, background: ping idle connections
+    # every `liveness_interval` seconds, never: rely on `pool_recycle`
+    pre_ping: Literal["always", "background", "never"] = "background"
+    liveness_interval: float = 30
+    # Connections opened at startup, defaults to `pool_size`
+    prewarm: int | None = None
+    # Read replicas for safe reads, as a JSON list, see `core/db/replicas.py`
+    replica_urls: list[str] = []
+    # Replicas further behind than this many seconds are skipped
+    replica_max_lag: float = 5
+    replica_check_interval: float = 5
+    # How long a client reads from the primary after its own writes
+    sticky_primary_seconds: float = 5
+    # Transient error retries of reads and idempotent work, see `core/db/retry.py`
+    retry_attempts: int = 3
+    retry_base_delay: float = 0.05
+    retry_max_delay: float = 0.5
+    # Seconds after the first run past which no retry starts
+    retry_budget: float = 2
+    # Seconds a request may take, None for no limit, pushed into each
+    # transaction's statement_timeout, see `core/db/deadlines.py`
+    request_timeout: float | None = 30
+    # Named sets of Postgres settings routes can ask for, as JSON, see
+    # `core/db/profiles.py`
+    settings_profiles: dict[str, dict[str, str]] = {
+        "report": {"work_mem": "64MB", "jit": "off"},
+    }
+
+
+class StorageConfig(BaseSettings):
+    root: str = os.path.join(BASE_DIR, "media")
+    bucket: str = "initial-app"
+    chunk_size: int = 1024 * 1024  # 1 MiB read from the spooled upload at a time
+    max_upload_size: int = 20 * 1024 * 1024  # 20 MiB
+
+
+class PasswordHashingConfig(BaseSettings):
+    # bcrypt worker processes per app worker
+    workers: int = 2
+    # Hashing jobs queued or running before new ones are turned away
+    max_pending: int = 32
+
+
+class RateLimitConfig(BaseSettings):
+    enable: bool = True
+    # Use the first X-Forwarded-For address, only behind a trusted proxy
+    trust_forwarded_for: bool = False
+    # Longest a request waits on Redis before the local buckets are used
+    redis_timeout: float = 0.05
+    # How long to stay on the local buckets after Redis failed
+    fallback_seconds: int = 5
+    local_size: int = 100000
+
+
+class PermissionServiceConfig(BaseSettings):
+    # host:port of the permission gRPC service, checked locally when unset
+    target: str | None = None
+    # Channels the client spreads calls over, each is one HTTP/2 connection
+    pool_size: int = 2
+    timeout: float = 0.5
+    # Upper bound for reusing a decision, the server may ask for less
+    cache_seconds: int = 30
+    cache_size: int = 100000
+    # Server side
+    listen: str = "[::]:50051"
+    workers: int = 8
 
 
 class AuthTokenConfig(BaseSettings):
     bo_access_token_expiry_minutes: int = 15  # 15 minutes
     user_access_token_expiry_minutes: int = 1440  # 24 hours
+    # Longest a worker may trust its local copy of the block/session keys
+    session_cache_seconds: int = 30
+    session_cache_size: int = 100000
+    # Verified tokens kept per worker, 0 disables the cache
+    token_cache_size: int = 10000
+    # Account snapshots attached to authenticated requests
+    principal_cache_seconds: int = 60
+    principal_negative_cache_seconds: int = 5
+    principal_cache_size: int = 10000
 
 
 # class EmailConfig(BaseSettings):
@@ -57,6 +145,15 @@ class AuthTokenConfig(BaseSettings):
 #         return self.from_email or self.smtp_username
 
 
+class ConsumerConfig(BaseSettings):
+    # Events applied in one transaction, at most
+    max_batch: int = 500
+    # Seconds the first event of a batch waits for more
+    max_delay: float = 0.05
+    # Events buffered before producers wait, bounds the memory used
+    max_pending: int = 10000
+
+
 class Config(BaseSettings):
     environment: str = "dev"
     service_name: str = "gateway"
@@ -72,7 +169,12 @@ class Config(BaseSettings):
 
     influx: InfluxConfig
     redis: RedisConfig = RedisConfig()
+    database: DatabaseConfig = DatabaseConfig()
     auth_token: AuthTokenConfig = AuthTokenConfig()
+    password_hashing: PasswordHashingConfig = PasswordHashingConfig()
+    rate_limit: RateLimitConfig = RateLimitConfig()
+    permission_service: PermissionServiceConfig = PermissionServiceConfig()
+    consumer: ConsumerConfig = ConsumerConfig()
     # kafka: KafkaConfig | None = None
     # enable_kafka: bool = True
 
@@ -83,6 +185,7 @@ class Config(BaseSettings):
 
     # storage config
     storage_class: Literal["S3Storage", "FileSystemStorage"] = "S3Storage"
+    storage: StorageConfig = StorageConfig()
 
     otp_expiration_seconds: int = 300
     google_application_credentials: str | None = None
@@ -95,6 +198,14 @@ class Config(BaseSettings):
 
     aes_key: str | None = None
     cloudfront_s3_proxy_url: str | None = None
+    cloudfront_key_pair_id: str | None = None
+    cloudfront_private_key_path: str | None = None
+    media_url_expiry_seconds: int = 3600
+    # HMAC key of the links to the download endpoint, defaults to the JWT key
+    media_url_secret: str | None = None
+    # Sent as `X-Internal-Token` to internal routes such as the pool
+    # metrics, unset nobody may call them
+    internal_token: str | None = None
     # TODO Nested complex types like `list` is not supported in v1
     # Issue: https://github.com/pydantic/pydantic-settings/issues/41
     # This has been fixed in v2
@@ -0,0 +1,310 @@
+"""
+Bulk loads through `COPY FROM STDIN`, for imports and backfills that are
+too large for ORM inserts.
+
+    result = bulk_copy(db, UserOTP, rows, conflict_columns=["id"])
+    db.commit()
+"""
+import enum
+import io
+import itertools
+import json
+import logging
+import time
+import uuid
+from datetime import date, datetime, time as dt_time
+from decimal import Decimal
+from typing import Any, Iterable, Iterator, Literal, Sequence
+
+from sqlalchemy import Column, Table
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from sqlalchemy.types import ARRAY, JSON, Enum, TypeDecorator, TypeEngine
+
+log = logging.getLogger("uvicorn")
+
+
+class BulkResult:
+    def __init__(self, table: str, rows: int, seconds: float):
+        self.table = table
+        self.rows = rows
+        self.seconds = seconds
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def __repr__(self):
+        return (
+            f"BulkResult({self.table}: {self.rows} rows in {self.seconds:.2f}s, "
+            f"{self.rows_per_second:.0f} rows/s)"
+        )
+
+
+def _text(value: Any) -> str:
+    """Postgres input text of a scalar value."""
+    if isinstance(value, enum.Enum):
+        value = value.value
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (datetime, date, dt_time)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return "\\x" + bytes(value).hex()
+    if isinstance(value, dict):
+        return json.dumps(value)
+    return str(value)
+
+
+def _array_literal(value: Any) -> str:
+    # {"a","b \"c\""}: elements quoted, NULL unquoted, nested lists for more dimensions
+    if value is None:
+        return "NULL"
+    if isinstance(value, (list, tuple)):
+        return "{" + ",".join(_array_literal(item) for item in value) + "}"
+    return '"' + _text(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _quoted(text: str) -> str:
+    # Unquoted empty is NULL in CSV COPY, so every other value is quoted
+    return '"' + text.replace('"', '""') + '"'
+
+
+def _csv_value(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, (bool, enum.Enum)):
+        return _quoted(_text(value))
+    if isinstance(value, (int, float, Decimal, uuid.UUID)):
+        return str(value)
+    return _quoted(_text(value))
+
+
+def _csv_array(value: Any) -> str:
+    return "" if value is None else _quoted(_array_literal(value))
+
+
+def _csv_json(value: Any) -> str:
+    return "" if value is None else _quoted(json.dumps(value))
+
+
+def _csv_formatter(type_: TypeEngine):
+    """How values of a column of `type_` are written in CSV COPY."""
+    if isinstance(type_, TypeDecorator):
+        type_ = type_.impl_instance
+    if isinstance(type_, ARRAY):
+        return _csv_array
+    if isinstance(type_, JSON):
+        return _csv_json
+    return _csv_value
+
+
+class _CSVStream(io.TextIOBase):
+    """File-like view of CSV lines, for psycopg2's `copy_expert`."""
+
+    def __init__(self, lines: Iterator[str]):
+        self._lines = lines
+        self._buffer = ""
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self._buffer) < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            self._buffer += line
+        if size < 0:
+            size = len(self._buffer)
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+
+class _Rows:
+    """Turns dicts or tuples into tuples in column order, counting them."""
+
+    def __init__(
+        self, table: Table, rows: Iterable[Any], columns: Sequence[str] | None, dialect
+    ):
+        rows = iter(rows)
+        first = next(rows, None)
+        if columns is None:
+            if first is None:
+                columns = []
+            elif isinstance(first, dict):
+                columns = list(first)
+            else:
+                raise ValueError("`columns` is required for tuple rows")
+        unknown = [name for name in columns if name not in table.c]
+        if unknown:
+            raise ValueError(f"Unknown columns for {table.name}: {', '.join(unknown)}")
+
+        # Columns left out that have a Python side default, like uuid4 ids
+        self.defaults = [
+            column
+            for column in table.c
+            if column.name not in columns
+            and column.default is not None
+            and not column.default.is_sequence
+            and not column.default.is_clause_element
+        ]
+        self.columns: list[Column] = [table.c[name] for name in columns] + self.defaults
+        self.names = [column.name for column in self.columns]
+        self.count = 0
+        self._dialect = dialect
+        self._dicts = isinstance(first, dict)
+        self._names = list(columns)
+        self._rows = rows if first is None else itertools.chain([first], rows)
+        self._processors = [self._processor(column, dialect) for column in self.columns]
+        self.csv_formatters = [_csv_formatter(column.type) for column in self.columns]
+
+    def _processor(self, column: Column, dialect) -> Any:
+        if isinstance(column.type, TypeDecorator):
+            return column.type.process_bind_param
+        if isinstance(column.type, Enum):
+            # Members to what the column stores, their names unless configured otherwise
+            process = column.type.bind_processor(dialect)
+            return (lambda value, dialect: process(value)) if process else None
+        return None
+
+    def _default(self, column: Column) -> Any:
+        default = column.default
+        return default.arg(None) if default.is_callable else default.arg
+
+    def __iter__(self) -> Iterator[tuple]:
+        processors = self._processors
+        has_processors = any(processors)
+        for row in self._rows:
+            values = [row[name] for name in self._names] if self._dicts else list(row)
+            if len(values) != len(self._names):
+                raise ValueError(f"Expected {len(self._names)} values, got {len(values)}")
+            values.extend(self._default(column) for column in self.defaults)
+            if has_processors:
+                values = [
+                    process(value, self._dialect) if process else value
+                    for process, value in zip(processors, values)
+                ]
+            self.count += 1
+            yield tuple(values)
+
+
+def _csv_line(formatters: list, row: tuple) -> str:
+    return ",".join([formatter(value) for formatter, value in zip(formatters, row)]) + "\n"
+
+
+def _quote(connection: Connection, name: str) -> str:
+    return connection.dialect.identifier_preparer.quote(name)
+
+
+def _copy(
+    connection: Connection,
+    target: str,
+    rows: _Rows,
+    format: Literal["csv", "binary"],
+    chunk_size: int,
+):
+    columns = ", ".join(_quote(connection, name) for name in rows.names)
+    cursor = connection.connection.cursor()
+    try:
+        if connection.dialect.driver == "psycopg":
+            _copy_psycopg(cursor, target, columns, rows, format, chunk_size)
+        elif format == "binary":
+            raise ValueError("Binary COPY needs the psycopg driver, use format='csv'")
+        else:
+            lines = (_csv_line(rows.csv_formatters, row) for row in rows)
+            cursor.copy_expert(
+                f"COPY {target} ({columns}) FROM STDIN WITH (FORMAT csv)",
+                _CSVStream(lines),
+            )
+    finally:
+        cursor.close()
+
+
+def _copy_psycopg(cursor, target, columns, rows: _Rows, format, chunk_size):
+    if format == "binary":
+        # Column types from the server, so every value is sent as it is stored
+        cursor.execute(
+            "SELECT atttypid FROM pg_attribute WHERE attrelid = %s::regclass "
+            "AND attname = ANY(%s) ORDER BY array_position(%s, attname::text)",
+            (target, rows.names, rows.names),
+        )
+        types = [oid for (oid,) in cursor.fetchall()]
+        with cursor.copy(f"COPY {target} ({columns}) FROM STDIN WITH (FORMAT binary)") as copy:
+            copy.set_types(types)
+            for row in rows:
+                copy.write_row(row)
+        return
+    with cursor.copy(f"COPY {target} ({columns}) FROM STDIN WITH (FORMAT csv)") as copy:
+        batch = []
+        for row in rows:
+            batch.append(_csv_line(rows.csv_formatters, row))
+            if len(batch) >= chunk_size:
+                copy.write("".join(batch))
+                batch = []
+        if batch:
+            copy.write("".join(batch))
+
+
+def bulk_copy(
+    db: Session | Connection,
+    model: Any,
+    rows: Iterable[dict | tuple],
+    columns: Sequence[str] | None = None,
+    format: Literal["csv", "binary"] = "csv",
+    conflict_columns: Sequence[str] | None = None,
+    update_columns: Sequence[str] | None = None,
+    chunk_size: int = 1000,
+) -> BulkResult:
+    """
+    Stream `rows` into `model`'s table with `COPY FROM STDIN`, in the
+    current transaction; the caller commits.
+
+    Rows are dicts, all with the same keys, or tuples in `columns` order.
+    Columns left out get their server default, or their Python side default
+    when the column has one. Binary COPY skips text parsing on the server
+    but needs the psycopg driver.
+
+    With `conflict_columns` the rows go to a temp staging table first and
+    are then merged with `INSERT ... ON CONFLICT`, updating `update_columns`
+    (default: every other copied column) or leaving existing rows alone when
+    that is empty. No ORM events fire, so caches keyed on these rows are not
+    invalidated.
+    """
+    connection = db.connection() if isinstance(db, Session) else db
+    table: Table = getattr(model, "__table__", model)
+    rows = _Rows(table, rows, columns, connection.dialect)
+    name = _quote(connection, table.name)
+    if table.schema:
+        name = f"{_quote(connection, table.schema)}.{name}"
+
+    started_at = time.perf_counter()
+    if not conflict_columns:
+        _copy(connection, name, rows, format, chunk_size)
+    else:
+        staging = _quote(connection, f"bulk_{table.name}_{uuid.uuid4().hex[:8]}")
+        connection.exec_driver_sql(
+            f"CREATE TEMP TABLE {staging} (LIKE {name}) ON COMMIT DROP"
+        )
+        _copy(connection, staging, rows, format, chunk_size)
+        names = ", ".join(_quote(connection, x) for x in rows.names)
+        conflict = ", ".join(_quote(connection, x) for x in conflict_columns)
+        if update_columns is None:
+            update_columns = [x for x in rows.names if x not in conflict_columns]
+        if update_columns:
+            updates = ", ".join(
+                f"{_quote(connection, x)} = EXCLUDED.{_quote(connection, x)}"
+                for x in update_columns
+            )
+            action = f"DO UPDATE SET {updates}"
+        else:
+            action = "DO NOTHING"
+        connection.exec_driver_sql(
+            f"INSERT INTO {name} ({names}) SELECT {names} FROM {staging} "
+            f"ON CONFLICT ({conflict}) {action}"
+        )
+        connection.exec_driver_sql(f"DROP TABLE {staging}")
+
+    result = BulkResult(table.name, rows.count, time.perf_counter() - started_at)
+    log.info(f"Bulk copied {result.rows} rows into {table.name} at {result.rows_per_second:.0f} rows/s")
+    return result
@@ -0,0 +1,191 @@
+"""
+Time budgets for requests. Every request gets `request_timeout` seconds,
+counted from when its body has been received, so a slow upload does not
+use up the time its queries have; a route may set its own budget with the
+viewset's `timeout` attribute or `@action(timeout=...)`, and a client may
+ask for less with the `X-Request-Timeout` header. Each transaction of the
+request's session starts with a local `statement_timeout` set to what is
+left of the budget, so Postgres stops a query the client no longer waits
+for. A query that runs out of time, or a transaction that would start
+after the deadline, ends the request with `TimeoutException`.
+
+When the client disconnects, the query the request is running is
+cancelled as well.
+"""
+import asyncio
+import logging
+import time
+
+from fastapi import Depends, Request
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import SessionTransaction
+from starlette.concurrency import run_in_threadpool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core.config import config
+from core.db.drivers import sqlstate
+from core.lib.exceptions import TimeoutException
+
+log = logging.getLogger("uvicorn")
+
+TIMEOUT_HEADER = b"x-request-timeout"
+QUERY_CANCELED = "57014"
+
+
+def requested_timeout(scope: Scope) -> float | None:
+    """Seconds the client asked for in `X-Request-Timeout`, if valid."""
+    for name, value in scope.get("headers", []):
+        if name == TIMEOUT_HEADER:
+            try:
+                seconds = float(value)
+            except ValueError:
+                return None
+            return seconds if seconds > 0 else None
+    return None
+
+
+def set_deadline(scope: Scope, seconds: float | None):
+    """
+    Budget the request `seconds` from its start, or less when the client
+    asked for less. None with no client timeout removes the deadline.
+    """
+    state = scope.setdefault("state", {})
+    budgets = [s for s in (seconds, requested_timeout(scope)) if s is not None]
+    if not budgets:
+        state.pop("deadline", None)
+        return
+    started_at = state.setdefault("started_at", time.monotonic())
+    state["deadline"] = started_at + min(budgets)
+
+
+def restart_budget(state: dict):
+    """Count the budget from now, once the request body has been received."""
+    now = time.monotonic()
+    if state.get("deadline") is not None:
+        state["deadline"] += now - state["started_at"]
+    state["started_at"] = now
+
+
+def remaining(state: dict) -> float | None:
+    deadline = state.get("deadline")
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def is_query_canceled(error: BaseException) -> bool:
+    """Postgres stopped the query: statement timeout or cancel request."""
+    return sqlstate(getattr(error, "orig", error)) == QUERY_CANCELED
+
+
+def deadline_exceeded() -> TimeoutException:
+    return TimeoutException("request_timeout", msg="Request took too long.")
+
+
+class Deadline:
+    """Route dependency giving the request its own budget of `seconds`."""
+
+    def __init__(self, seconds: float | None):
+        self.seconds = seconds
+
+    async def __call__(self, request: Request):
+        # Transactions begun before this, by earlier dependencies, keep theirs
+        set_deadline(request.scope, self.seconds)
+
+
+def deadline_dependencies(seconds: float | None) -> list:
+    return [] if seconds is None else [Depends(Deadline(seconds))]
+
+
+def deadline_settings(
+    state: dict, transaction: SessionTransaction, connection: Connection
+) -> dict[str, str]:
+    """
+    `statement_timeout` of a transaction of the request, what is left of its
+    budget, applied with the rest of its settings by the session hook in
+    `core/db/session.py`. Raises once the deadline has passed.
+    """
+    # For `cancel_query` when the client goes away
+    state["db_transaction"] = (transaction, connection)
+    left = remaining(state)
+    if left is None:
+        return {}
+    if left <= 0:
+        raise deadline_exceeded()
+    return {"statement_timeout": str(max(1, int(left * 1000)))}
+
+
+def cancel_query(state: dict) -> bool:
+    """
+    Cancel the statement running in the request's transaction, if it is
+    still open. Safe from another thread, as the cancel goes out over its
+    own connection.
+    """
+    transaction, connection = state.get("db_transaction", (None, None))
+    if transaction is None or not transaction.is_active or connection.closed:
+        return False
+    dbapi_connection = connection.connection.dbapi_connection
+    # psycopg 3.2 deprecates cancel in favour of cancel_safe
+    cancel = getattr(dbapi_connection, "cancel_safe", None) or dbapi_connection.cancel
+    try:
+        cancel()
+    except Exception as exc:
+        log.warning(f"Could not cancel the query of a disconnected request: {exc}")
+        return False
+    return True
+
+
+class DeadlineMiddleware:
+    """
+    Starts each request's deadline and watches for the client going away
+    while the request runs, to cancel the query it is waiting on.
+    """
+
+    def __init__(self, app: ASGIApp, timeout: float | None = config.database.request_timeout):
+        self.app = app
+        self.timeout = timeout
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        state = scope.setdefault("state", {})
+        state["started_at"] = time.monotonic()
+        set_deadline(scope, self.timeout)
+
+        # One message ahead of the app at most, so a body the app streams is
+        # never buffered here
+        messages: asyncio.Queue = asyncio.Queue(maxsize=1)
+        finished = False
+
+        async def watch():
+            # Reads ahead of the app, which gets the same messages in order
+            while True:
+                message = await receive()
+                if message["type"] == "http.request" and not message.get("more_body"):
+                    restart_budget(state)
+                if message["type"] == "http.disconnect":
+                    # Before queueing it, the app may never read its body
+                    if not finished and await run_in_threadpool(cancel_query, state):
+                        log.info(f"Cancelled the query of disconnected request {scope['path']}")
+                    await messages.put(message)
+                    return
+                await messages.put(message)
+
+        async def watched_receive() -> Message:
+            message = await messages.get()
+            if message["type"] == "http.disconnect":
+                # Every later call sees the disconnect too
+                messages.put_nowait(message)
+            return message
+
+        async def watched_send(message: Message):
+            nonlocal finished
+            if message["type"] == "http.response.body" and not message.get("more_body"):
+                finished = True
+            await send(message)
+
+        watcher = asyncio.create_task(watch())
+        try:
+            await self.app(scope, watched_receive, watched_send)
+        finally:
+            finished = True
+            watcher.cancel()
@@ -0,0 +1,51 @@
+from sqlalchemy.engine import make_url
+
+# SQLAlchemy dialects for `DatabaseConfig.driver`
+DIALECTS = {
+    "psycopg2": "postgresql+psycopg2",
+    "psycopg": "postgresql+psycopg",
+}
+
+UNIQUE_VIOLATION = "23505"
+FOREIGN_KEY_VIOLATION = "23503"
+
+
+def engine_url(url: str, driver: str) -> str:
+    """`url` with its scheme pointing at `driver`, e.g. `postgresql://...`
+    becomes `postgresql+psycopg://...`."""
+    url = make_url(url)
+    if url.get_backend_name() != "postgresql":
+        return url.render_as_string(hide_password=False)
+    return url.set(drivername=DIALECTS[driver]).render_as_string(hide_password=False)
+
+
+def connect_args(driver: str, prepare_threshold: int | None, pgbouncer: bool) -> dict:
+    """
+    DBAPI connect arguments for `driver`. psycopg 3 prepares a statement on
+    the server once it ran `prepare_threshold` times on a connection, so hot
+    queries skip parsing and planning. Behind PgBouncer in transaction mode
+    the next transaction may run on another server connection that lacks
+    the statement, so `pgbouncer` turns preparing off.
+    """
+    if driver != "psycopg":
+        return {}
+    return {"prepare_threshold": None if pgbouncer else prepare_threshold}
+
+
+def sqlstate(error: Exception) -> str | None:
+    """The SQLSTATE of a psycopg2 or psycopg 3 error."""
+    return getattr(error, "sqlstate", None) or getattr(error, "pgcode", None)
+
+
+def error_message(error: Exception) -> str:
+    """Server message of a psycopg2 or psycopg 3 error, with the DETAIL line."""
+    pgerror = getattr(error, "pgerror", None)
+    if pgerror:
+        return pgerror
+    diag = getattr(error, "diag", None)
+    if diag is not None and diag.message_primary:
+        message = diag.message_primary
+        if diag.message_detail:
+            message += f"\nDETAIL:  {diag.message_detail}"
+        return message
+    return str(error)
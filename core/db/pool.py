@@ -0,0 +1,166 @@
+import logging
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+from core.influx import Point, ilog
+
+log = logging.getLogger("uvicorn")
+
+
+class PoolStats:
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, waited: float, timed_out: bool = False):
+        with self._lock:
+            self.checkouts += 1
+            self.timeouts += timed_out
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool that records how long each checkout waited for a connection,
+    including opening one and the pre-ping when those happen.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def connect(self):
+        started_at = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.stats.record(time.perf_counter() - started_at, timed_out=True)
+            raise
+        self.stats.record(time.perf_counter() - started_at)
+        return connection
+
+    def connect_unrecorded(self):
+        """Checkout for pool maintenance, left out of the stats."""
+        return super().connect()
+
+    def recreate(self) -> "InstrumentedQueuePool":
+        pool = super().recreate()
+        # Counters are per process, not per pool generation
+        pool.stats = self.stats
+        return pool
+
+    def snapshot(self, reset_max: bool = False) -> dict:
+        stats = self.stats
+        with stats._lock:
+            checkouts, wait_seconds = stats.checkouts, stats.wait_seconds
+            max_wait = stats.max_wait_seconds
+            timeouts = stats.timeouts
+            if reset_max:
+                stats.max_wait_seconds = 0.0
+        return {
+            "size": self.size(),
+            "max_overflow": self._max_overflow,
+            "idle": self.checkedin(),
+            "in_use": self.checkedout(),
+            "overflow": max(0, self.overflow()),
+            "checkouts": checkouts,
+            "timeouts": timeouts,
+            "wait_avg_ms": wait_seconds / checkouts * 1000 if checkouts else 0.0,
+            "wait_max_ms": max_wait * 1000,
+        }
+
+
+def _maintenance_connect(pool):
+    return getattr(pool, "connect_unrecorded", pool.connect)()
+
+
+def prewarm_pool(engine: Engine, count: int) -> int:
+    """Open up to `count` connections now rather than on the first requests."""
+    connections = []
+    try:
+        for _ in range(count):
+            connections.append(_maintenance_connect(engine.pool))
+    except Exception as error:
+        log.warning(f"Could not prewarm the database pool: {error}")
+    finally:
+        for connection in connections:
+            connection.close()
+    return len(connections)
+
+
+class PoolLivenessChecker:
+    """
+    Pings the idle connections of `engine`'s pool every `interval` seconds
+    from a daemon thread and drops the dead ones, instead of pinging on
+    every checkout. Also reports the pool metrics to influx.
+    """
+
+    def __init__(self, engine: Engine, interval: float):
+        self.engine = engine
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="db-pool-liveness", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.check()
+                self.report()
+            except Exception as error:
+                log.warning(f"Database pool liveness check failed: {error}")
+
+    def check(self) -> int:
+        """
+        Ping the idle connections, return how many were dead. One at a time,
+        each goes back before the next is taken, so requests never wait on
+        the check or spill into overflow. The pool hands out the connection
+        idle the longest, so a pass reaches each idle one once.
+        """
+        pool = self.engine.pool
+        dialect = self.engine.dialect
+        dead = 0
+        for _ in range(pool.checkedin()):
+            if not pool.checkedin():
+                break
+            connection = _maintenance_connect(pool)
+            try:
+                dialect.do_ping(connection.dbapi_connection)
+            except Exception as error:
+                if not dialect.is_disconnect(error, connection.dbapi_connection, None):
+                    raise
+                connection.invalidate(error)
+                dead += 1
+            finally:
+                connection.close()
+        if dead:
+            log.warning(f"Dropped {dead} dead database connections")
+        return dead
+
+    def report(self):
+        pool = self.engine.pool
+        if not isinstance(pool, InstrumentedQueuePool):
+            return
+        point = Point("db_pool")
+        for field, value in pool.snapshot(reset_max=True).items():
+            point = point.field(field, value)
+        ilog(point)
@@ -0,0 +1,53 @@
+"""
+Postgres settings for routes that need something other than the server
+defaults, e.g. report and export queries that sort or hash more than
+`work_mem` and gain nothing from JIT. A profile is a name in
+`DATABASE__SETTINGS_PROFILES`, or a dict of settings, given to a viewset
+as `settings_profile` or to an action as `@action(settings_profile=...)`.
+Each transaction of the request's session starts with the profile's
+settings applied as `SET LOCAL`, so they end with the transaction and the
+pooled connection goes back with the defaults.
+
+Sessions outside a request can set `session.info["db_settings"]`.
+"""
+from fastapi import Depends, Request
+from sqlalchemy.orm import Session
+
+from core.config import config
+
+Profile = str | dict[str, str]
+
+
+def resolve_profile(profile: Profile) -> dict[str, str]:
+    if isinstance(profile, str):
+        try:
+            profile = config.database.settings_profiles[profile]
+        except KeyError:
+            raise ValueError(f"Unknown settings profile {profile!r}") from None
+    if "statement_timeout" in profile:
+        # It would undo the request's deadline, see `core/db/deadlines.py`
+        raise ValueError("Set statement_timeout through the route's timeout")
+    return {name: str(value) for name, value in profile.items()}
+
+
+class SettingsProfile:
+    """Route dependency applying `profile` to the request's transactions."""
+
+    def __init__(self, profile: Profile):
+        self.settings = resolve_profile(profile)
+
+    async def __call__(self, request: Request):
+        request.scope.setdefault("state", {})["db_settings"] = self.settings
+
+
+def profile_dependencies(profile: Profile | None) -> list:
+    return [] if not profile else [Depends(SettingsProfile(profile))]
+
+
+def profile_settings(session: Session) -> dict[str, str]:
+    """
+    The settings `session`'s transactions start with, applied by the session
+    hook in `core/db/session.py` together with the request's deadline.
+    """
+    state = session.info.get("request_state") or {}
+    return {**state.get("db_settings", {}), **session.info.get("db_settings", {})}
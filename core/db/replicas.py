@@ -0,0 +1,140 @@
+import itertools
+import logging
+import threading
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import ORMExecuteState, Session
+from starlette.requests import HTTPConnection
+
+from core.lib.cache import TTLCache, add_pending_invalidations, invalidation_bus
+
+log = logging.getLogger("uvicorn")
+
+STICKY_PREFIX = "db:primary:"
+# Seconds the replica is behind, 0 when it has replayed everything it
+# received or isn't a replica at all
+LAG_QUERY = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() "
+    "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) "
+    "END"
+)
+
+
+def client_key(conn: HTTPConnection) -> str | None:
+    """Who a request comes from, for read-your-writes."""
+    user = conn.scope.get("user")
+    if getattr(user, "is_authenticated", False) and getattr(user, "id", None):
+        return f"user:{user.id}"
+    return f"ip:{conn.client.host}" if conn.client else None
+
+
+class ReplicaRouter:
+    """
+    Picks a read replica for safe reads.
+
+    Each replica has its own pool. A daemon thread measures replication lag
+    every `check_interval` seconds and only replicas that answer within
+    `max_lag` seconds are used; with none left reads go to the primary.
+    After a client's transaction writes, its reads stay on the primary for
+    `sticky_seconds`. The mark is published on the invalidation bus with
+    the transaction's other keys, so every worker honours it.
+    """
+
+    def __init__(
+        self,
+        urls: list[str],
+        max_lag: float,
+        check_interval: float,
+        sticky_seconds: float,
+        **engine_kwargs,
+    ):
+        self.engines = [create_engine(url, **engine_kwargs) for url in urls]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.healthy: list[Engine] = []
+        self.lag: dict[str, float | None] = {}
+        self.sticky = TTLCache(maxsize=100000, ttl=sticky_seconds)
+        self._next = itertools.count()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+        if self.engines:
+            invalidation_bus.subscribe(STICKY_PREFIX, self._on_write)
+            event.listen(Session, "after_flush", self._after_flush)
+            event.listen(Session, "do_orm_execute", self._on_execute)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.engines)
+
+    def pick(self, client: str | None = None) -> Engine | None:
+        """A healthy replica, or None when the read must go to the primary."""
+        healthy = self.healthy
+        if not healthy or (client and client in self.sticky):
+            return None
+        return healthy[next(self._next) % len(healthy)]
+
+    def check(self):
+        healthy = []
+        for engine in self.engines:
+            name = engine.url.render_as_string(hide_password=True)
+            try:
+                with engine.connect() as connection:
+                    lag = float(connection.execute(LAG_QUERY).scalar())
+            except Exception as error:
+                if self.lag.get(name, 0) is not None:
+                    log.warning(f"Read replica {name} is down: {error}")
+                lag = None
+            self.lag[name] = lag
+            if lag is not None and lag <= self.max_lag:
+                healthy.append(engine)
+        self.healthy = healthy
+
+    def start(self):
+        if not self.engines or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="db-replica-monitor", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self.healthy = []
+
+    def close(self):
+        """Stop and release the replicas, for routers made outside startup."""
+        self.stop()
+        if self.engines:
+            invalidation_bus.unsubscribe(STICKY_PREFIX, self._on_write)
+            event.remove(Session, "after_flush", self._after_flush)
+            event.remove(Session, "do_orm_execute", self._on_execute)
+        for engine in self.engines:
+            engine.dispose()
+
+    def _run(self):
+        while True:
+            try:
+                self.check()
+            except Exception as error:
+                log.warning(f"Read replica check failed: {error}")
+            if self._stopped.wait(self.check_interval):
+                return
+
+    def _on_write(self, key: str | None):
+        if key is not None:
+            self.sticky.set(key[len(STICKY_PREFIX):], True)
+
+    def _mark_write(self, session: Session):
+        client = session.info.get("client")
+        if client:
+            add_pending_invalidations(session, [STICKY_PREFIX + client])
+
+    def _after_flush(self, session: Session, flush_context):
+        self._mark_write(session)
+
+    def _on_execute(self, state: ORMExecuteState):
+        if state.is_insert or state.is_update or state.is_delete:
+            self._mark_write(state.session)
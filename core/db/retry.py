@@ -0,0 +1,150 @@
+"""
+Replays read-only or idempotent units of work that failed on a transient
+database error: a failover dropping connections, a serialization failure
+or a deadlock. Anything that is not safe to run twice must not use it.
+
+    @action(method="GET", detail=True)
+    @retry_transient()
+    def summary(self, id: int):
+        ...
+"""
+import asyncio
+import functools
+import inspect
+import logging
+import random
+import time
+from typing import Any, Callable
+
+from sqlalchemy import exc
+from sqlalchemy.orm import Session
+
+from core.config import config
+from core.db.drivers import sqlstate
+
+log = logging.getLogger("uvicorn")
+
+TRANSIENT_SQLSTATES = {
+    "40001",  # serialization_failure
+    "40P01",  # deadlock_detected
+    "53300",  # too_many_connections
+    "57P01",  # admin_shutdown
+    "57P02",  # crash_shutdown
+    "57P03",  # cannot_connect_now
+    "08000",  # connection_exception
+    "08001",  # sqlclient_unable_to_establish_sqlconnection
+    "08003",  # connection_does_not_exist
+    "08004",  # sqlserver_rejected_establishment_of_sqlconnection
+    "08006",  # connection_failure
+}
+
+
+def is_transient(error: BaseException) -> bool:
+    if not isinstance(error, exc.DBAPIError):
+        return False
+    if error.connection_invalidated:
+        return True
+    return sqlstate(error.orig) in TRANSIENT_SQLSTATES
+
+
+class RetryPolicy:
+    """
+    Up to `attempts` runs, waiting a random time between 0 and
+    `base_delay * 2 ** retry` (capped at `max_delay`) in between, so
+    retries from many requests spread out. No retry starts once `budget`
+    seconds have passed since the first run.
+    """
+
+    def __init__(
+        self,
+        attempts: int = config.database.retry_attempts,
+        base_delay: float = config.database.retry_base_delay,
+        max_delay: float = config.database.retry_max_delay,
+        budget: float = config.database.retry_budget,
+    ):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+
+    def delay(self, retry: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**retry))
+
+    def _next_delay(self, error: BaseException, attempt: int, started_at: float) -> float | None:
+        """Seconds to wait before the next run, None to give up."""
+        if not is_transient(error) or attempt + 1 >= self.attempts:
+            return None
+        delay = self.delay(attempt)
+        if time.monotonic() - started_at + delay > self.budget:
+            return None
+        log.warning(f"Retrying after transient database error in {delay * 1000:.0f}ms: {error}")
+        return delay
+
+    def call(self, func: Callable[[], Any], session: Session | None = None) -> Any:
+        """Run `func()`, rolling `session` back before each retry."""
+        started_at = time.monotonic()
+        for attempt in range(self.attempts):
+            try:
+                return func()
+            except exc.DBAPIError as error:
+                delay = self._next_delay(error, attempt, started_at)
+                if delay is None:
+                    raise
+                if session is not None:
+                    # The failed transaction, or the dead connection, must go
+                    session.rollback()
+                time.sleep(delay)
+
+    async def acall(self, func: Callable[[], Any], session: Session | None = None) -> Any:
+        started_at = time.monotonic()
+        for attempt in range(self.attempts):
+            try:
+                return await func()
+            except exc.DBAPIError as error:
+                delay = self._next_delay(error, attempt, started_at)
+                if delay is None:
+                    raise
+                if session is not None:
+                    session.rollback()
+                await asyncio.sleep(delay)
+
+
+default_retry_policy = RetryPolicy()
+
+
+def _find_session(args: tuple, kwargs: dict) -> Session | None:
+    # A `db` argument, or the `db` of the viewset the method is bound to
+    db = kwargs.get("db")
+    if db is None and args:
+        db = getattr(args[0], "db", None)
+    return db if isinstance(db, Session) else None
+
+
+def retry_transient(policy: RetryPolicy | None = None) -> Callable:
+    """
+    Retry the decorated function, sync or async, with `policy` when it
+    fails on a transient database error. Only for read-only or idempotent
+    functions. The session in a `db` argument or on `self.db` is rolled back
+    before each retry.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                return await (policy or default_retry_policy).acall(
+                    functools.partial(func, *args, **kwargs), _find_session(args, kwargs)
+                )
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return (policy or default_retry_policy).call(
+                functools.partial(func, *args, **kwargs), _find_session(args, kwargs)
+            )
+
+        return wrapper
+
+    return decorator
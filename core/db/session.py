@@ -1,15 +1,83 @@
 import logging
 from contextlib import contextmanager
-from sqlalchemy import create_engine
-from sqlalchemy.orm import Session
+from fastapi import Depends
+from sqlalchemy import create_engine, event, func, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session, SessionTransaction
 from sqlalchemy.orm import sessionmaker
+from starlette.requests import HTTPConnection, Request
+from starlette.types import ASGIApp, Receive, Scope, Send
 
 from core.config import config
+from core.db.deadlines import deadline_settings
+from core.db.drivers import connect_args, engine_url
+from core.db.pool import InstrumentedQueuePool, PoolLivenessChecker, prewarm_pool
+from core.db.profiles import profile_settings
+from core.db.replicas import ReplicaRouter, client_key
 
 log = logging.getLogger("uvicorn")
 
-engine = create_engine(config.database_url, pool_size=10, max_overflow=20, pool_pre_ping=True)
+pool_options = dict(
+    poolclass=InstrumentedQueuePool,
+    pool_size=config.database.pool_size,
+    max_overflow=config.database.max_overflow,
+    pool_timeout=config.database.pool_timeout,
+    pool_recycle=config.database.pool_recycle,
+    pool_pre_ping=config.database.pre_ping == "always",
+    connect_args=connect_args(
+        config.database.driver,
+        config.database.prepare_threshold,
+        config.database.pgbouncer,
+    ),
+)
+engine = create_engine(
+    engine_url(config.database_url, config.database.driver), **pool_options
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+pool_liveness = PoolLivenessChecker(engine, config.database.liveness_interval)
+
+replica_router = ReplicaRouter(
+    [engine_url(url, config.database.driver) for url in config.database.replica_urls],
+    max_lag=config.database.replica_max_lag,
+    check_interval=config.database.replica_check_interval,
+    sticky_seconds=config.database.sticky_primary_seconds,
+    **pool_options,
+)
+ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False)
+
+
+def start_pool_maintenance():
+    """Prewarm the pools and start the background liveness and replica
+    checks, once per process at startup."""
+    prewarm = config.database.prewarm
+    prewarm = config.database.pool_size if prewarm is None else prewarm
+    count = prewarm_pool(engine, prewarm)
+    for replica in replica_router.engines:
+        count += prewarm_pool(replica, prewarm)
+    log.info(f"Prewarmed {count} database connections")
+    if config.database.pre_ping == "background":
+        pool_liveness.start()
+    replica_router.start()
+
+
+def stop_pool_maintenance():
+    pool_liveness.stop()
+    replica_router.stop()
+
+
+@event.listens_for(Session, "after_begin")
+def _start_transaction(session: Session, transaction: SessionTransaction, connection: Connection):
+    # The settings profile and the deadline, see `core/db/profiles.py` and
+    # `core/db/deadlines.py`, in one round trip with the values as bind
+    # parameters
+    settings = profile_settings(session)
+    state = session.info.get("request_state")
+    if state is not None:
+        settings.update(deadline_settings(state, transaction, connection))
+    if settings:
+        connection.execute(
+            select(*[func.set_config(name, value, True) for name, value in settings.items()])
+        )
 
 
 @contextmanager
@@ -24,8 +92,72 @@ def get_db_context():
         session.close()
 
 
-def get_db():
-    session = SessionLocal()
+def request_session(conn: HTTPConnection) -> Session:
+    """
+    The session of the request, shared by every dependency, the endpoint
+    and the error handlers. Created on first use; like every session it only
+    checks out a connection for its first statement.
+    """
+    state = conn.scope.setdefault("state", {})
+    session = state.get("db")
+    if session is None:
+        session = state["db"] = SessionLocal()
+        # Deadlines and cancellation, see `core/db/deadlines.py`
+        session.info["request_state"] = state
+        if replica_router.enabled:
+            # Keeps the client's reads on the primary after it writes
+            session.info["client"] = client_key(conn)
+    return session
+
+
+def close_request_session(scope: Scope):
+    session = scope.get("state", {}).pop("db", None)
+    if session is not None:
+        session.close()
+
+
+class RequestSessionMiddleware:
+    """Closes the request's session, for requests whose endpoint never
+    asked for `get_db` but whose dependencies used `request_session`."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if scope["type"] == "http":
+                close_request_session(scope)
+
+
+def get_db(request: Request = None):
+    if request is None:
+        # Outside a request, e.g. the debug toolbar
+        session = SessionLocal()
+        try:
+            yield session
+        finally:
+            session.close()
+        return
+    try:
+        yield request_session(request)
+    finally:
+        close_request_session(request.scope)
+
+
+def get_read_db(request: Request, db: Session = Depends(get_db)):
+    """
+    Session for safe reads: a healthy read replica when there is one, else
+    the primary session from `get_db`. Only use it for requests that never
+    write.
+    """
+    replica = replica_router.pick(client_key(request)) if replica_router.enabled else None
+    if replica is None:
+        yield db
+        return
+    session = ReplicaSessionLocal(bind=replica)
+    session.info["request_state"] = request.scope.setdefault("state", {})
     try:
         yield session
     finally:
@@ -1,8 +1,12 @@
 import logging
 from datetime import datetime
-from fastapi import FastAPI, Request
+from fastapi import Depends, FastAPI, Request
+from starlette.concurrency import run_in_threadpool
 
 from core.config import config
+from core.db.session import engine, start_pool_maintenance, stop_pool_maintenance
+from core.lib.authentication import password_hasher
+from core.lib.permissions import require_internal_token
 from services.onboarding.routes import app as onboarding_app
 from services.authentication.routes import app as authentication_app
 
@@ -11,6 +15,18 @@ logger = logging.getLogger("uvicorn")
 
 app = FastAPI(debug=config.debug)
 
+
+@app.on_event("startup")
+async def startup():
+    await run_in_threadpool(start_pool_maintenance)
+    password_hasher.start()
+
+
+@app.on_event("shutdown")
+def shutdown():
+    stop_pool_maintenance()
+    password_hasher.shutdown()
+
 app.mount("/authentication", authentication_app)
 # app.mount("/notification", notification_app)
 app.mount("/onboarding", onboarding_app)
@@ -42,3 +58,8 @@ def log_debug(request: Request):
         "base_url": request.base_url,
         "current_time": datetime.now(),
     }
+
+
+@app.get("/metrics/db-pool", dependencies=[Depends(require_internal_token)])
+def db_pool_metrics():
+    return engine.pool.snapshot()
@@ -1,12 +1,19 @@
+import asyncio
+import hashlib
+import multiprocessing
 import secrets
 import string
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, as_completed
 from datetime import datetime, timedelta
-from typing import Literal
+from functools import partial
+from typing import Callable, Iterable, Literal
 from uuid import UUID
 
 from fastapi import HTTPException
 from fastapi.responses import JSONResponse
-from jose import jwt
+from jose import jwk, jwt
 from passlib.context import CryptContext
 from starlette.authentication import (
     AuthenticationBackend,
@@ -19,10 +26,13 @@ from starlette.middleware.authentication import (
 )
 from starlette.requests import HTTPConnection
 from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
 
 from core.config import config
-from core.lib.exceptions import AuthenticationError, BadRequest
-from core.redis import cache
+from core.influx import Point, ilog
+from core.lib.cache import MISSING, TTLCache, invalidation_bus
+from core.lib.exceptions import AuthenticationError, BadRequest, ServiceUnavailable
+from core.redis import async_cache, cache
 
 AUTHENTICATION_EXCEPTION = AuthenticationError(
     exception_type="user.not_authenticated",
@@ -42,6 +52,11 @@ REFRESH_TOKEN_EXCEPTION = BadRequest(
 SECRET_KEY = "bc23abe266edfec1dd3a062b3c242b7b949471aa74beac952b5a882efd478918"
 REFRESH_SECRET_KEY = "ccf53bf7778a1faeaaf3aeac0b22eb870c54c128c7e3ce9bd097736735fb4823"
 ALGORITHM = "HS256"
+# Prepared once, jose would otherwise rebuild the HMAC key for every token
+SIGNING_KEYS = {
+    "access": jwk.construct(SECRET_KEY, ALGORITHM),
+    "refresh": jwk.construct(REFRESH_SECRET_KEY, ALGORITHM),
+}
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -54,8 +69,169 @@ def get_password_hash(password):
     return pwd_context.hash(password)
 
 
+def _run_hasher(method: str, *args):
+    # Runs in a worker process, also reports when the job left the queue
+    started_at = time.time()
+    return getattr(pwd_context, method)(*args), started_at
+
+
+class PasswordHasher:
+    """
+    bcrypt off the event loop, in a bounded pool of worker processes.
+
+    `verify`, `hash` and `verify_any` are for `async def` code, their `_sync`
+    twins for code already running in the threadpool. The `_sync` twins only
+    use the pool once it runs, after `start()` at app startup or a first
+    async call; before that, in management scripts and shells, they hash in
+    the calling thread, as spawned workers re-import an unguarded `__main__`
+    and break the pool. At most `max_pending`
+    jobs may be queued or running, further ones are rejected with a 503
+    instead of piling up behind a login burst. Time spent waiting for a
+    worker is recorded in `stats` and sent to influx.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        max_pending: int,
+        executor_factory: Callable[[], Executor] | None = None,
+    ):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.executor_factory = executor_factory or partial(
+            ProcessPoolExecutor,
+            max_workers=workers,
+            # Forking a process that runs threads may copy held locks
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        self._executor: Executor | None = None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.stats = {
+            "completed": 0,
+            "rejected": 0,
+            "queue_seconds_total": 0.0,
+            "queue_seconds_max": 0.0,
+        }
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = self.executor_factory()
+        return self._executor
+
+    def start(self):
+        """Start the workers, for app startup."""
+        self.executor
+
+    @property
+    def running(self) -> bool:
+        return self._executor is not None
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _submit(self, method: str, *args) -> Future:
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.stats["rejected"] += 1
+                raise ServiceUnavailable(
+                    exception_type="server.busy",
+                    msg="Too many requests are being processed, please retry.",
+                    headers={"Retry-After": "1"},
+                )
+            self.pending += 1
+        future = self.executor.submit(_run_hasher, method, *args)
+        future.add_done_callback(partial(self._done, time.time()))
+        return future
+
+    def _submit_many(self, method: str, calls: Iterable[tuple]) -> list[Future]:
+        futures = []
+        try:
+            for args in calls:
+                futures.append(self._submit(method, *args))
+        except ServiceUnavailable:
+            for future in futures:
+                future.cancel()
+            raise
+        return futures
+
+    def _done(self, submitted_at: float, future: Future):
+        with self._lock:
+            self.pending -= 1
+        if future.cancelled() or future.exception() is not None:
+            return
+        queued = max(0.0, future.result()[1] - submitted_at)
+        with self._lock:
+            self.stats["completed"] += 1
+            self.stats["queue_seconds_total"] += queued
+            self.stats["queue_seconds_max"] = max(self.stats["queue_seconds_max"], queued)
+        ilog(
+            Point("password_hashing")
+            .tag("environment", config.environment)
+            .field("queue_ms", queued * 1000)
+            .field("pending", self.pending)
+        )
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        future = self._submit("verify", plain_password, hashed_password)
+        return (await asyncio.wrap_future(future))[0]
+
+    async def hash(self, password: str) -> str:
+        return (await asyncio.wrap_future(self._submit("hash", password)))[0]
+
+    async def verify_any(self, plain_password: str, hashes: Iterable[str]) -> bool:
+        """Whether `plain_password` matches any of `hashes`, checked in parallel."""
+        futures = self._submit_many("verify", ((plain_password, x) for x in hashes))
+        pending = {asyncio.wrap_future(future) for future in futures}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                if any(task.result()[0] for task in done):
+                    return True
+            return False
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def verify_sync(self, plain_password: str, hashed_password: str) -> bool:
+        if not self.running:
+            return verify_password(plain_password, hashed_password)
+        return self._submit("verify", plain_password, hashed_password).result()[0]
+
+    def hash_sync(self, password: str) -> str:
+        if not self.running:
+            return get_password_hash(password)
+        return self._submit("hash", password).result()[0]
+
+    def verify_any_sync(self, plain_password: str, hashes: Iterable[str]) -> bool:
+        if not self.running:
+            return any(verify_password(plain_password, x) for x in hashes)
+        futures = self._submit_many("verify", ((plain_password, x) for x in hashes))
+        try:
+            return any(future.result()[0] for future in as_completed(futures))
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+password_hasher = PasswordHasher(
+    workers=config.password_hashing.workers,
+    max_pending=config.password_hashing.max_pending,
+)
+
+
 def create_access_token(
-        data: dict, expires_delta: timedelta | None = None, token_type="access"
+        data: dict,
+        expires_delta: timedelta | None = None,
+        token_type="access",
+        now: datetime | None = None,
 ):
     to_encode = data.copy()
     if not expires_delta:
@@ -71,10 +247,10 @@ def create_access_token(
                 minutes=config.auth_token.bo_access_token_expiry_minutes
             )
 
-    secret = REFRESH_SECRET_KEY if token_type == "refresh" else SECRET_KEY
-    expire = datetime.now() + expires_delta
-    to_encode.update({"exp": expire, "iat": datetime.now()})
-    encoded_jwt = jwt.encode(to_encode, secret, algorithm=ALGORITHM)
+    key = SIGNING_KEYS["refresh" if token_type == "refresh" else "access"]
+    now = now or datetime.now()
+    to_encode.update({"exp": now + expires_delta, "iat": now})
+    encoded_jwt = jwt.encode(to_encode, key, algorithm=ALGORITHM)
     return encoded_jwt
 
 
@@ -87,9 +263,7 @@ def get_token_type(iat, exp):
         return "refresh"
 
 
-def decode_token(token: str, token_type: Literal["access", "refresh"] = "access"):
-    if not token:
-        return None, []
+def _decode_token(token: str, token_type: Literal["access", "refresh"] = "access"):
     scopes = []
     try:
         secret = REFRESH_SECRET_KEY if token_type == "refresh" else SECRET_KEY
@@ -118,6 +292,72 @@ def decode_token(token: str, token_type: Literal["access", "refresh"] = "access"
     return payload, scopes
 
 
+class VerifiedTokenCache:
+    """
+    Verified payloads and scopes keyed by a digest of the token, so a token
+    reused for its whole lifetime is only verified once per worker.
+
+    Entries expire at the token's `exp`. Rotating a user's session or
+    blocking the user drops every token verified for that user before.
+    """
+
+    def __init__(self, maxsize: int):
+        self.tokens = TTLCache(maxsize=maxsize)
+        self.revoked_at = TTLCache(
+            maxsize=maxsize,
+            ttl=config.auth_token.user_access_token_expiry_minutes * 60,
+        )
+        for prefix in ("jti:", "userblock:"):
+            invalidation_bus.subscribe(prefix, self.revoke)
+
+    def revoke(self, key: str | None):
+        if key is None:
+            self.tokens.clear()
+        else:
+            self.revoked_at.set(key.split(":", 1)[1], time.monotonic())
+
+    def get(self, digest: bytes):
+        entry = self.tokens.get(digest)
+        if entry is MISSING:
+            return None
+        payload, scopes, verified_at = entry
+        revoked_at = self.revoked_at.get(payload.get("sid"))
+        if revoked_at is not MISSING and revoked_at >= verified_at:
+            self.tokens.pop(digest)
+            return None
+        return payload, scopes
+
+    def set(self, digest: bytes, payload: dict, scopes: list):
+        ttl = payload.get("exp", 0) - time.time()
+        if ttl > 0:
+            self.tokens.set(digest, (payload, scopes, time.monotonic()), ttl=ttl)
+
+
+token_cache = VerifiedTokenCache(maxsize=config.auth_token.token_cache_size)
+
+
+def _copy_verified(payload: dict, scopes: list):
+    # Callers extend the scopes, keep the cached entry untouched
+    payload, scopes = dict(payload), list(scopes)
+    if "scopes" in payload:
+        payload["scopes"] = scopes
+    return payload, scopes
+
+
+def decode_token(token: str, token_type: Literal["access", "refresh"] = "access"):
+    if not token:
+        return None, []
+    if not config.auth_token.token_cache_size:
+        return _decode_token(token, token_type)
+    digest = hashlib.sha256(f"{token_type}:{token}".encode()).digest()
+    cached = token_cache.get(digest)
+    if cached is None:
+        payload, scopes = _decode_token(token, token_type)
+        token_cache.set(digest, payload, scopes)
+        cached = payload, scopes
+    return _copy_verified(*cached)
+
+
 def generate_random_password():
     while True:
         password_length = secrets.randbelow(3) + 8
@@ -136,6 +376,14 @@ def generate_random_password():
 
 
 class AuthenticationMiddleware(BaseAuthMiddleware):
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # Mounted apps share the scope of the app they are mounted in, reuse
+        # its result instead of decoding the token again
+        if "auth" in scope and "user" in scope:
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
     @staticmethod
     def default_on_error(conn: HTTPConnection, exc: StarletteAuthenticationError) -> Response:
         if len(exc.args) and hasattr(exc.args[0], "detail"):
@@ -160,33 +408,110 @@ class AuthUser(SimpleUser):
         return self.username or self.phone_number or ""
 
 
-def validate_user_and_device(user_id, access_token_id, device_id):
+def session_terminated(detail: str):
+    return HTTPException(
+        status_code=420,
+        detail=detail,
+        headers={"X-expired-at": datetime.now(config.default_timezone).replace(tzinfo=None).isoformat()}
+    )
+
+
+class SessionStateCache:
+    """
+    Process-local copy of the `deviceblock:`, `userblock:` and `jti:` keys.
+
+    Entries are served without touching Redis while the invalidation channel
+    is connected, and never for longer than `max_staleness` seconds. Writers
+    go through `set_session_token`, `block_user` and `block_device`, which
+    publish the changed key so every worker drops its copy.
+    """
+
+    prefixes = ("deviceblock:", "userblock:", "jti:")
+
+    def __init__(self, max_staleness: float, maxsize: int):
+        self.entries = TTLCache(maxsize=maxsize, ttl=max_staleness)
+        # Bumped on every invalidation, guards against caching a value read
+        # from Redis before an invalidation that arrived while it was in flight
+        self.epoch = 0
+        for prefix in self.prefixes:
+            invalidation_bus.subscribe(prefix, self.invalidate)
+
+    def invalidate(self, key: str | None):
+        self.epoch += 1
+        if key is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(key)
+
+    async def get_many(self, keys: list[str]) -> list[bytes | None]:
+        invalidation_bus.ensure_started()
+        trusted = invalidation_bus.healthy
+        values = {}
+        if trusted:
+            for key in keys:
+                value = self.entries.get(key)
+                if value is not MISSING:
+                    values[key] = value
+        misses = [key for key in keys if key not in values]
+        if misses:
+            epoch = self.epoch
+            fetched = await async_cache.mget(misses)
+            values.update(zip(misses, fetched))
+            if trusted and epoch == self.epoch:
+                for key, value in zip(misses, fetched):
+                    self.entries.set(key, value)
+        return [values[key] for key in keys]
+
+
+session_state = SessionStateCache(
+    max_staleness=config.auth_token.session_cache_seconds,
+    maxsize=config.auth_token.session_cache_size,
+)
+
+
+def set_session_token(user_id, access_token_id: str):
+    cache.set(f"jti:{user_id}", access_token_id)
+    invalidation_bus.publish(f"jti:{user_id}")
+
+
+def block_user(user_id, blocked: bool = True):
+    if blocked:
+        cache.set(f"userblock:{user_id}", 1)
+    else:
+        cache.delete(f"userblock:{user_id}")
+    invalidation_bus.publish(f"userblock:{user_id}")
+
+
+def block_device(device_id, blocked: bool = True):
+    if blocked:
+        cache.set(f"deviceblock:{device_id}", 1)
+    else:
+        cache.delete(f"deviceblock:{device_id}")
+    invalidation_bus.publish(f"deviceblock:{device_id}")
+
+
+async def validate_user_and_device(user_id, access_token_id, device_id):
+    keys = {}
     if device_id:
-        device_blocked = cache.get(f"deviceblock:{device_id}")
-        if device_blocked:
-            raise HTTPException(
-                status_code=420,
-                detail="Device Blocked",
-                headers={"X-expired-at": datetime.now(config.default_timezone).replace(tzinfo=None).isoformat()}
-            )
+        keys["device"] = f"deviceblock:{device_id}"
     if user_id:
-        user_blocked = cache.get(f"userblock:{user_id}")
-        if user_blocked:
-            raise HTTPException(
-                status_code=420,
-                detail="User Blocked",
-                headers={"X-expired-at": datetime.now(config.default_timezone).replace(tzinfo=None).isoformat()}
-            )
+        keys["user"] = f"userblock:{user_id}"
     if access_token_id:
-        cache_token_id = cache.get(f"jti:{user_id}")
-        if cache_token_id.decode("utf-8") == access_token_id:
-            return
-        elif cache_token_id.decode("utf-8") != access_token_id:
-            raise HTTPException(
-                status_code=420,
-                detail="You have multiple sessions open at the same time. For security reasons, "
-                       "this session will be terminated.",
-                headers={"X-expired-at": datetime.now(config.default_timezone).replace(tzinfo=None).isoformat()}
+        keys["jti"] = f"jti:{user_id}"
+    if not keys:
+        return
+    # At most a single round trip for all the checks
+    values = dict(zip(keys, await session_state.get_many(list(keys.values()))))
+    if values.get("device"):
+        raise session_terminated("Device Blocked")
+    if values.get("user"):
+        raise session_terminated("User Blocked")
+    if "jti" in keys:
+        cache_token_id = values["jti"]
+        if cache_token_id is None or cache_token_id.decode("utf-8") != access_token_id:
+            raise session_terminated(
+                "You have multiple sessions open at the same time. For security reasons, "
+                "this session will be terminated."
             )
 
 
@@ -226,7 +551,9 @@ class JWTAuthBackend(AuthenticationBackend):
             if payload:
                 scopes.append("authenticated")
             if "Staff" not in scopes and config.service_name not in ["authx", "gateway"]:
-                validate_user_and_device(payload.get("sid"), payload.get("jti"), conn.headers.get("device-id"))
+                await validate_user_and_device(
+                    payload.get("sid"), payload.get("jti"), conn.headers.get("device-id")
+                )
             return AuthCredentials(scopes), AuthUser(payload)
         except HTTPException as e:
             conn.state.error = e
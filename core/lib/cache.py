@@ -0,0 +1,243 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from itertools import chain
+from typing import Any, Callable, Hashable, Iterable
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import ORMExecuteState, Session
+
+from core.redis import async_cache, cache
+
+log = logging.getLogger("uvicorn")
+
+MISSING = object()
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+
+class TTLCache:
+    """
+    Bounded, thread-safe LRU mapping whose entries expire `ttl` seconds after
+    they were set. `None` is a valid cached value, use `MISSING` to tell a
+    miss apart.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[Any, float | None]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        with self._lock:
+            item = self._data.get(key, MISSING)
+            if item is MISSING:
+                return default
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.pop(key, MISSING)
+        return default if item is MISSING else item[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not MISSING
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class InvalidationBus:
+    """
+    Keeps process-local caches coherent across workers and nodes.
+
+    Writers call `publish(key)` after changing the source of truth; every
+    process subscribed to the Redis channel hands the key to the handlers
+    registered for its prefix. Local caches must only be trusted while
+    `healthy` is True: while the subscription is down messages may be lost,
+    so every handler is reset when it (re)connects.
+    """
+
+    reconnect_delay = 1.0
+
+    def __init__(self, channel: str = INVALIDATION_CHANNEL):
+        self.channel = channel
+        self.handlers: dict[str, list[Callable[[str | None], None]]] = {}
+        self.healthy = False
+        self._task: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def subscribe(self, prefix: str, handler: Callable[[str | None], None]):
+        """Call `handler(key)` for invalidated keys starting with `prefix`,
+        or `handler(None)` when everything must be dropped."""
+        self.handlers.setdefault(prefix, []).append(handler)
+
+    def unsubscribe(self, prefix: str, handler: Callable[[str | None], None]):
+        handlers = self.handlers.get(prefix, [])
+        if handler in handlers:
+            handlers.remove(handler)
+
+    def publish(self, key: str):
+        self.dispatch(key)
+        try:
+            cache.publish(self.channel, json.dumps({"key": key}))
+        except Exception as exc:  # Redis down, local caches age out by TTL
+            log.warning(f"Could not publish cache invalidation for {key}: {exc}")
+
+    async def apublish(self, key: str):
+        self.dispatch(key)
+        try:
+            await async_cache.publish(self.channel, json.dumps({"key": key}))
+        except Exception as exc:
+            log.warning(f"Could not publish cache invalidation for {key}: {exc}")
+
+    def dispatch(self, key: str | None):
+        for prefix, handlers in self.handlers.items():
+            if key is None or key.startswith(prefix):
+                for handler in handlers:
+                    handler(key)
+
+    def ensure_started(self):
+        """Start listening on the running event loop, once per loop."""
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._loop is loop:
+            return
+        self._loop = loop
+        self._task = loop.create_task(self._listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        self.healthy = False
+
+    async def _listen(self):
+        while True:
+            pubsub = async_cache.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                # Anything may have changed while we weren't listening
+                self.dispatch(None)
+                self.healthy = True
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    self.dispatch(json.loads(message["data"])["key"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                log.warning(f"Cache invalidation channel unavailable: {exc}")
+            finally:
+                self.healthy = False
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+            await asyncio.sleep(self.reconnect_delay)
+
+
+invalidation_bus = InvalidationBus()
+
+
+_invalidators: dict[type, list[Callable[[Any], Iterable[str]]]] = {}
+
+
+def invalidate_on_commit(model: type, keys: Callable[[Any], Iterable[str]]):
+    """
+    Drop `keys(instance)` from Redis and every process-local cache once a
+    transaction that inserted, changed or deleted an instance of `model`
+    has been committed. Bulk `update()`/`delete()` statements are covered
+    too: the rows they match are loaded before the statement runs.
+    """
+    _invalidators.setdefault(model, []).append(keys)
+
+
+def invalidate_keys(keys: Iterable[str]):
+    keys = list(dict.fromkeys(keys))
+    if not keys:
+        return
+    for key in keys:
+        invalidation_bus.dispatch(key)
+    try:
+        # One round trip, and a single retry cycle when Redis is down
+        with cache.pipeline(transaction=False) as pipe:
+            pipe.delete(*keys)
+            for key in keys:
+                pipe.publish(invalidation_bus.channel, json.dumps({"key": key}))
+            pipe.execute()
+    except Exception as exc:
+        log.warning(f"Could not invalidate cached keys {keys}: {exc}")
+
+
+def add_pending_invalidations(session: Session, keys: Iterable[str]):
+    """Invalidate `keys` once the session's transaction commits."""
+    session.info.setdefault("cache_invalidations", set()).update(keys)
+
+
+def _collect(session: Session, instances: Iterable[Any]):
+    for instance in instances:
+        for model, funcs in _invalidators.items():
+            if isinstance(instance, model):
+                for keys in funcs:
+                    add_pending_invalidations(session, keys(instance))
+
+
+def add_pending_row_invalidations(session: Session, model: type, ids: Iterable[Any]):
+    """
+    Invalidate what `invalidate_on_commit` registered for the rows of `model`
+    with `ids` once the session's transaction commits. For Core statements,
+    which the ORM hooks below do not see; the key functions get instances
+    with only the primary key set.
+    """
+    if any(issubclass(model, x) for x in _invalidators):
+        _collect(session, [model(id=x) for x in ids])
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_invalidations(session: Session, flush_context):
+    if _invalidators:
+        # new/dirty/deleted still hold the pre-flush state here
+        _collect(session, chain(session.new, session.dirty, session.deleted))
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_bulk_invalidations(state: ORMExecuteState):
+    if not (state.is_update or state.is_delete) or state.bind_mapper is None:
+        return
+    entity = state.bind_mapper.class_
+    if not any(issubclass(entity, model) for model in _invalidators):
+        return
+    query = select(entity)
+    if state.statement.whereclause is not None:
+        query = query.where(state.statement.whereclause)
+    _collect(state.session, state.session.scalars(query))
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_invalidations(session: Session):
+    invalidate_keys(session.info.pop("cache_invalidations", ()))
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_invalidations(session: Session):
+    session.info.pop("cache_invalidations", None)
@@ -0,0 +1,238 @@
+"""
+Applies replication events for `ConsumerBase` models in batches.
+
+Events arrive as `("{action}-{model}", data)`, the topics the producers
+publish to, with `action` one of create, update or delete. Instead of a
+transaction per event, events are buffered and applied per batch: every
+`max_batch` events or `max_delay` seconds after the first one, whichever
+comes first, as one multi-row upsert, update and delete per model.
+
+    consumer = BatchConsumer([Merchant, Outlet])
+    task = asyncio.create_task(consumer.run())
+    await consumer.put("update-merchant", {"id": 1, "name": "..."})
+    ...
+    await consumer.stop()
+"""
+import asyncio
+import logging
+import time
+from typing import Callable, Iterable
+
+from sqlalchemy import bindparam, delete, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from core.config import config
+from core.db.session import SessionLocal
+from core.influx import Point, ilog
+from core.lib.cache import add_pending_row_invalidations
+from core.lib.models import ConsumerBase
+
+log = logging.getLogger("uvicorn")
+
+ACTIONS = ("create", "update", "delete")
+
+
+class _Pending:
+    """Net effect of a batch's events on one row."""
+
+    __slots__ = ("action", "data")
+
+    def __init__(self, action: str, data: dict):
+        self.action = action
+        self.data = data
+
+    def apply(self, action: str, data: dict):
+        if action == "delete":
+            self.action, self.data = "delete", data
+        elif action == "create":
+            if self.action == "delete":
+                self.data = data
+            else:
+                # A redelivered create keeps what the updates before it set
+                self.data = {**self.data, **data}
+            self.action = "create"
+        elif self.action != "delete":
+            # An update after a create or update of the same row merges into it
+            self.data = {**self.data, **data}
+
+
+class BatchConsumer:
+    """
+    Buffers events in a queue of at most `max_pending`, `put` waits when it
+    is full, so a slow database holds the producer back rather than growing
+    memory. Within a batch the events for a row collapse to their net
+    effect; creates are upserts, so a redelivered create is harmless. When a
+    batch fails, its events are applied one transaction each so a single
+    bad event does not hold back the rest. The statements are Core ones, so
+    what `invalidate_on_commit` caches for the rows is invalidated
+    explicitly, once they are committed.
+    """
+
+    def __init__(
+        self,
+        models: Iterable[type[ConsumerBase]],
+        max_batch: int = config.consumer.max_batch,
+        max_delay: float = config.consumer.max_delay,
+        max_pending: int = config.consumer.max_pending,
+        session_factory: Callable[[], Session] | None = None,
+    ):
+        self.models = {model.__name__.lower(): model for model in models}
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self.session_factory = session_factory
+        self.stats = {"events": 0, "batches": 0, "failed_batches": 0, "failed_events": 0}
+        self._stopping = False
+
+    @staticmethod
+    def parse_topic(topic: str) -> tuple[str, str]:
+        action, _, model = topic.partition("-")
+        if action not in ACTIONS or not model:
+            raise ValueError(f"Unknown consumer topic {topic}")
+        return action, model
+
+    async def put(self, topic: str, data: dict):
+        """Queue an event, waiting while the buffer is full."""
+        action, model = self.parse_topic(topic)
+        if model not in self.models:
+            raise ValueError(f"No consumer model for {topic}")
+        if not isinstance(data, dict) or data.get("id") is None:
+            raise ValueError(f"Consumer event {topic} has no id")
+        await self.queue.put((action, model, data))
+
+    async def run(self):
+        """Apply batches until `stop`, then drain what is left."""
+        while not (self._stopping and self.queue.empty()):
+            batch = await self._next_batch()
+            if batch:
+                try:
+                    await run_in_threadpool(self.apply_batch, batch)
+                except Exception as error:
+                    # The batch is lost, but later ones still get applied
+                    log.exception(f"Consumer lost a batch of {len(batch)} events: {error}")
+
+    async def stop(self):
+        self._stopping = True
+        # Wakes `run` if it is waiting for the first event of a batch
+        await self.queue.put(None)
+
+    async def _next_batch(self) -> list[tuple[str, str, dict]]:
+        batch = []
+        item = await self.queue.get()
+        if item is not None:
+            batch.append(item)
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch and not self._stopping:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if item is not None:
+                batch.append(item)
+        # Whatever is already buffered when stopping goes in without waiting
+        while len(batch) < self.max_batch and not self.queue.empty():
+            item = self.queue.get_nowait()
+            if item is not None:
+                batch.append(item)
+        return batch
+
+    def _session(self) -> Session:
+        return (self.session_factory or SessionLocal)()
+
+    def apply_batch(self, batch: list[tuple[str, str, dict]]):
+        started_at = time.perf_counter()
+        pending: dict[str, dict] = {}
+        events = []
+        for action, model, data in batch:
+            if not isinstance(data, dict) or data.get("id") is None:
+                # `put` rejects these, only a direct call can get here
+                self.stats["failed_events"] += 1
+                log.error(f"Consumer event {action}-{model} has no id: {data}")
+                continue
+            events.append((action, model, data))
+            rows = pending.setdefault(model, {})
+            row = rows.get(data["id"])
+            if row is None:
+                rows[data["id"]] = _Pending(action, data)
+            else:
+                row.apply(action, data)
+
+        db = self._session()
+        try:
+            for model, rows in pending.items():
+                self._apply_model(db, self.models[model], rows.values())
+            db.commit()
+        except Exception as error:
+            db.rollback()
+            self.stats["failed_batches"] += 1
+            log.warning(f"Consumer batch of {len(batch)} events failed, applying one by one: {error}")
+            self._apply_each(db, events)
+        finally:
+            db.close()
+
+        elapsed = time.perf_counter() - started_at
+        self.stats["events"] += len(batch)
+        self.stats["batches"] += 1
+        ilog(
+            Point("consumer_batch")
+            .field("events", len(batch))
+            .field("rows", sum(len(rows) for rows in pending.values()))
+            .field("duration_ms", elapsed * 1000)
+        )
+
+    def _apply_model(self, db: Session, model: type[ConsumerBase], rows: Iterable[_Pending]):
+        rows = list(rows)
+        creates: dict[frozenset, list[dict]] = {}
+        updates: dict[frozenset, list[dict]] = {}
+        deletes = []
+        for row in rows:
+            if row.action == "delete":
+                deletes.append(row.data["id"])
+                continue
+            data = model.consumer_data(row.data)
+            groups = creates if row.action == "create" else updates
+            # Rows with the same columns share a statement
+            groups.setdefault(frozenset(data), []).append(data)
+
+        # Core statements skip the ORM hooks, the cached rows are dropped
+        # explicitly on commit
+        add_pending_row_invalidations(db, model, [row.data["id"] for row in rows])
+        table = model.__table__
+        if deletes:
+            db.execute(delete(table).where(table.c.id.in_(deletes)))
+        for columns, values in creates.items():
+            statement = insert(table).values(values)
+            excluded = {key: statement.excluded[key] for key in columns if key != "id"}
+            if excluded:
+                statement = statement.on_conflict_do_update(
+                    index_elements=[table.c.id], set_=excluded
+                )
+            else:
+                statement = statement.on_conflict_do_nothing(index_elements=[table.c.id])
+            db.execute(statement)
+        for columns, values in updates.items():
+            columns = [key for key in columns if key != "id"]
+            if not columns:
+                continue
+            # One executemany; rows that no longer exist are skipped, as before
+            statement = (
+                update(table)
+                .where(table.c.id == bindparam("_id"))
+                .values({key: bindparam(key) for key in columns})
+            )
+            db.execute(statement, [{**data, "_id": data["id"]} for data in values])
+
+    def _apply_each(self, db: Session, batch: list[tuple[str, str, dict]]):
+        for action, model, data in batch:
+            try:
+                self._apply_model(db, self.models[model], [_Pending(action, data)])
+                db.commit()
+            except Exception as error:
+                db.rollback()
+                self.stats["failed_events"] += 1
+                log.error(f"Consumer could not apply {action}-{model} {data.get('id')}: {error}")
@@ -37,10 +37,23 @@ def action(
     :param interceptor: The interceptor class to use for this action. This is
                         just additional decorators that will be applied to the
                         view function.
+    :param rate_limit: Pass `rate_limit=RateLimit(...)`, or a list of them, in
+                       kwargs to limit this action, see `core.lib.ratelimit`.
+    :param replica: Pass `replica=True` in kwargs to serve a GET action that
+                    never writes from the read replicas, see `core.db.replicas`.
+    :param timeout: Pass `timeout=seconds` in kwargs to give this action its
+                    own time budget, see `core.db.deadlines`.
+    :param settings_profile: Pass `settings_profile="report"`, or a dict of
+                    Postgres settings, in kwargs to run this action's
+                    transactions with them, see `core.db.profiles`.
     :param kwargs: Additional properties to set on the view.  This can be used
                    to override viewset-level settings. Also, any additional
                     keyword arguments will be passed to the FastAPI `add_api_route`
                     function.
+
+    Reads in `list` and `retrieve` are retried on transient database errors;
+    put `@retry_transient()` from `core.db.retry` under `@action` to retry a
+    read-only or idempotent action as well.
     """
 
     def decorator(func: Callable) -> Callable:
@@ -1,6 +1,11 @@
 from fastapi import HTTPException
-from psycopg2.errors import ForeignKeyViolation, UniqueViolation
 
+from core.db.drivers import (
+    FOREIGN_KEY_VIOLATION,
+    UNIQUE_VIOLATION,
+    error_message,
+    sqlstate,
+)
 from core.lib.exceptions import ForeignKeyProtectedException, InvalidForeignKey
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
@@ -8,8 +13,10 @@ from sqlalchemy.exc import IntegrityError
 
 def handle_integrity_error(db: Session, e: IntegrityError):
     db.rollback()
-    if isinstance(e.orig, ForeignKeyViolation):
-        msg = e.orig.pgerror
+    # By SQLSTATE, the error classes differ between psycopg2 and psycopg 3
+    code = sqlstate(e.orig)
+    if code == FOREIGN_KEY_VIOLATION:
+        msg = error_message(e.orig)
         if msg:
             if "is still referenced from" in msg:
                 # find constraint from msg
@@ -22,8 +29,8 @@ def handle_integrity_error(db: Session, e: IntegrityError):
                 raise InvalidForeignKey(table=referenced_table)
         else:
             raise InvalidForeignKey()
-    elif isinstance(e.orig, UniqueViolation):
-        msg = str(e.orig)
+    elif code == UNIQUE_VIOLATION:
+        msg = error_message(e.orig)
         try:
             key = msg.split('Key ("')[1].split('"')[0]
             raise HTTPException(
@@ -159,6 +159,44 @@ class LimitExceeded(BaseException):
         )
 
 
+class PayloadTooLarge(BaseException):
+    def __init__(
+        self,
+        exception_type: str,
+        msg: str | None = None,
+        loc: list[str] | None = None,
+        detail: Any | None = None,
+        headers: Dict[str, Any] | None = None,
+    ) -> None:
+        super().__init__(
+            exception_type,
+            msg=msg,
+            loc=loc,
+            detail=detail,
+            headers=headers,
+            status_code=413,
+        )
+
+
+class ServiceUnavailable(BaseException):
+    def __init__(
+        self,
+        exception_type: str,
+        msg: str | None = None,
+        loc: list[str] | None = None,
+        detail: Any | None = None,
+        headers: Dict[str, Any] | None = None,
+    ) -> None:
+        super().__init__(
+            exception_type,
+            msg=msg,
+            loc=loc,
+            detail=detail,
+            headers=headers,
+            status_code=503,
+        )
+
+
 class AuthenticationError(BaseException):
     def __init__(
         self,
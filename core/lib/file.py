@@ -0,0 +1,221 @@
+import mimetypes
+import os
+import re
+
+import anyio
+from fastapi import APIRouter, Depends, Request, UploadFile
+from fastapi.responses import FileResponse, Response
+from starlette.types import Receive, Scope, Send
+
+from core.lib.exceptions import AuthorizationError, NotFound, PayloadTooLarge
+from core.lib.media import verify_download
+from core.lib.permissions import IsAuthenticated
+from core.lib.storage import BaseStorage, get_storage
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+# Served inline under their own type. The extension of a key comes from the
+# uploader's filename, so anything a browser could run as a page (HTML, SVG,
+# XML, ...) is sent as an attachment instead.
+INLINE_TYPES = {
+    "application/pdf",
+    "image/gif",
+    "image/jpeg",
+    "image/png",
+    "image/webp",
+    "text/plain",
+}
+
+
+def save_upload_file(
+    upload: UploadFile,
+    prefix: str = "",
+    field_name: str | None = None,
+    max_size: int | None = None,
+) -> str:
+    """
+    Stream an uploaded file to the configured storage and return its key.
+
+    The upload is read from its spooled temporary file in chunks, so large
+    documents never have to fit in memory.
+    """
+    storage = get_storage()
+    max_size = max_size or storage.max_size
+    loc = ["body", field_name] if field_name else None
+    # Reject early when the multipart parser already knows the size
+    if upload.size is not None and upload.size > max_size:
+        raise PayloadTooLarge(
+            exception_type="file.too_large",
+            msg=f"File must not be larger than {max_size} bytes.",
+            loc=loc,
+        )
+    upload.file.seek(0)
+    stored = storage.save(
+        upload.file,
+        filename=upload.filename,
+        content_type=upload.content_type,
+        prefix=prefix,
+        max_size=max_size,
+        loc=loc,
+    )
+    return stored.key
+
+
+def delete_stored_files(keys: list[str]):
+    storage = get_storage()
+    for key in keys:
+        storage.delete(key)
+
+
+class RangeFileResponse(FileResponse):
+    """
+    FileResponse limited to `length` bytes starting at `offset`.
+
+    When the server supports the ASGI zero-copy send extension the file
+    descriptor is handed over and the kernel copies the bytes (sendfile),
+    otherwise the range is streamed in chunks.
+    """
+
+    def __init__(self, path: str, offset: int = 0, length: int = 0, **kwargs):
+        super().__init__(path, **kwargs)
+        self.offset = offset
+        self.length = length
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            }
+        )
+        if self.send_header_only or not self.length:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, "rb") as file:
+                await send(
+                    {
+                        "type": "http.response.zerocopysend",
+                        "file": file,
+                        "offset": self.offset,
+                        "count": self.length,
+                        "more_body": False,
+                    }
+                )
+        else:
+            async with await anyio.open_file(self.path, mode="rb") as file:
+                await file.seek(self.offset)
+                remaining = self.length
+                while remaining:
+                    chunk = await file.read(min(self.chunk_size, remaining))
+                    remaining = remaining - len(chunk) if chunk else 0
+                    await send(
+                        {
+                            "type": "http.response.body",
+                            "body": chunk,
+                            "more_body": bool(remaining),
+                        }
+                    )
+        if self.background is not None:
+            await self.background()
+
+
+def parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """
+    Return `(offset, length)` for a single `bytes=` range, or None when the
+    whole file should be sent. Raises ValueError for an unsatisfiable range.
+    """
+    match = RANGE_PATTERN.match(header.strip()) if header else None
+    if not match:
+        # Missing, malformed or multi-range requests get the full content
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        length = min(int(end), size)
+        if not length:
+            raise ValueError("Unsatisfiable range")
+        return size - length, length
+    offset = int(start)
+    last = min(int(end), size - 1) if end else size - 1
+    if offset >= size or last < offset:
+        raise ValueError("Unsatisfiable range")
+    return offset, last - offset + 1
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    candidates = [x.strip().removeprefix("W/") for x in header.split(",")]
+    return f'"{etag}"' in candidates
+
+
+router = APIRouter(prefix="/files")
+
+
+def content_headers(key: str) -> tuple[str, dict[str, str]]:
+    """Media type and headers that keep a stored file from running as a page."""
+    media_type = mimetypes.guess_type(key)[0]
+    headers = {
+        "x-content-type-options": "nosniff",
+        "content-security-policy": "default-src 'none'; sandbox",
+    }
+    if media_type not in INLINE_TYPES:
+        media_type = "application/octet-stream"
+        headers["content-disposition"] = "attachment"
+    return media_type, headers
+
+
+@router.get("/{key:path}", dependencies=[Depends(IsAuthenticated)])
+def download(
+    key: str,
+    request: Request,
+    expires: int | None = None,
+    signature: str | None = None,
+    storage: BaseStorage = Depends(get_storage),
+):
+    # Only links handed out in responses (`MediaURL`), not any guessed key
+    if not verify_download(key, expires, signature):
+        raise AuthorizationError(
+            exception_type="file.invalid_signature", msg="Invalid or expired file link"
+        )
+    if not storage.exists(key):
+        raise NotFound(exception_type="file.not_found", msg="File not found")
+    path = storage.path(key)
+    size = os.stat(path).st_size
+    etag = storage.etag(key)
+    media_type, headers = content_headers(key)
+    headers.update(
+        {
+            "etag": f'"{etag}"',
+            "accept-ranges": "bytes",
+            # keys are never reused for different content
+            "cache-control": "private, max-age=31536000, immutable",
+        }
+    )
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    status_code, offset, length = 200, 0, size
+    if_range = request.headers.get("if-range")
+    if not if_range or etag_matches(if_range, etag):
+        try:
+            byte_range = parse_range(request.headers.get("range"), size)
+        except ValueError:
+            headers["content-range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+        if byte_range:
+            status_code, (offset, length) = 206, byte_range
+            headers["content-range"] = f"bytes {offset}-{offset + length - 1}/{size}"
+    headers["content-length"] = str(length)
+
+    return RangeFileResponse(
+        path,
+        offset=offset,
+        length=length,
+        status_code=status_code,
+        headers=headers,
+        media_type=media_type,
+        method=request.method,
+    )
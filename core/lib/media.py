@@ -0,0 +1,212 @@
+import base64
+import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Iterable
+
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding
+from pydantic import BaseModel
+
+from core.config import config
+
+DOWNLOAD_URL = "/authentication/files"
+# CloudFront's URL safe variant of base64
+SIGNATURE_TRANSLATION = str.maketrans("+=/", "-_~")
+
+
+def cloudfront_base64(data: bytes) -> str:
+    return base64.b64encode(data).decode().translate(SIGNATURE_TRANSLATION)
+
+
+def _download_secret() -> bytes:
+    if config.media_url_secret:
+        return config.media_url_secret.encode()
+    from core.lib.authentication import SECRET_KEY
+
+    return hashlib.sha256(b"media-url:" + SECRET_KEY.encode()).digest()
+
+
+def download_signature(key: str, expires: int) -> str:
+    message = f"{key.lstrip('/')}:{expires}".encode()
+    return hmac.new(_download_secret(), message, hashlib.sha256).hexdigest()
+
+
+def verify_download(key: str, expires: int | None, signature: str | None) -> bool:
+    """Whether a link to the download endpoint was issued by us and is current."""
+    if expires is None or not signature or expires < time.time():
+        return False
+    return hmac.compare_digest(download_signature(key, expires), signature)
+
+
+class MediaURLSigner:
+    """
+    Turns stored file keys into CloudFront signed URLs, or, without
+    CloudFront, into links to the download endpoint carrying an expiry and
+    an HMAC of the key, which the endpoint requires.
+
+    CloudFront URLs are signed with a custom policy for everything under the
+    key's prefix (`avatars/*`), so a page of keys costs one RSA signature per
+    prefix rather than one per key. Signatures are cached until
+    `refresh_margin` seconds before they expire. Expiry times are rounded up
+    to `expiry_granularity`, so a page of keys is signed with one expiry and
+    repeated keys reuse the same URL.
+    """
+
+    refresh_margin = 60
+    expiry_granularity = 300
+
+    def __init__(
+        self,
+        base_url: str | None = None,
+        key_pair_id: str | None = None,
+        private_key_path: str | None = None,
+        expiry_seconds: int = 3600,
+        max_entries: int = 10000,
+    ):
+        self.base_url = (base_url or DOWNLOAD_URL).rstrip("/")
+        self.key_pair_id = key_pair_id
+        self.private_key_path = private_key_path
+        self.expiry_seconds = expiry_seconds
+        self.max_entries = max_entries
+        # Query strings by what they cover, the prefix or the key
+        self._cache: OrderedDict[str, tuple[str, int]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._private_key = None
+        # Reused for every signature
+        self._padding = padding.PKCS1v15()
+        self._hash = hashes.SHA1()
+
+    @property
+    def signs_cloudfront(self) -> bool:
+        return bool(self.key_pair_id and self.private_key_path)
+
+    @property
+    def signs_urls(self) -> bool:
+        return self.signs_cloudfront or self.base_url == DOWNLOAD_URL
+
+    @property
+    def private_key(self):
+        if self._private_key is None:
+            with open(self.private_key_path, "rb") as key_file:  # type: ignore
+                self._private_key = serialization.load_pem_private_key(
+                    key_file.read(), password=None
+                )
+        return self._private_key
+
+    def _expires_at(self, now: float) -> int:
+        expires = int(now) + self.expiry_seconds
+        return expires - expires % -self.expiry_granularity  # round up
+
+    def stored_key(self, value: str) -> str | None:
+        """The key `value` refers to, None for a URL outside `base_url`."""
+        if value.startswith(self.base_url + "/"):
+            # A URL of ours, maybe signed, stored in place of the key: it is
+            # signed again rather than handed out as it is
+            return value[len(self.base_url) + 1 :].split("?", 1)[0]
+        if value.startswith(("http://", "https://")):
+            return None
+        return value.lstrip("/")
+
+    def _scope(self, key: str) -> str:
+        # What one signature covers
+        return key[: key.rfind("/") + 1] if self.signs_cloudfront else key
+
+    def _sign(self, scope: str, expires: int) -> str:
+        if not self.signs_cloudfront:
+            return f"expires={expires}&signature={download_signature(scope, expires)}"
+        policy = (
+            '{"Statement":[{"Resource":"%s/%s*","Condition":'
+            '{"DateLessThan":{"AWS:EpochTime":%d}}}]}' % (self.base_url, scope, expires)
+        ).encode()
+        signature = self.private_key.sign(policy, self._padding, self._hash)
+        return (
+            f"Policy={cloudfront_base64(policy)}&Signature={cloudfront_base64(signature)}"
+            f"&Key-Pair-Id={self.key_pair_id}"
+        )
+
+    def sign_many(self, keys: Iterable[str | None]) -> dict[str, str]:
+        """
+        URLs for `keys`, signing each prefix (CloudFront) or key (download
+        endpoint) not in the cache once; the lock only guards the cache,
+        signing runs outside it.
+        """
+        now = time.time()
+        expires = self._expires_at(now)
+        urls = {}
+        pending: dict[str, list[tuple[str, str]]] = {}
+        with self._lock:
+            for value in dict.fromkeys(keys):
+                if not value:
+                    continue
+                key = self.stored_key(value)
+                if key is None:
+                    urls[value] = value
+                    continue
+                url = f"{self.base_url}/{key}"
+                if not self.signs_urls:
+                    urls[value] = url
+                    continue
+                scope = self._scope(key)
+                cached = self._cache.get(scope)
+                if cached and cached[1] - self.refresh_margin > now:
+                    self._cache.move_to_end(scope)
+                    urls[value] = f"{url}?{cached[0]}"
+                    continue
+                pending.setdefault(scope, []).append((value, url))
+        if not pending:
+            return urls
+        signed = {scope: self._sign(scope, expires) for scope in pending}
+        with self._lock:
+            for scope, query in signed.items():
+                self._cache[scope] = (query, expires)
+                self._cache.move_to_end(scope)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        for scope, query in signed.items():
+            for value, url in pending[scope]:
+                urls[value] = f"{url}?{query}"
+        return urls
+
+    def url_for(self, key: str | None) -> str | None:
+        if not key:
+            return key
+        return self.sign_many([key])[key]
+
+
+media_signer = MediaURLSigner(
+    base_url=config.cloudfront_s3_proxy_url,
+    key_pair_id=config.cloudfront_key_pair_id,
+    private_key_path=config.cloudfront_private_key_path,
+    expiry_seconds=config.media_url_expiry_seconds,
+)
+
+
+def get_media_fields(schema: type[BaseModel] | None) -> list[str]:
+    from core.lib.pydantic import MediaURL
+
+    if not schema or not isinstance(schema, type) or not issubclass(schema, BaseModel):
+        return []
+    return [
+        name for name, field in schema.__fields__.items() if field.type_ is MediaURL
+    ]
+
+
+def presign_media(schema: type[BaseModel] | None, objects: Iterable[Any]):
+    """
+    Sign the media URLs of a whole page in one pass, one signature per
+    prefix or key not yet cached, so validating each row against `schema`
+    only hits the signer's cache.
+    """
+    fields = get_media_fields(schema)
+    if not fields:
+        return
+    keys = []
+    for obj in objects:
+        for field in fields:
+            value = obj.get(field) if isinstance(obj, dict) else getattr(obj, field, None)
+            if isinstance(value, str):
+                keys.append(value)
+    media_signer.sign_many(keys)
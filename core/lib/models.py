@@ -1,26 +1,40 @@
 from datetime import datetime
 
-from sqlalchemy import func
+from sqlalchemy import func, inspect
 from sqlalchemy.orm import Mapped, mapped_column
 
 from core.db import Base
 from core.db.session import get_db_context
+from core.lib.singletons import get_singleton, singleton_cache
 
 
 class ConsumerBase(Base):
     __abstract__ = True
 
+    @classmethod
+    def consumer_fields(cls) -> frozenset[str]:
+        """Column attributes an event may set, computed once per model."""
+        fields = cls.__dict__.get("_consumer_fields")
+        if fields is None:
+            fields = frozenset(attr.key for attr in inspect(cls).column_attrs)
+            cls._consumer_fields = fields
+        return fields
+
+    @classmethod
+    def consumer_data(cls, data: dict) -> dict:
+        fields = cls.consumer_fields()
+        return {key: value for key, value in data.items() if key in fields}
+
     @classmethod
     def create(cls, data: dict):
         with get_db_context() as db:
-            [data.pop(key) for key in data.copy() if key not in dir(cls)]
-            db.add(cls(**data))
+            db.add(cls(**cls.consumer_data(data)))
             db.commit()
 
     @classmethod
     def update(cls, data):
         with get_db_context() as db:
-            [data.pop(key) for key in data.copy() if key not in dir(cls)]
+            data = cls.consumer_data(data)
             db.query(cls).filter_by(id=data["id"]).update(data)
             db.commit()
 
@@ -37,15 +51,16 @@ class SingletonBase(Base):
 
     initial_data = {}
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if not cls.__dict__.get("__abstract__", False):
+            # Before any read, writers have to invalidate the cached row
+            singleton_cache.register(cls)
+
     @classmethod
     def get(cls, session):
-        # TODO Use KV store for this
-        instance = session.query(cls).first()
-        if instance is None:
-            instance = cls(**cls.initial_data)
-            session.add(instance)
-            session.commit()
-        return instance
+        """The row, from the process-local cache, see `core.lib.singletons`."""
+        return get_singleton(session, cls)
 
 
 class ConsumerSingletonBase(SingletonBase):
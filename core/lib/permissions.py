@@ -1,6 +1,22 @@
+import itertools
+import secrets
+import threading
 from abc import ABC, abstractmethod
-from fastapi import HTTPException, Depends, Request
+from functools import lru_cache
+from inspect import Parameter, Signature, signature
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Type
+
+from fastapi import HTTPException, Depends, Request, params
 from fastapi.security import APIKeyHeader, OAuth2PasswordBearer
+from fastapi.security.base import SecurityBase
+from starlette.concurrency import run_in_threadpool
+
+from core.config import config
+from core.lib.cache import MISSING, TTLCache, invalidation_bus
+from core.lib.exceptions import AuthenticationError, ServiceUnavailable
+
+if TYPE_CHECKING:
+    import grpc
 
 SAFE_METHODS = ["GET", "HEAD", "OPTIONS"]
 api_key_header = APIKeyHeader(
@@ -9,6 +25,9 @@ api_key_header = APIKeyHeader(
 oauth2_scheme = OAuth2PasswordBearer(
     tokenUrl="/onboarding/manage/user/token", auto_error=False
 )
+internal_token_header = APIKeyHeader(
+    name="X-Internal-Token", description="Internal token", auto_error=False
+)
 
 
 # HTTP_METHOD_MAPPING = {
@@ -50,6 +69,9 @@ class BasePermission(ABC):
 
     def __init__(self, request: Request):
         self.request = request
+        self.check(request)
+
+    def check(self, request: Request):
         if self.requires_authentication and not request.user.is_authenticated:
             if hasattr(request.state, "error"):
                 raise request.state.error
@@ -75,6 +97,15 @@ class IsAuthenticated(BasePermission):
         return True
 
 
+def require_internal_token(token: str | None = Depends(internal_token_header)):
+    """Route dependency for internal routes, see `config.internal_token`."""
+    expected = config.internal_token
+    if not (expected and token and secrets.compare_digest(token, expected)):
+        raise AuthenticationError(
+            exception_type="internal_token.invalid", msg="Invalid internal token"
+        )
+
+
 class IsStaffUser(IsAuthenticated):
     def __init__(self, request: Request, _: str = Depends(oauth2_scheme)):
         BasePermission.__init__(self, request)
@@ -102,9 +133,43 @@ def get_view(endpoint):
     return view
 
 
-def get_permission_key(endpoint, method):
-    view = get_view(endpoint)
-    action = endpoint
+# (model, action) -> bit, see `register_permissions`
+permission_bits: dict[tuple[str, str], int] = {}
+# (endpoint, method) -> (model, action), filled by `GenericViewSet.as_view`
+route_permission_keys: dict[tuple[Callable, str], tuple[str, str]] = {}
+
+
+def register_permissions(permissions: Iterable[tuple[str, str]]):
+    """
+    Give every `(model, action)` pair of a permission catalog its own bit.
+    Ids are positions in the catalog, so it must only ever be appended to.
+    """
+    for permission in permissions:
+        permission_bits.setdefault(tuple(permission), 1 << len(permission_bits))
+    compile_permissions.cache_clear()
+
+
+@lru_cache(maxsize=1024)
+def compile_permissions(permissions: frozenset[tuple[str, str]]) -> int:
+    """Bitset of the granted permissions, unknown pairs are ignored."""
+    mask = 0
+    for permission in permissions:
+        mask |= permission_bits.get(permission, 0)
+    return mask
+
+
+def get_route_permission_key(
+    view: Any,
+    name: str,
+    method: str,
+    is_action: bool = False,
+    permission_key: str | None = None,
+) -> tuple[str, str]:
+    """
+    The `(model, action)` a route of `view` requires. CRUD routes are named
+    after their method (`list`, `retrieve`, ...), `@action`s after their
+    function unless they set `permission_key`.
+    """
     if view.model:
         model_name = view.model.__name__
     else:
@@ -113,28 +178,203 @@ def get_permission_key(endpoint, method):
             .replace("ViewSet", "")
             .replace("viewset", "")
         )
-    if hasattr(action, "is_action"):
-        if hasattr(action.__func__, "permission_key"):
-            return model_name, action.__func__.permission_key
-        action_name = action.__name__
-        if method == "GET":
-            action_name = f"View {action_name}"
-    else:
-        action_name = action.__name__.replace("_wrapper", "").replace(
-            "initial_form_data", "update"
+    if permission_key:
+        return model_name, permission_key
+    if is_action and method == "GET":
+        name = f"View {name}"
+    name = name.replace("initial_form_data", "update").replace("_", " ")
+    return model_name, name.strip().title()
+
+
+def get_endpoint_permission_key(view: Any, endpoint: Callable, method: str):
+    if hasattr(endpoint, "is_action"):
+        action = endpoint.__func__
+        return get_route_permission_key(
+            view,
+            action.__name__,
+            method,
+            is_action=True,
+            permission_key=getattr(action, "permission_key", None),
         )
-    return model_name, action_name.replace("_", " ").strip().title()
+    return get_route_permission_key(
+        view, endpoint.__name__.replace("_wrapper", ""), method
+    )
+
+
+def get_permission_key(endpoint, method):
+    return get_endpoint_permission_key(get_view(endpoint), endpoint, method)
+
+
+def get_request_permission_key(request: Request) -> tuple[str, str] | None:
+    method = "GET" if request.method == "HEAD" else request.method
+    return route_permission_keys.get((request.scope.get("endpoint"), method))
+
+
+def get_route_permission_bit(request: Request) -> int:
+    key = get_request_permission_key(request)
+    return permission_bits.get(key, 0) if key else 0
+
+
+Check = tuple[str, str, str]  # (subject, model, action)
+
+
+class PermissionClient:
+    """
+    Client of the permission decision service, see
+    `core/protos/permissions.proto`.
+
+    Decisions are cached per `(subject, model, action)` for as long as the
+    server allows, capped at `cache_ttl`, so a repeated check is a dict
+    lookup. The misses of a `check_many` go out as one `BatchCheck`, and
+    calls are spread round-robin over `pool_size` channels. Staff and
+    policy invalidations on the cache bus drop the cached decisions.
+
+    grpc and the generated stubs are only imported once a client talks to
+    the service, services checking permissions in process never need them.
+    """
+
+    def __init__(
+        self,
+        target: str,
+        pool_size: int = 2,
+        timeout: float = 0.5,
+        cache_ttl: int = 30,
+        cache_size: int = 100000,
+        channel_factory: Callable[[], "grpc.Channel"] | None = None,
+    ):
+        self.target = target
+        self.pool_size = max(1, pool_size)
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.decisions = TTLCache(maxsize=cache_size)
+        self.channel_factory = channel_factory or self._insecure_channel
+        self.channels: list["grpc.Channel"] = []
+        self._stubs: list = []
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+        invalidation_bus.subscribe("principal:staff:", self.invalidate)
+        invalidation_bus.subscribe("principal:policy:", self.invalidate)
+
+    def invalidate(self, key: str | None):
+        # Writes are rare, not worth indexing decisions by subject
+        self.decisions.clear()
+
+    def _insecure_channel(self) -> "grpc.Channel":
+        import grpc
+
+        return grpc.insecure_channel(self.target)
+
+    def _stub(self):
+        if not self._stubs:
+            with self._lock:
+                if not self._stubs:
+                    from core.protos.permissions_pb2_grpc import PermissionServiceStub
+
+                    self.channels = [self.channel_factory() for _ in range(self.pool_size)]
+                    self._stubs = [PermissionServiceStub(x) for x in self.channels]
+        return self._stubs[next(self._next) % len(self._stubs)]
+
+    def _fetch(self, checks: list[Check]) -> dict[Check, bool]:
+        import grpc
+
+        from core.protos.permissions_pb2 import BatchCheckRequest, PermissionCheck
+
+        request = BatchCheckRequest(
+            checks=[PermissionCheck(subject=s, model=m, action=a) for s, m, a in checks]
+        )
+        try:
+            response = self._stub().BatchCheck(request, timeout=self.timeout)
+        except grpc.RpcError as exc:
+            raise ServiceUnavailable(
+                exception_type="permissions.unavailable",
+                msg="Permissions could not be checked, please try again.",
+                headers={"Retry-After": "1"},
+            ) from exc
+        decisions = {}
+        for check, decision in zip(checks, response.decisions):
+            decisions[check] = decision.allowed
+            ttl = min(self.cache_ttl, decision.ttl_seconds)
+            if ttl > 0:
+                self.decisions.set(check, decision.allowed, ttl=ttl)
+        return decisions
+
+    def _cached(self, checks: list[Check]) -> list:
+        return [self.decisions.get(check) for check in checks]
+
+    def check_many(self, checks: Iterable[Check]) -> list[bool]:
+        """Decisions for `checks`, in order, with at most one round trip."""
+        checks = list(checks)
+        results = self._cached(checks)
+        misses = [x for x, result in zip(checks, results) if result is MISSING]
+        if not misses:
+            return results
+        fetched = self._fetch(list(dict.fromkeys(misses)))
+        return [
+            fetched[x] if result is MISSING else result
+            for x, result in zip(checks, results)
+        ]
+
+    def check(self, subject: str, model: str, action: str) -> bool:
+        return self.check_many([(subject, model, action)])[0]
+
+    async def acheck_many(self, checks: Iterable[Check]) -> list[bool]:
+        """Same as `check_many`, a miss waits in the threadpool rather than
+        blocking the event loop."""
+        checks = list(checks)
+        results = self._cached(checks)
+        if MISSING not in results:
+            return results
+        return await run_in_threadpool(self.check_many, checks)
+
+    async def acheck(self, subject: str, model: str, action: str) -> bool:
+        return (await self.acheck_many([(subject, model, action)]))[0]
+
+    def close(self):
+        with self._lock:
+            for channel in self.channels:
+                channel.close()
+            self.channels, self._stubs = [], []
+
+
+permission_client = (
+    PermissionClient(
+        config.permission_service.target,
+        pool_size=config.permission_service.pool_size,
+        timeout=config.permission_service.timeout,
+        cache_ttl=config.permission_service.cache_seconds,
+        cache_size=config.permission_service.cache_size,
+    )
+    if config.permission_service.target
+    else None
+)
+
+
+async def get_remote_permission_mask(request: Request, subject: str) -> int:
+    """
+    The bit of the route's permission if the permission service grants it
+    to `subject`, to be used as `request.state.permission_mask`.
+    """
+    key = get_request_permission_key(request)
+    bit = permission_bits.get(key, 0) if key else 0
+    if not bit or permission_client is None:
+        return 0
+    return bit if await permission_client.acheck(subject, *key) else 0
 
 
 class IsBackofficeUser(IsStaffUser):
+    """
+    Backoffice staff whose permission policy grants the route's permission.
+    Routes without an entry in the permission catalog only need the scope.
+    """
+
     def has_permission(self, request: Request) -> bool:
-        # permission_key = list(
-        #     get_permission_key(request.get("endpoint"), request.method)
-        # )
-        return (
+        if not (
             super().has_permission(request) and "Backoffice" in request.auth.scopes
-            # and check_permissions(request, permission_key) # gRPC to be studied later
-        )
+        ):
+            return False
+        bit = get_route_permission_bit(request)
+        # The granted bits are attached by `attach_staff_user`
+        return not bit or bool(getattr(request.state, "permission_mask", 0) & bit)
 
 
 class IsUser(IsAuthenticated):
@@ -180,3 +420,72 @@ class IsETBOUser(IsAuthenticated):
             and request.user.is_active
             and ("Backoffice" in request.auth.scopes or "ET" in request.auth.scopes)
         )
+
+
+def route_requires_authentication(route) -> bool:
+    return any(
+        getattr(dep.dependency, "requires_authentication", False) is True
+        for dep in route.dependencies
+    )
+
+
+def get_security_dependencies(permission_class: Type[BasePermission]) -> list | None:
+    """
+    The security scheme dependencies of a permission class, None when its
+    constructor takes anything else and it has to stay a dependency itself.
+    """
+    dependencies = []
+    for name, param in signature(permission_class).parameters.items():
+        if name == "request":
+            continue
+        default = param.default
+        if not (
+            isinstance(default, params.Depends)
+            and isinstance(default.dependency, SecurityBase)
+        ):
+            return None
+        dependencies.append(default)
+    return dependencies
+
+
+class PermissionGuard:
+    """
+    Runs the permission classes of a route as one async dependency, with the
+    same checks, in the same order and with the same errors as depending on
+    each class. The security schemes the classes depend on are kept so they
+    still show up in the OpenAPI schema.
+    """
+
+    def __init__(self, permission_classes: Iterable[Type[BasePermission]]):
+        self.permission_classes = tuple(permission_classes)
+        self.requires_authentication = any(
+            x.requires_authentication for x in self.permission_classes
+        )
+        security = {}
+        for permission_class in self.permission_classes:
+            for dependency in get_security_dependencies(permission_class) or []:
+                security.setdefault(dependency.dependency, dependency)
+        self.__signature__ = Signature(
+            [Parameter("request", Parameter.POSITIONAL_OR_KEYWORD, annotation=Request)]
+            + [
+                Parameter(f"_security_{i}", Parameter.KEYWORD_ONLY, default=x)
+                for i, x in enumerate(security.values())
+            ]
+        )
+
+    async def __call__(self, request: Request, **_: Any):
+        for permission_class in self.permission_classes:
+            permission = permission_class.__new__(permission_class)
+            permission.request = request
+            permission.check(request)
+
+
+def permission_dependencies(
+    permission_classes: Iterable[Type[BasePermission]],
+) -> list[params.Depends]:
+    permission_classes = list(permission_classes)
+    if not permission_classes:
+        return []
+    if any(get_security_dependencies(x) is None for x in permission_classes):
+        return [Depends(x) for x in permission_classes]
+    return [Depends(PermissionGuard(permission_classes))]
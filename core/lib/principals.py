@@ -0,0 +1,108 @@
+import json
+import logging
+from typing import Any, Callable, Generic, Hashable, TypeVar
+
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from core.db.session import get_db_context
+from core.lib.cache import MISSING, TTLCache, invalidation_bus
+from core.redis import async_cache
+
+log = logging.getLogger("uvicorn")
+
+P = TypeVar("P")
+NOT_FOUND = b""
+
+
+class PrincipalCache(Generic[P]):
+    """
+    Read-through cache of the compact snapshot of an account that request
+    dependencies attach to `request.user`.
+
+    Lookups are served from process memory, then from Redis, and only then
+    loaded from Postgres in the threadpool. Ids that don't exist are cached
+    as well, for `negative_ttl` seconds. Writers don't call this class: the
+    models register `invalidate_on_commit` hooks that delete the Redis key
+    and publish it on the invalidation bus once their transaction commits.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        load: Callable[[Any, Hashable], P | None],
+        dump: Callable[[P], dict],
+        restore: Callable[[dict], P],
+        ttl: int,
+        negative_ttl: int,
+        maxsize: int,
+    ):
+        self.name = name
+        self.load = load
+        self.dump = dump
+        self.restore = restore
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.entries = TTLCache(maxsize=maxsize)
+        # Bumped on every invalidation, see SessionStateCache
+        self.epoch = 0
+        invalidation_bus.subscribe(self.key(""), self.invalidate)
+
+    def key(self, id: Hashable) -> str:
+        return f"principal:{self.name}:{id}"
+
+    def invalidate(self, key: str | None):
+        self.epoch += 1
+        if key is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(key)
+
+    def _load(self, id: Hashable, db: Session | None = None) -> P | None:
+        if db is None:
+            with get_db_context() as db:
+                return self.load(db, id)
+        started = not db.in_transaction()
+        try:
+            return self.load(db, id)
+        finally:
+            if started:
+                # Hands the connection back until the endpoint needs one
+                db.rollback()
+
+    async def get(self, id: Hashable, db: Session | None = None) -> P | None:
+        """`db`, usually the request's session, is used to load misses."""
+        key = self.key(id)
+        invalidation_bus.ensure_started()
+        trusted = invalidation_bus.healthy
+        if trusted:
+            principal = self.entries.get(key)
+            if principal is not MISSING:
+                return principal
+
+        epoch = self.epoch
+        try:
+            raw = await async_cache.get(key)
+        except Exception as exc:
+            log.warning(f"Could not read {key} from Redis: {exc}")
+            raw, trusted = None, False
+        if raw is not None:
+            principal = None if raw == NOT_FOUND else self.restore(json.loads(raw))
+        else:
+            principal = await run_in_threadpool(self._load, id, db)
+            # Skip storing a row read before an invalidation we just received
+            if epoch == self.epoch:
+                value = NOT_FOUND if principal is None else json.dumps(
+                    self.dump(principal), default=str
+                )
+                try:
+                    await async_cache.set(key, value, ex=self._ttl(principal))
+                except Exception as exc:
+                    log.warning(f"Could not cache {key} in Redis: {exc}")
+
+        if trusted and epoch == self.epoch:
+            self.entries.set(key, principal, ttl=self._ttl(principal))
+        return principal
+
+    def _ttl(self, principal: P | None) -> int:
+        return self.ttl if principal is not None else self.negative_ttl
@@ -0,0 +1,213 @@
+import asyncio
+import hashlib
+import logging
+import math
+import re
+import threading
+import time
+from typing import Awaitable, Callable, Iterable, Literal
+
+from fastapi import Depends, Request
+
+from core.config import config
+from core.lib.cache import MISSING, TTLCache
+from core.lib.exceptions import LimitExceeded
+from core.redis import async_cache
+
+log = logging.getLogger("uvicorn")
+
+RATE_PATTERN = re.compile(r"^\s*(\d+)\s*/\s*(\d*)\s*(second|minute|hour|day)s?\s*$")
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+# KEYS[1] bucket; ARGV rate (tokens/s), burst, cost.
+# Returns {allowed, seconds until `cost` tokens are available}.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+return {allowed, tostring(wait)}
+"""
+
+KeyFunc = Callable[[Request], Awaitable[str | None]]
+
+
+def parse_rate(rate: str) -> tuple[int, int]:
+    """`"5/minute"` or `"100/10 seconds"` to `(count, period in seconds)`."""
+    match = RATE_PATTERN.match(rate)
+    if not match:
+        raise ValueError(f"Invalid rate {rate!r}, expected e.g. '5/minute'")
+    count, multiplier, unit = match.groups()
+    return int(count), int(multiplier or 1) * PERIODS[unit]
+
+
+async def client_ip(request: Request) -> str | None:
+    if config.rate_limit.trust_forwarded_for:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else None
+
+
+async def device_id(request: Request) -> str | None:
+    return request.headers.get("device-id")
+
+
+def body_field(name: str) -> KeyFunc:
+    """Key on a field of the form or JSON body, which FastAPI has already
+    read by the time dependencies run."""
+
+    async def key(request: Request) -> str | None:
+        content_type = request.headers.get("content-type", "")
+        try:
+            if content_type.startswith("application/json"):
+                body = await request.json()
+            else:
+                body = await request.form()
+            value = body.get(name) if hasattr(body, "get") else None
+        except Exception:
+            return None
+        return str(value).strip().lower() if value else None
+
+    return key
+
+
+KEY_FUNCS: dict[str, KeyFunc] = {
+    "ip": client_ip,
+    "device": device_id,
+    "username": body_field("username"),
+}
+
+
+class LocalTokenBuckets:
+    """Per-process stand-in for the Redis script, same algorithm."""
+
+    def __init__(self, maxsize: int):
+        self.buckets = TTLCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: int, cost: int = 1) -> tuple[bool, float]:
+        now = time.monotonic()
+        with self._lock:
+            state = self.buckets.get(key)
+            tokens, ts = (burst, now) if state is MISSING else state
+            tokens = min(burst, tokens + max(0.0, now - ts) * rate)
+            allowed, wait = tokens >= cost, 0.0
+            if allowed:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / rate
+            self.buckets.set(key, (tokens, now), ttl=burst / rate)
+        return allowed, wait
+
+
+class RateLimiter:
+    """
+    Runs token buckets in Redis so every worker shares them. When Redis
+    fails or answers slower than `redis_timeout`, buckets are kept in
+    process for `fallback_seconds` before Redis is tried again, so an outage
+    never adds a connection timeout to each request.
+    """
+
+    def __init__(self):
+        self.local = LocalTokenBuckets(config.rate_limit.local_size)
+        self._script = None
+        self._fallback_until = 0.0
+
+    @property
+    def script(self):
+        if self._script is None:
+            self._script = async_cache.register_script(TOKEN_BUCKET_SCRIPT)
+        return self._script
+
+    async def take(self, key: str, rate: float, burst: int, cost: int = 1) -> tuple[bool, float]:
+        if time.monotonic() >= self._fallback_until:
+            try:
+                allowed, wait = await asyncio.wait_for(
+                    self.script(keys=[key], args=[rate, burst, cost]),
+                    timeout=config.rate_limit.redis_timeout,
+                )
+                return bool(allowed), float(wait)
+            except Exception as exc:
+                log.warning(f"Rate limiting in process, Redis unavailable: {exc!r}")
+                self._fallback_until = time.monotonic() + config.rate_limit.fallback_seconds
+        return self.local.take(key, rate, burst, cost)
+
+
+rate_limiter = RateLimiter()
+
+
+class RateLimit:
+    """
+    Dependency allowing `rate` requests per client, e.g. `"5/minute"`,
+    with bursts of up to `burst` requests (defaults to the count).
+
+    `key` picks the client: `"ip"`, `"device"` (device-id header),
+    `"username"` (body field), or an async callable returning the key.
+    Requests without a key are not limited by this rule. Rejections raise
+    `LimitExceeded` with Retry-After, before the endpoint runs.
+
+        @router.post("/token", dependencies=[Depends(RateLimit("10/minute"))])
+
+        @action(method="POST", rate_limit=RateLimit("5/hour", key="username"))
+    """
+
+    def __init__(
+        self,
+        rate: str,
+        key: Literal["ip", "device", "username"] | KeyFunc = "ip",
+        burst: int | None = None,
+        scope: str | None = None,
+    ):
+        count, period = parse_rate(rate)
+        self.rate = count / period
+        self.burst = burst or count
+        self.key_func = KEY_FUNCS[key] if isinstance(key, str) else key
+        self.key_name = key if isinstance(key, str) else key.__name__
+        self.scope = scope
+
+    def bucket(self, request: Request, value: str) -> str:
+        scope = self.scope
+        if scope is None:
+            route = request.scope.get("route")
+            path = getattr(route, "path", None) or request.url.path
+            scope = request.scope.get("root_path", "") + path
+        digest = hashlib.blake2b(value.encode(), digest_size=12).hexdigest()
+        return f"ratelimit:{scope}:{self.key_name}:{digest}"
+
+    async def __call__(self, request: Request):
+        if not config.rate_limit.enable:
+            return
+        value = await self.key_func(request)
+        if not value:
+            return
+        allowed, wait = await rate_limiter.take(
+            self.bucket(request, value), self.rate, self.burst
+        )
+        if not allowed:
+            raise LimitExceeded(
+                exception_type="request.rate_limited",
+                msg="Too many requests, please try again later.",
+                headers={"Retry-After": str(max(1, math.ceil(wait)))},
+            )
+
+
+def rate_limit_dependencies(limits: RateLimit | Iterable[RateLimit]) -> list:
+    if isinstance(limits, RateLimit):
+        limits = [limits]
+    return [Depends(limit) for limit in limits]
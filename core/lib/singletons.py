@@ -0,0 +1,128 @@
+import copy
+import hashlib
+import logging
+import uuid
+from typing import Any
+
+from sqlalchemy import func, inspect, select
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from core.lib.cache import MISSING, TTLCache, invalidate_on_commit, invalidation_bus
+from core.redis import cache
+
+log = logging.getLogger("uvicorn")
+
+PREFIX = "singleton:"
+# Token of entries stored while the bus was healthy, never equal to Redis'
+UNVERSIONED = object()
+
+
+def singleton_key(model: type) -> str:
+    return f"{PREFIX}{model.__table__.name}"
+
+
+def advisory_lock_id(name: str) -> int:
+    """Stable signed 64-bit id for `pg_advisory_xact_lock`."""
+    return int.from_bytes(hashlib.blake2b(name.encode(), digest_size=8).digest(), "big", signed=True)
+
+
+class SingletonCache:
+    """
+    Process-local cache of singleton configuration rows.
+
+    Each entry is tagged with the version token stored in Redis under the
+    model's key. Commits that change the row delete that key and publish it
+    on the invalidation bus (see `invalidate_on_commit`), which drops the
+    local entry. Models are registered when they are defined, so processes
+    that only write publish invalidations too. While the bus is healthy
+    Redis is not asked at all; otherwise the token is read from Redis and a
+    mismatch means the row changed. Only when Redis is unreachable is the
+    row read from Postgres every time.
+    """
+
+    def __init__(self, ttl: float = 300):
+        self.entries = TTLCache(maxsize=1000, ttl=ttl)
+        self.epoch = 0
+        self._registered: set[type] = set()
+        invalidation_bus.subscribe(PREFIX, self.invalidate)
+
+    def invalidate(self, key: str | None):
+        self.epoch += 1
+        if key is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(key)
+
+    def register(self, model: type):
+        if model not in self._registered:
+            self._registered.add(model)
+            invalidate_on_commit(model, lambda instance: [singleton_key(type(instance))])
+
+    def version(self, key: str) -> str | None:
+        """Current version token, a new one after an invalidation deleted it."""
+        try:
+            token = cache.get(key)
+            if token is None:
+                token = uuid.uuid4().hex.encode()
+                if not cache.set(key, token, nx=True):
+                    token = cache.get(key)
+            return token
+        except Exception as exc:
+            log.warning(f"Could not read {key} from Redis: {exc}")
+            return None
+
+    def get(self, session: Session, model: type) -> Any:
+        self.register(model)
+        key = singleton_key(model)
+        entry = self.entries.get(key)
+        if invalidation_bus.healthy:
+            # Changes arrive on the bus; the entry is checked against Redis
+            # only if it outlives the subscription
+            token = UNVERSIONED
+        else:
+            token = self.version(key)
+        if entry is not MISSING and (token is UNVERSIONED or entry[0] == token):
+            return self._attach(session, model, entry[1])
+
+        epoch = self.epoch
+        instance = get_or_create_singleton(session, model)
+        # Skip storing a row read before an invalidation we just received
+        if token is not None and epoch == self.epoch:
+            snapshot = {
+                attr.key: copy.deepcopy(getattr(instance, attr.key))
+                for attr in inspect(model).column_attrs
+            }
+            self.entries.set(key, (token, snapshot))
+        return instance
+
+    def _attach(self, session: Session, model: type, snapshot: dict) -> Any:
+        # A persistent instance without a query, as if it had been loaded
+        instance = model(**copy.deepcopy(snapshot))
+        make_transient_to_detached(instance)
+        return session.merge(instance, load=False)
+
+
+singleton_cache = SingletonCache()
+
+
+def get_or_create_singleton(session: Session, model: type) -> Any:
+    """
+    The singleton row of `model`, inserted from `initial_data` when there is
+    none yet. Concurrent first calls serialize on an advisory lock, so only
+    one of them inserts.
+    """
+    instance = session.query(model).first()
+    if instance is not None:
+        return instance
+    session.execute(select(func.pg_advisory_xact_lock(advisory_lock_id(singleton_key(model)))))
+    instance = session.query(model).first()
+    if instance is None:
+        instance = model(**getattr(model, "initial_data", {}))
+        session.add(instance)
+    # Releases the lock
+    session.commit()
+    return instance
+
+
+def get_singleton(session: Session, model: type) -> Any:
+    return singleton_cache.get(session, model)
@@ -0,0 +1,286 @@
+import dataclasses
+import hashlib
+import json
+import mimetypes
+import os
+import tempfile
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, BinaryIO, Iterable
+
+from core.config import config
+from core.lib.exceptions import NotFound, PayloadTooLarge
+
+
+@dataclass(frozen=True)
+class StoredFile:
+    key: str
+    size: int
+    sha256: str
+    content_type: str | None = None
+    etag: str | None = None
+
+
+class MultipartETag:
+    """
+    Computes the ETag S3 would return for an object uploaded in parts of
+    `part_size` bytes: plain md5 for a single part, otherwise the md5 of the
+    concatenated part digests suffixed with the number of parts.
+    """
+
+    def __init__(self, part_size: int):
+        self.part_size = part_size
+        self.parts: list[bytes] = []
+        self._current = hashlib.md5()
+        self._current_size = 0
+
+    def update(self, chunk: bytes):
+        view = memoryview(chunk)
+        while view:
+            take = min(len(view), self.part_size - self._current_size)
+            self._current.update(view[:take])
+            self._current_size += take
+            view = view[take:]
+            if self._current_size == self.part_size:
+                self.parts.append(self._current.digest())
+                self._current = hashlib.md5()
+                self._current_size = 0
+
+    def hexdigest(self) -> str:
+        parts = list(self.parts)
+        if self._current_size or not parts:
+            parts.append(self._current.digest())
+        if len(parts) == 1:
+            return parts[0].hex()
+        return f"{hashlib.md5(b''.join(parts)).hexdigest()}-{len(parts)}"
+
+
+class BaseStorage(ABC):
+    """
+    Storage backends stream a file object to a temporary file next to their
+    final location, hashing it on the fly and enforcing the size limit, then
+    move it into place. The file is never read into memory as a whole.
+    """
+
+    def __init__(
+        self,
+        root: str | None = None,
+        chunk_size: int | None = None,
+        max_size: int | None = None,
+    ):
+        self.root = root or config.storage.root
+        self.chunk_size = chunk_size or config.storage.chunk_size
+        self.max_size = max_size or config.storage.max_upload_size
+        self.tmp_dir = os.path.join(self.root, ".tmp")
+
+    @abstractmethod
+    def path(self, key: str) -> str: ...
+
+    @abstractmethod
+    def _commit(self, tmp_path: str, stored: StoredFile) -> StoredFile: ...
+
+    def generate_key(self, filename: str | None = None, prefix: str = "") -> str:
+        ext = os.path.splitext(filename or "")[1].lower()
+        key = f"{uuid.uuid4().hex}{ext}"
+        return f"{prefix.strip('/')}/{key}" if prefix else key
+
+    def _hashers(self) -> dict[str, Any]:
+        return {"sha256": hashlib.sha256()}
+
+    def save(
+        self,
+        fileobj: BinaryIO,
+        filename: str | None = None,
+        content_type: str | None = None,
+        prefix: str = "",
+        max_size: int | None = None,
+        loc: list[str] | None = None,
+    ) -> StoredFile:
+        max_size = max_size or self.max_size
+        hashers = self._hashers()
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                while chunk := fileobj.read(self.chunk_size):
+                    size += len(chunk)
+                    if size > max_size:
+                        raise PayloadTooLarge(
+                            exception_type="file.too_large",
+                            msg=f"File must not be larger than {max_size} bytes.",
+                            loc=loc,
+                        )
+                    for hasher in hashers.values():
+                        hasher.update(chunk)
+                    tmp.write(chunk)
+            stored = StoredFile(
+                key=self.generate_key(filename, prefix),
+                size=size,
+                sha256=hashers["sha256"].hexdigest(),
+                content_type=content_type
+                or mimetypes.guess_type(filename or "")[0]
+                or "application/octet-stream",
+                etag=hashers["etag"].hexdigest() if "etag" in hashers else None,
+            )
+            return self._commit(tmp_path, stored)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def exists(self, key: str) -> bool:
+        try:
+            return os.path.isfile(self.path(key))
+        except NotFound:
+            return False
+
+    def open(self, key: str) -> BinaryIO:
+        try:
+            return open(self.path(key), "rb")
+        except FileNotFoundError:
+            raise NotFound(exception_type="file.not_found", msg="File not found")
+
+    def delete(self, key: str):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def etag(self, key: str) -> str:
+        stat_result = os.stat(self.path(key))
+        return f"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"
+
+    def _safe_join(self, *parts: str) -> str:
+        path = os.path.normpath(os.path.join(self.root, *parts))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise NotFound(exception_type="file.not_found", msg="File not found")
+        return path
+
+
+class FileSystemStorage(BaseStorage):
+    """
+    Content-addressed store. Blobs are kept under `blobs/<ab>/<cd>/<sha256>`
+    and the key is the digest plus the original extension, so uploading the
+    same bytes again shares the existing blob instead of writing a copy.
+    """
+
+    def generate_key(self, filename: str | None = None, prefix: str = "") -> str:
+        # The real key is only known once the content has been hashed
+        return os.path.splitext(filename or "")[1].lower()
+
+    def digest(self, key: str) -> str:
+        return os.path.splitext(os.path.basename(key))[0]
+
+    def path(self, key: str) -> str:
+        digest = self.digest(key)
+        return self._safe_join("blobs", digest[:2], digest[2:4], digest)
+
+    def etag(self, key: str) -> str:
+        return self.digest(key)
+
+    def _commit(self, tmp_path: str, stored: StoredFile) -> StoredFile:
+        stored = dataclasses.replace(stored, key=f"{stored.sha256}{stored.key}")
+        path = self.path(stored.key)
+        try:
+            # A new reference, keep the blob from `collect_garbage` as if new
+            os.utime(path)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        return stored
+
+    def delete(self, key: str):
+        # Blobs may be shared by several rows, so they are never removed on
+        # behalf of a single one, see `collect_garbage`.
+        pass
+
+    def collect_garbage(self, referenced_keys: Iterable[str], grace_seconds: float = 86400) -> int:
+        """
+        Remove blobs no key in `referenced_keys` points to, the keys still
+        stored in the database, and return how many were removed. Blobs
+        younger than `grace_seconds` are kept, their rows may not be
+        committed yet.
+        """
+        referenced = {self.digest(key) for key in referenced_keys if key}
+        cutoff = time.time() - grace_seconds
+        removed = 0
+        for directory, _, names in os.walk(os.path.join(self.root, "blobs")):
+            for name in names:
+                path = os.path.join(directory, name)
+                if name in referenced or os.stat(path).st_mtime > cutoff:
+                    continue
+                os.remove(path)
+                removed += 1
+        return removed
+
+
+class S3Storage(BaseStorage):
+    """
+    Local stand-in for S3. Objects live under `<root>/<bucket>/<key>` with a
+    sidecar holding what `head_object` would return, including the multipart
+    ETag for the configured part size.
+    """
+
+    part_size = 8 * 1024 * 1024  # boto3's default multipart chunk size
+
+    def __init__(self, bucket: str | None = None, **kwargs):
+        super().__init__(**kwargs)
+        self.bucket = bucket or config.storage.bucket
+
+    def path(self, key: str) -> str:
+        return self._safe_join(self.bucket, key)
+
+    def _meta_path(self, key: str) -> str:
+        return self.path(key) + ".meta.json"
+
+    def _hashers(self) -> dict[str, Any]:
+        hashers = super()._hashers()
+        hashers["etag"] = MultipartETag(self.part_size)
+        return hashers
+
+    def _commit(self, tmp_path: str, stored: StoredFile) -> StoredFile:
+        path = self.path(stored.key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(self._meta_path(stored.key), "w") as meta:
+            json.dump(
+                {
+                    "ContentLength": stored.size,
+                    "ContentType": stored.content_type,
+                    "ETag": f'"{stored.etag}"',
+                    "ChecksumSHA256": stored.sha256,
+                },
+                meta,
+            )
+        os.replace(tmp_path, path)
+        return stored
+
+    def etag(self, key: str) -> str:
+        return self.head(key)["ETag"].strip('"')
+
+    def head(self, key: str) -> dict:
+        try:
+            with open(self._meta_path(key)) as meta:
+                return json.load(meta)
+        except FileNotFoundError:
+            raise NotFound(exception_type="file.not_found", msg="File not found")
+
+    def delete(self, key: str):
+        super().delete(key)
+        try:
+            os.remove(self._meta_path(key))
+        except FileNotFoundError:
+            pass
+
+
+STORAGE_CLASSES = {
+    "FileSystemStorage": FileSystemStorage,
+    "S3Storage": S3Storage,
+}
+
+
+@lru_cache()
+def get_storage() -> BaseStorage:
+    return STORAGE_CLASSES[config.storage_class]()
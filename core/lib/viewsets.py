@@ -36,12 +36,23 @@ from typing import (
 from uuid import UUID
 
 from core.db import Base
-from core.db.session import get_db
+from core.db.deadlines import deadline_dependencies
+from core.db.profiles import profile_dependencies
+from core.db.retry import default_retry_policy
+from core.db.session import get_db, get_read_db
 # from core.kafka import producer
 from core.lib.exception_handlers import handle_integrity_error
 from core.lib.exceptions import NotFound
-# from core.lib.file import save_upload_file
-from core.lib.permissions import BasePermission
+from core.lib.file import delete_stored_files, save_upload_file
+from core.lib.media import presign_media
+from core.lib.permissions import (
+    BasePermission,
+    get_endpoint_permission_key,
+    permission_dependencies,
+    route_permission_keys,
+)
+from core.lib.ratelimit import rate_limit_dependencies
+from core.lib.singletons import get_singleton
 
 NOT_FOUND_MESSAGE: str = "Resource not found"
 
@@ -148,6 +159,7 @@ class UpdateViewProtocol(ViewSetProtocol, Protocol):
     update_schema: Type[BaseModel] | None
     _create_signature_for_upload_file: Callable[..., Signature]
     _update_wrapper: Callable[..., Callable[..., Any]]
+    _stored_keys: Callable[..., list[str]]
     update_with_upload: Callable[..., Any]
     update: Callable[..., Any]
 
@@ -200,7 +212,9 @@ class ListMixin:
         #                                           })
         # return [schema_class(**obj.__dict__) for obj in data.all()]
         # return list_class.parse_obj(data.all())
-        return data.all()
+        data = data.all()
+        presign_media(self.get_schema_class("list"), data)
+        return data
 
     def paginate_queryset(self: ListViewSetProtocol, queryset):
         if self.page_size:
@@ -229,12 +243,12 @@ class ListMixin:
         return queryset
 
     def _list_wrapper(
-        self: ListViewSetProtocol, request: Request, db: Session = Depends(get_db)
+        self: ListViewSetProtocol, request: Request, db: Session = Depends(get_read_db)
     ):
         self.action = "list"
         self.db = db
         self.request = process_request(self, request)
-        return self.list()
+        return default_retry_policy.call(self.list, db)
 
     def list(self: ListViewSetProtocol):
         qs = self.get_queryset()
@@ -251,17 +265,27 @@ class RetrieveMixin:
         self: RetrieveViewSetProtocol,
         id: int | UUID,
         request: Request,
-        db: Session = Depends(get_db),
+        db: Session = Depends(get_read_db),
     ):
         self.action = "retrieve"
         self.db = db
         self.request = process_request(self, request)
-        return self.retrieve()
+        return default_retry_policy.call(self.retrieve, db)
 
     def retrieve(self: ViewSetProtocol):
         return self.get_object()
 
 
+def get_upload_fields(schema: Type[BaseModel] | None) -> set[str]:
+    if not schema:
+        return set()
+    return {
+        field_name
+        for field_name, field_value in schema.__fields__.items()
+        if field_value.type_ == UploadFile
+    }
+
+
 def process_request(viewset, request: Request) -> Request:
     if hasattr(viewset, "db") and viewset.db:
         request.state.db = viewset.db
@@ -294,17 +318,25 @@ class CreateMixin:
         self.db = db
         self.request = process_request(self, request)
         model_kwargs = {}
-        for field_name, field_value in kwargs.items():
-            if field_value.__class__.__name__ == "UploadFile":
-                # field_value = save_upload_file(field_value)
-                pass
-            model_kwargs[field_name] = field_value
-        obj = self.model(**model_kwargs)
-        self.db.add(obj)
+        stored_keys = []
         try:
+            for field_name, field_value in kwargs.items():
+                if field_value.__class__.__name__ == "UploadFile":
+                    field_value = save_upload_file(
+                        field_value, prefix=self.model.__tablename__, field_name=field_name
+                    )
+                    stored_keys.append(field_value)
+                model_kwargs[field_name] = field_value
+            obj = self.model(**model_kwargs)
+            self.db.add(obj)
             self.db.commit()
         except IntegrityError as exc:
+            delete_stored_files(stored_keys)
             handle_integrity_error(self.db, exc)
+        except BaseException:
+            # No row points at the uploads
+            delete_stored_files(stored_keys)
+            raise
         self.db.refresh(obj)
         return obj
 
@@ -312,10 +344,7 @@ class CreateMixin:
         # If the schema contains UploadFile, generate a function and spread the pydantic
         # schema fields as function parameters
         # TODO Support list[UploadFile]
-        if schema and any(
-            field_value.type_ == UploadFile
-            for field_value in schema.__fields__.values()
-        ):
+        if get_upload_fields(schema):
             func_sig = self._create_signature_for_upload_file(schema)
 
             def _create_(*args, **kwargs):
@@ -383,22 +412,52 @@ class UpdateMixin:
         self.action = "update"
         self.db = db
         self.request = process_request(self, request)
+        upload_fields = get_upload_fields(
+            self.update_schema or self.form_schema or self.schema
+        )
         model_kwargs = {}
-        for field_name, field_value in kwargs.items():
-            if field_value.__class__.__name__ == "UploadFile":
-                # field_value = save_upload_file(field_value)
-                pass
-            model_kwargs[field_name] = field_value
-        obj_id = model_kwargs.pop("id")
-        self.db.query(self.model).filter(self.model.id == obj_id).update(model_kwargs)
-        self.db.commit()
+        stored_keys = []
+        try:
+            for field_name, field_value in kwargs.items():
+                if field_value.__class__.__name__ == "UploadFile":
+                    field_value = save_upload_file(
+                        field_value, prefix=self.model.__tablename__, field_name=field_name
+                    )
+                    stored_keys.append(field_value)
+                elif field_name in upload_fields and field_value is None:
+                    # File not sent, keep the one already stored
+                    continue
+                model_kwargs[field_name] = field_value
+            obj_id = model_kwargs.pop("id")
+            replaced_keys = self._stored_keys(
+                obj_id, [x for x in upload_fields if x in model_kwargs]
+            )
+            self.db.query(self.model).filter(self.model.id == obj_id).update(
+                model_kwargs
+            )
+            self.db.commit()
+        except IntegrityError as exc:
+            delete_stored_files(stored_keys)
+            handle_integrity_error(self.db, exc)
+        except BaseException:
+            delete_stored_files(stored_keys)
+            raise
+        # Only once no row points at them any more
+        delete_stored_files([x for x in replaced_keys if x not in stored_keys])
         return self.db.query(self.model).filter(self.model.id == obj_id).first()
 
+    def _stored_keys(self: UpdateViewProtocol, obj_id: int | UUID, fields: list[str]) -> list[str]:
+        if not fields:
+            return []
+        row = (
+            self.db.query(*[getattr(self.model, x) for x in fields])
+            .filter(self.model.id == obj_id)
+            .first()
+        )
+        return [x for x in row or [] if x]
+
     def _update_wrapper(self: UpdateViewProtocol, schema: Type[BaseModel]):
-        if schema and any(
-            field_value.type_ == UploadFile
-            for field_value in schema.__fields__.values()
-        ):
+        if get_upload_fields(schema):
             func_sig = self._create_signature_for_upload_file(schema, id_path=True)
 
             def _update_(*args, **kwargs):
@@ -595,6 +654,10 @@ class GenericViewSet:
     is_singleton: bool = False
     authentication: bool = False
     permission_classes: List[Type[BasePermission]] = []
+    # Seconds each route may take, None for `request_timeout`
+    timeout: float | None = None
+    # Postgres settings for the routes, see `core/db/profiles.py`
+    settings_profile: str | dict[str, str] | None = None
 
     @classmethod
     def add_to(cls, app: FastAPI, prefix=None, tag=None, tags=[]):
@@ -651,9 +714,9 @@ class GenericViewSet:
 
         if self.permission_classes:
             self.authentication = True
-            permission_dependencies = [Depends(x) for x in self.permission_classes]
+            guard_dependencies = permission_dependencies(self.permission_classes)
         else:
-            permission_dependencies = []
+            guard_dependencies = []
 
         # for name in dir(cls):
         for name in names:
@@ -662,20 +725,38 @@ class GenericViewSet:
                 url_path = func.url_path if hasattr(func, "url_path") else ""
                 detail = func.detail
                 methods = func.methods
-                extra_kwargs = func.extra_kwargs
-                dependencies = func.dependencies
+                # Copies, as_view may run more than once for the same class
+                extra_kwargs = dict(func.extra_kwargs)
+                dependencies = list(func.dependencies)
 
                 if "permission_classes" in extra_kwargs:
                     permission_classes = extra_kwargs.pop("permission_classes")
                     if permission_classes:
                         func.permission_classes = permission_classes
-                        dependencies.extend([Depends(x) for x in permission_classes])
-                elif permission_dependencies:
-                    dependencies.extend(permission_dependencies)
+                        dependencies.extend(permission_dependencies(permission_classes))
+                elif guard_dependencies:
+                    dependencies.extend(guard_dependencies)
+
+                rate_limits = extra_kwargs.pop("rate_limit", None)
+                if rate_limits:
+                    # Ahead of the permission guard, rejections stay cheap
+                    dependencies[:0] = rate_limit_dependencies(rate_limits)
+
+                # First, so the guards' own queries are bounded too
+                timeout = extra_kwargs.pop("timeout", self.timeout)
+                profile = extra_kwargs.pop("settings_profile", self.settings_profile)
+                dependencies[:0] = deadline_dependencies(timeout) + profile_dependencies(
+                    profile
+                )
 
                 if extra_kwargs.get("permission_key"):
                     func.permission_key = extra_kwargs.pop("permission_key")
 
+                # Read-only GET actions may opt in to the read replicas
+                replica = extra_kwargs.pop("replica", False) and set(
+                    methods or ["GET"]
+                ) <= {"GET", "HEAD"}
+
                 wrapped_func = action_func(cls(*args, **kwargs), func)
 
                 # Update the signature to exclude the 'self' parameter
@@ -722,7 +803,7 @@ class GenericViewSet:
                         "db",
                         kind=Parameter.POSITIONAL_OR_KEYWORD,
                         annotation=Session,
-                        default=Depends(get_db),
+                        default=Depends(get_read_db if replica else get_db),
                     ),
                 )
 
@@ -754,9 +835,11 @@ class GenericViewSet:
                     **extra_kwargs,
                 )
 
-        dependencies = []
-        if permission_dependencies:
-            dependencies = permission_dependencies
+        dependencies = (
+            deadline_dependencies(self.timeout)
+            + profile_dependencies(self.settings_profile)
+            + guard_dependencies
+        )
 
         # TODO Move this to SingletonModelViewSet
         if self.is_singleton:
@@ -831,6 +914,13 @@ class GenericViewSet:
                     dependencies=dependencies,
                 )
 
+        # Resolve the permission each route requires once, see IsBackofficeUser
+        for route in router.routes:
+            for method in route.methods:
+                route_permission_keys[(route.endpoint, method)] = (
+                    get_endpoint_permission_key(self, route.endpoint, method)
+                )
+
         return router, self
 
     def _create_signature_for_upload_file(
@@ -971,15 +1061,7 @@ class GenericModelViewSet(GenericViewSet):
 
 class SingletonModelViewSet(GenericModelViewSet):
     def get_object(self: ViewSetProtocol):
-        instance = self.db.query(self.model).first()
-        if instance is None:
-            default_data = (
-                self.model.initial_data if hasattr(self.model, "initial_data") else {}
-            )
-            instance = self.model(**default_data)
-            self.db.add(instance)
-            self.db.commit()
-        return instance
+        return get_singleton(self.db, self.model)
 
     def retrieve(
         self: ViewSetProtocol, request: Request, db: Session = Depends(get_db)
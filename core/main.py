@@ -1,13 +1,16 @@
 import logging
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.utils import get_openapi
 from psycopg2 import OperationalError
+from psycopg import DatabaseError as PsycopgDatabaseError
 from psycopg2.errors import DatabaseError as Psycopg2DatabaseError
 from sqlalchemy.exc import DatabaseError, IntegrityError
 
 from core.config import config
-from core.db.session import get_db_context
+from core.db.deadlines import DeadlineMiddleware, deadline_exceeded, is_query_canceled
+from core.db.session import RequestSessionMiddleware
 from core.lib.authentication import AuthenticationMiddleware, JWTAuthBackend
 
 # from pathlib import Path
@@ -26,12 +29,25 @@ manage_tags_metadata = [{"name": x} for x in manage_tags]
 
 
 def handle_db_error(request: Request, exc):
-    with get_db_context() as db:
+    # Only the request's own session can hold the failed transaction
+    db = getattr(request.state, "db", None)
+    if db is not None:
         db.rollback()
+    if is_query_canceled(exc):
+        # The request's statement_timeout, see `core/db/deadlines.py`
+        error = deadline_exceeded()
+        return JSONResponse(
+            {"detail": error.detail}, status_code=error.status_code, headers=error.headers
+        )
     raise exc
 
 
-def create_app(**kwargs):
+def create_app(mounted: bool = False, **kwargs):
+    """
+    Apps that are only ever mounted inside another app created here
+    (`mounted=True`) get no middleware of their own: authentication, CORS
+    and the debug toolbar already ran in the outer app for the same scope.
+    """
     swagger_ui_parameters = {
         "defaultModelsExpandDepth": -1,  # Disable Schemas shown in Swagger
         "displayRequestDuration": True,
@@ -41,6 +57,21 @@ def create_app(**kwargs):
     app = FastAPI(
         debug=config.debug, swagger_ui_parameters=swagger_ui_parameters, **kwargs
     )
+    app.add_exception_handler(Psycopg2DatabaseError, handle_db_error)
+    app.add_exception_handler(PsycopgDatabaseError, handle_db_error)
+    app.add_exception_handler(DatabaseError, handle_db_error)
+    # The following two may not be required since the super classes are already handled.
+    app.add_exception_handler(IntegrityError, handle_db_error)
+    app.add_exception_handler(OperationalError, handle_db_error)
+
+    # custom merchant exception
+
+    if not mounted:
+        add_middleware(app)
+    return app
+
+
+def add_middleware(app: FastAPI):
     try:
         from core.debug.debug_toolbar import DebugToolbarMiddleware
 
@@ -62,14 +93,9 @@ def create_app(**kwargs):
         AuthenticationMiddleware,
         backend=JWTAuthBackend(),
     )
-
-    app.add_exception_handler(Psycopg2DatabaseError, handle_db_error)
-    app.add_exception_handler(DatabaseError, handle_db_error)
-    # The following two may not be required since the super classes are already handled.
-    app.add_exception_handler(IntegrityError, handle_db_error)
-    app.add_exception_handler(OperationalError, handle_db_error)
-
-    # custom merchant exception
+    app.add_middleware(RequestSessionMiddleware)
+    # Outside the request session, so its deadline covers authentication
+    app.add_middleware(DeadlineMiddleware)
 
     # This has to be the last middleware to be added to the application.
     app.add_middleware(
@@ -79,7 +105,6 @@ def create_app(**kwargs):
         allow_methods=["*"],
         allow_headers=["*"],
     )
-    return app
 
 
 def app_openapi(app, service_name, manage=False, tags={}):
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Generated by the protocol buffer compiler.  DO NOT EDIT!
+# NO CHECKED-IN PROTOBUF GENCODE
+# source: core/protos/permissions.proto
+# Protobuf Python Version: 7.35.1
+"""Generated protocol buffer code."""
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import descriptor_pool as _descriptor_pool
+from google.protobuf import runtime_version as _runtime_version
+from google.protobuf import symbol_database as _symbol_database
+from google.protobuf.internal import builder as _builder
+_runtime_version.ValidateProtobufRuntimeVersion(
+    _runtime_version.Domain.PUBLIC,
+    7,
+    35,
+    1,
+    '',
+    'core/protos/permissions.proto'
+)
+# @@protoc_insertion_point(imports)
+
+_sym_db = _symbol_database.Default()
+
+
+
+
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x1d\x63ore/protos/permissions.proto\x12\x0bpermissions\"A\n\x0fPermissionCheck\x12\x0f\n\x07subject\x18\x01 \x01(\t\x12\r\n\x05model\x18\x02 \x01(\t\x12\x0e\n\x06\x61\x63tion\x18\x03 \x01(\t\"0\n\x08\x44\x65\x63ision\x12\x0f\n\x07\x61llowed\x18\x01 \x01(\x08\x12\x13\n\x0bttl_seconds\x18\x02 \x01(\r\"A\n\x11\x42\x61tchCheckRequest\x12,\n\x06\x63hecks\x18\x01 \x03(\x0b\x32\x1c.permissions.PermissionCheck\">\n\x12\x42\x61tchCheckResponse\x12(\n\tdecisions\x18\x01 \x03(\x0b\x32\x15.permissions.Decision2\xa0\x01\n\x11PermissionService\x12<\n\x05\x43heck\x12\x1c.permissions.PermissionCheck\x1a\x15.permissions.Decision\x12M\n\nBatchCheck\x12\x1e.permissions.BatchCheckRequest\x1a\x1f.permissions.BatchCheckResponseb\x06proto3')
+
+_globals = globals()
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'core.protos.permissions_pb2', _globals)
+if not _descriptor._USE_C_DESCRIPTORS:
+  DESCRIPTOR._loaded_options = None
+  _globals['_PERMISSIONCHECK']._serialized_start=46
+  _globals['_PERMISSIONCHECK']._serialized_end=111
+  _globals['_DECISION']._serialized_start=113
+  _globals['_DECISION']._serialized_end=161
+  _globals['_BATCHCHECKREQUEST']._serialized_start=163
+  _globals['_BATCHCHECKREQUEST']._serialized_end=228
+  _globals['_BATCHCHECKRESPONSE']._serialized_start=230
+  _globals['_BATCHCHECKRESPONSE']._serialized_end=292
+  _globals['_PERMISSIONSERVICE']._serialized_start=295
+  _globals['_PERMISSIONSERVICE']._serialized_end=455
+# @@protoc_insertion_point(module_scope)
@@ -0,0 +1,37 @@
+from google.protobuf.internal import containers as _containers
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import message as _message
+from collections.abc import Iterable as _Iterable, Mapping as _Mapping
+from typing import ClassVar as _ClassVar, Optional as _Optional, Union as _Union
+
+DESCRIPTOR: _descriptor.FileDescriptor
+
+class PermissionCheck(_message.Message):
+    __slots__ = ("subject", "model", "action")
+    SUBJECT_FIELD_NUMBER: _ClassVar[int]
+    MODEL_FIELD_NUMBER: _ClassVar[int]
+    ACTION_FIELD_NUMBER: _ClassVar[int]
+    subject: str
+    model: str
+    action: str
+    def __init__(self, subject: _Optional[str] = ..., model: _Optional[str] = ..., action: _Optional[str] = ...) -> None: ...
+
+class Decision(_message.Message):
+    __slots__ = ("allowed", "ttl_seconds")
+    ALLOWED_FIELD_NUMBER: _ClassVar[int]
+    TTL_SECONDS_FIELD_NUMBER: _ClassVar[int]
+    allowed: bool
+    ttl_seconds: int
+    def __init__(self, allowed: _Optional[bool] = ..., ttl_seconds: _Optional[int] = ...) -> None: ...
+
+class BatchCheckRequest(_message.Message):
+    __slots__ = ("checks",)
+    CHECKS_FIELD_NUMBER: _ClassVar[int]
+    checks: _containers.RepeatedCompositeFieldContainer[PermissionCheck]
+    def __init__(self, checks: _Optional[_Iterable[_Union[PermissionCheck, _Mapping]]] = ...) -> None: ...
+
+class BatchCheckResponse(_message.Message):
+    __slots__ = ("decisions",)
+    DECISIONS_FIELD_NUMBER: _ClassVar[int]
+    decisions: _containers.RepeatedCompositeFieldContainer[Decision]
+    def __init__(self, decisions: _Optional[_Iterable[_Union[Decision, _Mapping]]] = ...) -> None: ...
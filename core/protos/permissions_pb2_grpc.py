@@ -0,0 +1,141 @@
+# Generated by the gRPC Python protocol compiler plugin. DO NOT EDIT!
+"""Client and server classes corresponding to protobuf-defined services."""
+import grpc
+import warnings
+
+from core.protos import permissions_pb2 as core_dot_protos_dot_permissions__pb2
+
+GRPC_GENERATED_VERSION = '1.84.0'
+GRPC_VERSION = grpc.__version__
+_version_not_supported = False
+
+try:
+    from grpc._utilities import first_version_is_lower
+    _version_not_supported = first_version_is_lower(GRPC_VERSION, GRPC_GENERATED_VERSION)
+except ImportError:
+    _version_not_supported = True
+
+if _version_not_supported:
+    raise RuntimeError(
+        f'The grpc package installed is at version {GRPC_VERSION},'
+        + ' but the generated code in core/protos/permissions_pb2_grpc.py depends on'
+        + f' grpcio>={GRPC_GENERATED_VERSION}.'
+        + f' Please upgrade your grpc module to grpcio>={GRPC_GENERATED_VERSION}'
+        + f' or downgrade your generated code using grpcio-tools<={GRPC_VERSION}.'
+    )
+
+
+class PermissionServiceStub:
+    """Missing associated documentation comment in .proto file."""
+
+    def __init__(self, channel):
+        """Constructor.
+
+        Args:
+            channel: A grpc.Channel.
+        """
+        self.Check = channel.unary_unary(
+                '/permissions.PermissionService/Check',
+                request_serializer=core_dot_protos_dot_permissions__pb2.PermissionCheck.SerializeToString,
+                response_deserializer=core_dot_protos_dot_permissions__pb2.Decision.FromString,
+                _registered_method=True)
+        self.BatchCheck = channel.unary_unary(
+                '/permissions.PermissionService/BatchCheck',
+                request_serializer=core_dot_protos_dot_permissions__pb2.BatchCheckRequest.SerializeToString,
+                response_deserializer=core_dot_protos_dot_permissions__pb2.BatchCheckResponse.FromString,
+                _registered_method=True)
+
+
+class PermissionServiceServicer:
+    """Missing associated documentation comment in .proto file."""
+
+    def Check(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def BatchCheck(self, request, context):
+        """One decision per check, in request order
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+
+def add_PermissionServiceServicer_to_server(servicer, server):
+    rpc_method_handlers = {
+            'Check': grpc.unary_unary_rpc_method_handler(
+                    servicer.Check,
+                    request_deserializer=core_dot_protos_dot_permissions__pb2.PermissionCheck.FromString,
+                    response_serializer=core_dot_protos_dot_permissions__pb2.Decision.SerializeToString,
+            ),
+            'BatchCheck': grpc.unary_unary_rpc_method_handler(
+                    servicer.BatchCheck,
+                    request_deserializer=core_dot_protos_dot_permissions__pb2.BatchCheckRequest.FromString,
+                    response_serializer=core_dot_protos_dot_permissions__pb2.BatchCheckResponse.SerializeToString,
+            ),
+    }
+    generic_handler = grpc.method_handlers_generic_handler(
+            'permissions.PermissionService', rpc_method_handlers)
+    server.add_generic_rpc_handlers((generic_handler,))
+    server.add_registered_method_handlers('permissions.PermissionService', rpc_method_handlers)
+
+
+ # This class is part of an EXPERIMENTAL API.
+class PermissionService:
+    """Missing associated documentation comment in .proto file."""
+
+    @staticmethod
+    def Check(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/permissions.PermissionService/Check',
+            core_dot_protos_dot_permissions__pb2.PermissionCheck.SerializeToString,
+            core_dot_protos_dot_permissions__pb2.Decision.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def BatchCheck(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/permissions.PermissionService/BatchCheck',
+            core_dot_protos_dot_permissions__pb2.BatchCheckRequest.SerializeToString,
+            core_dot_protos_dot_permissions__pb2.BatchCheckResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
@@ -1,4 +1,5 @@
 import redis
+import redis.asyncio as aioredis
 
 from .config import config
 
@@ -8,3 +9,14 @@ cache = redis.Redis(
     db=config.redis.db,
     password=config.redis.password,
 )
+
+# For use inside `async def` code paths, never block the event loop with `cache`
+async_cache = aioredis.Redis(
+    connection_pool=aioredis.ConnectionPool(
+        host=config.redis.host,
+        port=config.redis.port,
+        db=config.redis.db,
+        password=config.redis.password,
+        max_connections=config.redis.max_connections,
+    )
+)
@@ -1,6 +1,8 @@
 from fastapi import FastAPI, Depends, Request
 
+from apps.backoffice.helpers import attach_staff_user
 from apps.user.routers.manage import ManageUserViewSet
+from core.lib.file import router as file_router
 from core.main import app_openapi, create_app
 from .dependencies import attach_user
 
@@ -10,13 +12,13 @@ def register_user_manage_routes(app: FastAPI):
 
 
 def register_user_mobile_routes(app: FastAPI):
-    pass
+    app.include_router(file_router, tags=["File"])
 
 
 # app = create_app(dependencies=[Depends(attach_user), Depends(validate_user_and_device)])
 app = create_app(dependencies=[Depends(attach_user)])
 
-manage_app = create_app()
+manage_app = create_app(mounted=True, dependencies=[Depends(attach_staff_user)])
 
 register_user_manage_routes(manage_app)
 register_user_mobile_routes(app)
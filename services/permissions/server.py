@@ -0,0 +1,89 @@
+"""
+Permission decision service for staff users.
+
+    python -m services.permissions.server
+"""
+import logging
+from concurrent import futures
+from typing import Callable
+from uuid import UUID
+
+import grpc
+
+from apps.backoffice.helpers import NO_PERMISSIONS, load_granted_permissions
+from core.config import config
+from core.db.session import get_db_context
+from core.lib.cache import MISSING, TTLCache
+from core.protos import permissions_pb2_grpc
+from core.protos.permissions_pb2 import (
+    BatchCheckResponse,
+    Decision,
+    PermissionCheck,
+)
+
+log = logging.getLogger("uvicorn")
+
+
+def resolve_staff_permissions(subject: str) -> frozenset[tuple[str, str]]:
+    try:
+        user_id = UUID(subject)
+    except ValueError:
+        return NO_PERMISSIONS
+    with get_db_context() as db:
+        return load_granted_permissions(db, user_id)
+
+
+class PermissionServicer(permissions_pb2_grpc.PermissionServiceServicer):
+    """
+    Answers checks from the permissions granted to each subject, which are
+    loaded once per `decision_ttl` seconds. Clients may reuse a decision for
+    as long, so a policy change takes at most twice that to apply.
+    """
+
+    def __init__(
+        self,
+        resolve: Callable[[str], frozenset[tuple[str, str]]] = resolve_staff_permissions,
+        decision_ttl: int = config.permission_service.cache_seconds,
+        cache_size: int = config.permission_service.cache_size,
+    ):
+        self.resolve = resolve
+        self.decision_ttl = decision_ttl
+        self.grants = TTLCache(maxsize=cache_size, ttl=decision_ttl)
+
+    def _granted(self, subject: str) -> frozenset[tuple[str, str]]:
+        granted = self.grants.get(subject)
+        if granted is MISSING:
+            granted = self.resolve(subject)
+            self.grants.set(subject, granted)
+        return granted
+
+    def _decide(self, check: PermissionCheck) -> Decision:
+        return Decision(
+            allowed=(check.model, check.action) in self._granted(check.subject),
+            ttl_seconds=self.decision_ttl,
+        )
+
+    def Check(self, request: PermissionCheck, context) -> Decision:
+        return self._decide(request)
+
+    def BatchCheck(self, request, context) -> BatchCheckResponse:
+        return BatchCheckResponse(decisions=[self._decide(x) for x in request.checks])
+
+
+def serve(listen: str | None = None, workers: int | None = None) -> grpc.Server:
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=workers or config.permission_service.workers)
+    )
+    permissions_pb2_grpc.add_PermissionServiceServicer_to_server(
+        PermissionServicer(), server
+    )
+    listen = listen or config.permission_service.listen
+    server.add_insecure_port(listen)
+    server.start()
+    log.info(f"Permission service listening on {listen}")
+    return server
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    serve().wait_for_termination()
@@ -1,10 +1,16 @@
+import json
 import uuid
+from datetime import datetime
 from fastapi.testclient import TestClient
 import pytest
-from apps.backoffice.models import StaffUser
+from sqlalchemy import event
+from apps.backoffice.models import PermissionPolicy, StaffUser
+from apps.backoffice.schemas import LoginResponse
 from core import gateway
 from core.db import Base as CoreBase
+from core.lib.authentication import decode_token
 from tests.utils import get_client
+from apps.backoffice import helpers
 from apps.backoffice.helpers import generate_hash
 
 
@@ -41,6 +47,95 @@ def main_client(pg_session_maker):
         client.app.state.session.close()
 
 
+def login(client: TestClient):
+    return client.post(
+        url="onboarding/manage/user/token",
+        data={"username": "boadmin@admin.com", "password": "TestPW123!@#"},
+    )
+
+
+class TestLogin:
+    def test_login_response(self, main_client: TestClient):
+        response = login(main_client)
+        assert response.status_code == 200
+        body = response.json()
+        assert json.loads(LoginResponse.parse_obj(body).json()) == body
+        assert body["user"] == {
+            "id": "76e6b034-3db3-4fea-a7ab-3c1973504901",
+            "name": "Backoffice Admin",
+            "force_change_password": True,
+        }
+        assert body["permissions"] == {}
+        payload, _ = decode_token(body["access_token"])
+        assert payload["sid"] == body["user"]["id"]
+        payload, _ = decode_token(body["refresh_token"], token_type="refresh")
+        assert payload["sid"] == body["user"]["id"]
+
+    def test_login_without_state_change_does_not_write(self, main_client: TestClient):
+        statements = []
+        engine = main_client.app.state.session.get_bind()
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            response = login(main_client)
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+        assert response.status_code == 200
+        assert statements
+        assert not [x for x in statements if x.lstrip().upper().startswith("UPDATE")]
+
+
+class TestLoginPermissions:
+    def make_user(self, **kwargs):
+        return StaffUser(role="Backoffice", is_superuser=False, **kwargs)
+
+    def make_policy(self, is_active=True, permissions=None):
+        return PermissionPolicy(
+            id=7,
+            is_active=is_active,
+            permissions=permissions or [["Staff User", "List"], ["Staff User", "Create"]],
+            updated_at=datetime(2024, 1, 1),
+        )
+
+    def setup_method(self):
+        helpers.login_permissions.clear()
+
+    def test_without_policy(self):
+        assert helpers.get_login_permissions_json(self.make_user()) == b"{}"
+        company = StaffUser(role="Company", is_superuser=True)
+        assert helpers.get_login_permissions_json(company) == b"{}"
+
+    def test_inactive_policy(self):
+        user = self.make_user(permission_policy=self.make_policy(is_active=False))
+        assert helpers.get_login_permissions_json(user) == b"{}"
+
+    def test_superuser(self):
+        user = StaffUser(role="Backoffice", is_superuser=True)
+        payload = helpers.get_login_permissions_json(user)
+        assert payload is helpers.SUPERUSER_PERMISSIONS_JSON
+        assert json.loads(payload) == helpers.get_formatted_permissions(
+            helpers.PERMISSIONS
+        )
+
+    def test_policy_payload_is_cached_per_version(self):
+        policy = self.make_policy()
+        user = self.make_user(permission_policy=policy)
+        payload = helpers.get_login_permissions_json(user)
+        assert json.loads(payload) == {"Staff User": ["List", "Create"]}
+        assert helpers.get_login_permissions_json(user) is payload
+
+        policy.permissions = [["Staff User", "List"]]
+        # Same version, the cached payload is still served
+        assert helpers.get_login_permissions_json(user) is payload
+        policy.updated_at = datetime(2024, 1, 2)
+        assert json.loads(helpers.get_login_permissions_json(user)) == {
+            "Staff User": ["List"]
+        }
+
+
 class TestStaffUserViewSet:
     def test_staff_user_create(self, main_client: TestClient):
         response = main_client.post(
@@ -0,0 +1,304 @@
+import asyncio
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pytest
+import redis
+from fastapi import Request
+from fastapi.testclient import TestClient
+from starlette.requests import HTTPConnection
+
+from core.config import config
+from core.lib import authentication
+from core.lib.authentication import (
+    JWTAuthBackend,
+    PasswordHasher,
+    VerifiedTokenCache,
+    create_access_token,
+    decode_token,
+    get_password_hash,
+)
+from core.lib.exceptions import BadRequest, ServiceUnavailable
+from core.lib.cache import InvalidationBus, invalidation_bus
+from core.main import create_app
+
+USER_ID = str(uuid.uuid4())
+JTI = uuid.uuid4().hex
+
+
+class SlowRedis:
+    """Answers like Redis after a network round trip of `latency` seconds."""
+
+    def __init__(self, values=None, latency=0.05):
+        self.values = values or {}
+        self.latency = latency
+        self.calls = []
+
+    async def mget(self, keys):
+        self.calls.append(("mget", keys))
+        await asyncio.sleep(self.latency)
+        return [self.values.get(key) for key in keys]
+
+
+def mobile_connection(device_id="device-1"):
+    token = create_access_token(
+        {"udi": "60123456789", "sid": USER_ID, "jti": JTI, "is_active": True}
+    )
+    headers = [(b"access-token", token.encode()), (b"device-id", device_id.encode())]
+    return HTTPConnection({"type": "http", "headers": headers})
+
+
+@pytest.fixture()
+def fake_redis(monkeypatch):
+    fake = SlowRedis({f"jti:{USER_ID}": JTI.encode()})
+    monkeypatch.setattr(authentication, "async_cache", fake)
+    monkeypatch.setattr(config, "service_name", "authentication")
+    monkeypatch.setattr(InvalidationBus, "ensure_started", lambda self: None)
+    authentication.session_state.invalidate(None)
+
+    def blocking_call(*args, **kwargs):
+        raise AssertionError("Synchronous Redis call on the authentication path")
+
+    monkeypatch.setattr(redis.Redis, "execute_command", blocking_call)
+    return fake
+
+
+async def authenticate_while_measuring_loop_lag(conn):
+    lags = []
+    done = asyncio.Event()
+
+    async def heartbeat():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(time.perf_counter() - start)
+
+    ticker = asyncio.create_task(heartbeat())
+    result = await JWTAuthBackend().authenticate(conn)
+    done.set()
+    await ticker
+    return result, max(lags)
+
+
+class TestValidateUserAndDevice:
+    def test_authenticate_does_not_block_event_loop(self, fake_redis):
+        result, max_lag = asyncio.run(
+            authenticate_while_measuring_loop_lag(mobile_connection())
+        )
+        assert result is not None
+        assert max_lag < fake_redis.latency / 2
+
+    def test_single_round_trip(self, fake_redis):
+        asyncio.run(JWTAuthBackend().authenticate(mobile_connection()))
+        assert fake_redis.calls == [
+            (
+                "mget",
+                ["deviceblock:device-1", f"userblock:{USER_ID}", f"jti:{USER_ID}"],
+            )
+        ]
+
+    def test_blocked_device(self, fake_redis):
+        fake_redis.values["deviceblock:device-1"] = b"1"
+        conn = mobile_connection()
+        assert asyncio.run(JWTAuthBackend().authenticate(conn)) is None
+        assert conn.state.error.status_code == 420
+        assert conn.state.error.detail == "Device Blocked"
+
+    def test_rotated_session(self, fake_redis):
+        fake_redis.values[f"jti:{USER_ID}"] = b"newer-session"
+        conn = mobile_connection()
+        assert asyncio.run(JWTAuthBackend().authenticate(conn)) is None
+        assert conn.state.error.status_code == 420
+
+
+class TestSessionStateCache:
+    @pytest.fixture()
+    def listening(self, monkeypatch):
+        monkeypatch.setattr(invalidation_bus, "healthy", True)
+
+    def test_repeat_requests_make_no_network_calls(self, fake_redis, listening):
+        asyncio.run(JWTAuthBackend().authenticate(mobile_connection()))
+        asyncio.run(JWTAuthBackend().authenticate(mobile_connection()))
+        assert len(fake_redis.calls) == 1
+
+    def test_invalidation_forces_refetch(self, fake_redis, listening):
+        asyncio.run(JWTAuthBackend().authenticate(mobile_connection()))
+        fake_redis.values[f"userblock:{USER_ID}"] = b"1"
+        invalidation_bus.dispatch(f"userblock:{USER_ID}")
+
+        conn = mobile_connection()
+        assert asyncio.run(JWTAuthBackend().authenticate(conn)) is None
+        assert conn.state.error.detail == "User Blocked"
+        assert fake_redis.calls[-1] == ("mget", [f"userblock:{USER_ID}"])
+
+    def test_not_trusted_without_invalidation_channel(self, fake_redis):
+        asyncio.run(JWTAuthBackend().authenticate(mobile_connection()))
+        asyncio.run(JWTAuthBackend().authenticate(mobile_connection()))
+        assert len(fake_redis.calls) == 2
+
+
+class TestVerifiedTokenCache:
+    @pytest.fixture()
+    def decodes(self, monkeypatch):
+        calls = []
+        decode = authentication.jwt.decode
+
+        def counting_decode(*args, **kwargs):
+            calls.append(args[0])
+            return decode(*args, **kwargs)
+
+        monkeypatch.setattr(authentication.jwt, "decode", counting_decode)
+        monkeypatch.setattr(authentication, "token_cache", VerifiedTokenCache(100))
+        return calls
+
+    def staff_token(self):
+        return create_access_token(
+            {"udi": "bo@example.com", "sid": USER_ID, "scopes": ["Backoffice", "Staff"]}
+        )
+
+    def test_token_is_verified_once(self, decodes):
+        token = self.staff_token()
+        first = decode_token(token)
+        second = decode_token(token)
+        assert first == second
+        assert len(decodes) == 1
+
+    def test_cached_entry_is_not_shared(self, decodes):
+        token = self.staff_token()
+        payload, scopes = decode_token(token)
+        scopes.append("authenticated")
+        payload["sid"] = None
+        assert decode_token(token) == _uncached(token)
+
+    def test_token_types_are_cached_separately(self, decodes):
+        token = self.staff_token()
+        decode_token(token)
+        # An access token is no refresh token
+        with pytest.raises(BadRequest) as exc_info:
+            decode_token(token, token_type="refresh")
+        assert exc_info.value.status_code == 400
+        assert exc_info.value.detail[0]["type"] == "user.invalid_refresh_token"
+
+    def test_revoked_session_is_verified_again(self, decodes):
+        token = self.staff_token()
+        decode_token(token)
+        authentication.token_cache.revoke(f"jti:{USER_ID}")
+        decode_token(token)
+        assert len(decodes) == 2
+
+
+class TestMountedApps:
+    @pytest.fixture()
+    def authenticate_calls(self, monkeypatch):
+        calls = []
+        authenticate = JWTAuthBackend.authenticate
+
+        async def counting_authenticate(self, conn):
+            calls.append(conn.url.path)
+            return await authenticate(self, conn)
+
+        monkeypatch.setattr(JWTAuthBackend, "authenticate", counting_authenticate)
+        return calls
+
+    def make_client(self, inner_mounted):
+        app = create_app()
+        manage_app = create_app(mounted=inner_mounted)
+
+        @manage_app.get("/me")
+        def me(request: Request):
+            return {"user": request.user.display_name, "scopes": request.auth.scopes}
+
+        app.mount("/manage", manage_app)
+        token = create_access_token(
+            {"udi": "bo@example.com", "sid": USER_ID, "scopes": ["Backoffice", "Staff"]}
+        )
+        return TestClient(app, headers={"access-token": token})
+
+    @pytest.mark.parametrize("inner_mounted", [True, False])
+    def test_token_is_decoded_once(self, authenticate_calls, inner_mounted):
+        response = self.make_client(inner_mounted).get("/manage/me")
+        assert response.status_code == 200
+        assert response.json()["user"] == "bo@example.com"
+        assert "authenticated" in response.json()["scopes"]
+        assert authenticate_calls == ["/manage/me"]
+
+    def test_mounted_app_has_no_middleware(self):
+        assert create_app(mounted=True).user_middleware == []
+
+
+class StalledExecutor:
+    def submit(self, *args):
+        return Future()
+
+
+class TestPasswordHasher:
+    @pytest.fixture(scope="class")
+    def hashes(self):
+        return [get_password_hash(f"old-{i}") for i in range(3)]
+
+    def thread_hasher(self, workers=2, max_pending=8):
+        hasher = PasswordHasher(
+            workers,
+            max_pending,
+            executor_factory=lambda: ThreadPoolExecutor(max_workers=workers),
+        )
+        hasher.start()
+        return hasher
+
+    def test_async_facade(self, hashes):
+        hasher = self.thread_hasher()
+
+        async def run():
+            hashed = await hasher.hash("secret")
+            return (
+                await hasher.verify("secret", hashed),
+                await hasher.verify_any("old-2", hashes),
+                await hasher.verify_any("new", hashes),
+            )
+
+        assert asyncio.run(run()) == (True, True, False)
+        assert hasher.pending == 0
+        assert hasher.stats["completed"] == 8
+
+    def test_sync_facade(self, hashes):
+        hasher = self.thread_hasher()
+        assert hasher.verify_sync("old-0", hashes[0])
+        assert hasher.verify_any_sync("old-1", hashes)
+        assert not hasher.verify_any_sync("new", hashes)
+
+    def test_first_match_cancels_queued_checks(self, hashes):
+        hasher = self.thread_hasher(workers=1)
+        assert hasher.verify_any_sync("old-0", hashes)
+        time.sleep(0.5)
+        assert hasher.pending == 0
+        assert hasher.stats["completed"] < len(hashes)
+
+    def test_backpressure(self, hashes):
+        hasher = PasswordHasher(1, max_pending=2, executor_factory=StalledExecutor)
+        hasher._submit("verify", "old-0", hashes[0])
+        with pytest.raises(ServiceUnavailable) as exc_info:
+            hasher._submit_many("verify", [("old-0", x) for x in hashes])
+        assert exc_info.value.status_code == 503
+        assert exc_info.value.headers == {"Retry-After": "1"}
+        assert hasher.stats["rejected"] == 1
+
+    def test_sync_facade_hashes_inline_until_started(self, hashes):
+        hasher = PasswordHasher(1, max_pending=1, executor_factory=StalledExecutor)
+        assert hasher.verify_sync("old-0", hashes[0])
+        assert hasher.verify_any_sync("old-2", hashes)
+        assert hasher.verify_sync("secret", hasher.hash_sync("secret"))
+        assert not hasher.running
+
+    def test_process_pool(self, hashes):
+        hasher = PasswordHasher(workers=1, max_pending=4)
+        hasher.start()
+        try:
+            assert hasher.verify_sync("old-1", hashes[1])
+            assert not hasher.verify_sync("new", hashes[1])
+        finally:
+            hasher.shutdown()
+
+
+def _uncached(token):
+    return authentication._decode_token(token)
@@ -0,0 +1,41 @@
+import time
+
+from core.lib.cache import MISSING, InvalidationBus, TTLCache
+
+
+class TestTTLCache:
+    def test_get_set(self):
+        cache = TTLCache()
+        cache.set("a", None)
+        assert cache.get("a") is None
+        assert cache.get("b") is MISSING
+        assert "a" in cache and "b" not in cache
+
+    def test_entries_expire(self):
+        cache = TTLCache(ttl=0.01)
+        cache.set("a", 1)
+        cache.set("b", 2, ttl=10)
+        time.sleep(0.02)
+        assert cache.get("a") is MISSING
+        assert cache.get("b") == 2
+
+    def test_least_recently_used_is_evicted(self):
+        cache = TTLCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        assert "b" not in cache
+        assert "a" in cache and "c" in cache
+
+
+class TestInvalidationBus:
+    def test_dispatch_by_prefix(self):
+        bus = InvalidationBus()
+        seen = []
+        bus.subscribe("jti:", lambda key: seen.append(("jti", key)))
+        bus.subscribe("userblock:", lambda key: seen.append(("user", key)))
+
+        bus.dispatch("jti:1")
+        bus.dispatch(None)
+        assert seen == [("jti", "jti:1"), ("jti", None), ("user", None)]
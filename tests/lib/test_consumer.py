@@ -0,0 +1,158 @@
+import asyncio
+
+import pytest
+from sqlalchemy import String, select
+from sqlalchemy.orm import Mapped, mapped_column
+
+from core.lib import cache as cache_module
+from core.lib.consumer import BatchConsumer
+from core.lib.models import ConsumerBase
+
+
+class ConsumedMerchant(ConsumerBase):
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    name: Mapped[str] = mapped_column(String(50))
+    city: Mapped[str | None]
+
+
+@pytest.fixture
+def merchants(pgs):
+    yield pgs
+    pgs.rollback()
+    pgs.query(ConsumedMerchant).delete()
+    pgs.commit()
+
+
+def rows(db) -> dict:
+    db.expire_all()
+    return {
+        x.id: (x.name, x.city)
+        for x in db.scalars(select(ConsumedMerchant).order_by(ConsumedMerchant.id))
+    }
+
+
+def consume(session_factory, events, **kwargs) -> BatchConsumer:
+    async def main():
+        consumer = BatchConsumer([ConsumedMerchant], session_factory=session_factory, **kwargs)
+        task = asyncio.create_task(consumer.run())
+        for topic, data in events:
+            await consumer.put(topic, data)
+        await consumer.stop()
+        await task
+        return consumer
+
+    return asyncio.run(main())
+
+
+class TestBatchConsumer:
+    def test_events_are_batched(self, merchants, pg_session_maker):
+        events = [("create-consumedmerchant", {"id": i, "name": f"m{i}"}) for i in range(10)]
+        consumer = consume(pg_session_maker, events, max_batch=4, max_delay=1)
+        assert consumer.stats["events"] == 10
+        assert consumer.stats["batches"] == 3
+        assert rows(merchants) == {i: (f"m{i}", None) for i in range(10)}
+
+    def test_net_effect_per_row(self, merchants, pg_session_maker):
+        consume(pg_session_maker, [("create-consumedmerchant", {"id": 1, "name": "old"})])
+        events = [
+            ("update-consumedmerchant", {"id": 1, "city": "Yangon", "unknown": "x"}),
+            ("update-consumedmerchant", {"id": 1, "name": "new"}),
+            ("create-consumedmerchant", {"id": 2, "name": "two"}),
+            ("update-consumedmerchant", {"id": 2, "city": "Mandalay"}),
+            ("create-consumedmerchant", {"id": 3, "name": "three"}),
+            ("delete-consumedmerchant", {"id": 3}),
+            ("update-consumedmerchant", {"id": 4, "name": "never created"}),
+        ]
+        consumer = consume(pg_session_maker, events, max_batch=100, max_delay=1)
+        assert consumer.stats["batches"] == 1
+        assert consumer.stats["failed_batches"] == 0
+        assert rows(merchants) == {1: ("new", "Yangon"), 2: ("two", "Mandalay")}
+
+    def test_create_after_update_keeps_updated_columns(self, merchants, pg_session_maker):
+        events = [
+            ("update-consumedmerchant", {"id": 1, "city": "Yangon"}),
+            ("create-consumedmerchant", {"id": 1, "name": "a"}),
+            ("delete-consumedmerchant", {"id": 2}),
+            ("create-consumedmerchant", {"id": 2, "name": "b"}),
+        ]
+        consume(pg_session_maker, events, max_batch=100, max_delay=1)
+        assert rows(merchants) == {1: ("a", "Yangon"), 2: ("b", None)}
+
+    def test_events_without_id(self, merchants, pg_session_maker):
+        consumer = BatchConsumer([ConsumedMerchant], session_factory=pg_session_maker)
+        with pytest.raises(ValueError):
+            asyncio.run(consumer.put("create-consumedmerchant", {"name": "a"}))
+        consumer.apply_batch(
+            [
+                ("create", "consumedmerchant", {"name": "a"}),
+                ("create", "consumedmerchant", {"id": 1, "name": "b"}),
+            ]
+        )
+        assert consumer.stats["failed_events"] == 1
+        assert rows(merchants) == {1: ("b", None)}
+
+    def test_redelivered_create_is_an_upsert(self, merchants, pg_session_maker):
+        event = ("create-consumedmerchant", {"id": 1, "name": "a"})
+        consume(pg_session_maker, [event])
+        consumer = consume(pg_session_maker, [event, event])
+        assert consumer.stats["failed_batches"] == 0
+        assert rows(merchants) == {1: ("a", None)}
+
+    def test_bad_event_does_not_block_the_batch(self, merchants, pg_session_maker):
+        events = [
+            ("create-consumedmerchant", {"id": 1, "name": "a"}),
+            ("create-consumedmerchant", {"id": 2, "name": "x" * 100}),
+            ("create-consumedmerchant", {"id": 3, "name": "c"}),
+        ]
+        consumer = consume(pg_session_maker, events, max_delay=1)
+        assert consumer.stats["failed_batches"] == 1
+        assert consumer.stats["failed_events"] == 1
+        assert rows(merchants) == {1: ("a", None), 3: ("c", None)}
+
+    def test_cached_rows_are_invalidated(self, merchants, pg_session_maker, monkeypatch):
+        published = []
+        monkeypatch.setitem(
+            cache_module._invalidators, ConsumedMerchant, [lambda x: [f"merchant:{x.id}"]]
+        )
+        monkeypatch.setattr(cache_module, "invalidate_keys", lambda keys: published.extend(keys))
+        events = [
+            ("create-consumedmerchant", {"id": 1, "name": "a"}),
+            ("update-consumedmerchant", {"id": 2, "name": "b"}),
+            ("delete-consumedmerchant", {"id": 3}),
+        ]
+        consume(pg_session_maker, events, max_delay=1)
+        assert sorted(published) == ["merchant:1", "merchant:2", "merchant:3"]
+        # Only the events applied one by one after a failed batch
+        published.clear()
+        events = [
+            ("create-consumedmerchant", {"id": 4, "name": "x" * 100}),
+            ("create-consumedmerchant", {"id": 5, "name": "c"}),
+        ]
+        consume(pg_session_maker, events, max_delay=1)
+        assert published == ["merchant:5"]
+
+    def test_backpressure(self, pg_session_maker):
+        async def main():
+            consumer = BatchConsumer(
+                [ConsumedMerchant], max_pending=2, session_factory=pg_session_maker
+            )
+            await consumer.put("create-consumedmerchant", {"id": 1, "name": "a"})
+            await consumer.put("create-consumedmerchant", {"id": 2, "name": "b"})
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(
+                    consumer.put("create-consumedmerchant", {"id": 3, "name": "c"}), 0.05
+                )
+
+        asyncio.run(main())
+
+    def test_unknown_topic(self, pg_session_maker):
+        consumer = BatchConsumer([ConsumedMerchant], session_factory=pg_session_maker)
+        with pytest.raises(ValueError):
+            asyncio.run(consumer.put("upsert-consumedmerchant", {"id": 1}))
+        with pytest.raises(ValueError):
+            asyncio.run(consumer.put("create-unknown", {"id": 1}))
+
+
+def test_consumer_fields_are_columns():
+    assert ConsumedMerchant.consumer_fields() == {"id", "name", "city"}
+    assert ConsumedMerchant.consumer_data({"id": 1, "create": 1, "x": 2}) == {"id": 1}
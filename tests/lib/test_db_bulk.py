@@ -0,0 +1,130 @@
+import enum
+import uuid
+from datetime import datetime
+
+import pytest
+from sqlalchemy import ARRAY, JSON, Enum, String, create_engine, func, select
+from sqlalchemy.orm import DeclarativeBase, Mapped, Session, mapped_column
+
+from core.db.bulk import bulk_copy
+from core.db.drivers import engine_url
+
+
+class BulkBase(DeclarativeBase):
+    pass
+
+
+class Kind(enum.Enum):
+    plain = "Plain"
+    fancy = "Fancy"
+
+
+class BulkItem(BulkBase):
+    __tablename__ = "bulk_item"
+
+    id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default=uuid.uuid4)
+    code: Mapped[str] = mapped_column(String(20), unique=True)
+    name: Mapped[str | None]
+    count: Mapped[int] = mapped_column(server_default="0")
+    extra: Mapped[dict | None] = mapped_column(JSON)
+    created_at: Mapped[datetime | None]
+    tags: Mapped[list[str] | None] = mapped_column(ARRAY(String))
+    kind: Mapped[Kind | None] = mapped_column(Enum(Kind))
+    label: Mapped[str | None]
+
+
+@pytest.fixture(params=["psycopg2", "psycopg"])
+def db(request, postgresql_proc):
+    url = engine_url(
+        f"postgresql://{postgresql_proc.user}@{postgresql_proc.host}"
+        f":{postgresql_proc.port}/postgres",
+        request.param,
+    )
+    engine = create_engine(url)
+    BulkBase.metadata.create_all(engine)
+    session = Session(engine)
+    yield session
+    session.close()
+    BulkBase.metadata.drop_all(engine)
+    engine.dispose()
+
+
+def rows(n, **values):
+    return [{"code": f"c{i}", "name": f"Item {i}", **values} for i in range(n)]
+
+
+class TestBulkCopy:
+    def test_copy_dicts(self, db):
+        result = bulk_copy(db, BulkItem, rows(250, extra={"a": [1, "b"]}), chunk_size=100)
+        assert result.rows == 250
+        assert result.rows_per_second > 0
+        items = db.scalars(select(BulkItem).order_by(BulkItem.code)).all()
+        assert len(items) == 250
+        assert items[0].id is not None
+        assert items[0].count == 0
+        assert items[0].extra == {"a": [1, "b"]}
+
+    def test_copy_tuples(self, db):
+        data = [("a", 'quoted "name", with comma', 3), ("b", "", 4), ("c", None, 5)]
+        bulk_copy(db, BulkItem, data, columns=["code", "name", "count"])
+        names = dict(db.execute(select(BulkItem.code, BulkItem.name)).all())
+        assert names == {"a": 'quoted "name", with comma', "b": "", "c": None}
+
+    def test_arrays_and_enums(self, db):
+        tags = ['a "quoted", tag', "back\\slash", "{braces}", "NULL", "", None]
+        data = [
+            {"code": "a", "tags": tags, "kind": Kind.fancy, "label": Kind.plain},
+            {"code": "b", "tags": [], "kind": None, "label": None},
+            {"code": "c", "tags": None, "kind": Kind.plain, "label": "text"},
+        ]
+        bulk_copy(db, BulkItem, data)
+        items = {item.code: item for item in db.scalars(select(BulkItem)).all()}
+        assert items["a"].tags == tags
+        assert items["b"].tags == []
+        assert items["c"].tags is None
+        # Enum columns store member names, other columns the member's value
+        assert items["a"].kind is Kind.fancy
+        assert items["a"].label == "Plain"
+        stored = select(func.cast(BulkItem.kind, String)).where(BulkItem.code == "c")
+        assert db.scalar(stored) == "plain"
+
+    def test_binary(self, db):
+        if db.get_bind().dialect.driver != "psycopg":
+            with pytest.raises(ValueError):
+                bulk_copy(db, BulkItem, rows(1), format="binary")
+            return
+        now = datetime(2024, 1, 2, 3, 4, 5)
+        bulk_copy(
+            db, BulkItem, rows(10, count=7, created_at=now, extra={"a": 1}), format="binary"
+        )
+        assert db.scalar(select(func.sum(BulkItem.count))) == 70
+        assert db.scalar(select(BulkItem.created_at).limit(1)) == now
+        assert db.scalar(select(BulkItem.extra).limit(1)) == {"a": 1}
+
+    def test_upsert(self, db):
+        bulk_copy(db, BulkItem, rows(3, count=1))
+        bulk_copy(
+            db,
+            BulkItem,
+            [{"code": "c2", "count": 5}, {"code": "c3", "count": 5}],
+            conflict_columns=["code"],
+            update_columns=["count"],
+        )
+        counts = dict(db.execute(select(BulkItem.code, BulkItem.count)).all())
+        assert counts == {"c0": 1, "c1": 1, "c2": 5, "c3": 5}
+
+    def test_upsert_do_nothing(self, db):
+        bulk_copy(db, BulkItem, rows(2, count=1))
+        result = bulk_copy(
+            db,
+            BulkItem,
+            [{"code": "c1", "count": 9}],
+            conflict_columns=["code"],
+            update_columns=[],
+        )
+        assert result.rows == 1
+        assert db.scalar(select(func.sum(BulkItem.count))) == 2
+
+    def test_unknown_column(self, db):
+        with pytest.raises(ValueError):
+            bulk_copy(db, BulkItem, [{"code": "a", "missing": 1}])
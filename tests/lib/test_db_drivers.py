@@ -0,0 +1,101 @@
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, exc, text
+from sqlalchemy.orm import Session
+
+from core.db.drivers import connect_args, engine_url
+from core.lib.exception_handlers import handle_integrity_error
+from core.lib.exceptions import ForeignKeyProtectedException, InvalidForeignKey
+
+HOT_QUERY = text("SELECT count(*) FROM pg_class WHERE relname = :name")
+PREPARED = text("SELECT count(*) FROM pg_prepared_statements")
+
+
+@pytest.fixture
+def make_engine(postgresql_proc):
+    engines = []
+
+    def make_engine(driver, prepare_threshold=5, pgbouncer=False):
+        url = engine_url(
+            f"postgresql://{postgresql_proc.user}@{postgresql_proc.host}"
+            f":{postgresql_proc.port}/postgres",
+            driver,
+        )
+        engines.append(
+            create_engine(
+                url, connect_args=connect_args(driver, prepare_threshold, pgbouncer)
+            )
+        )
+        return engines[-1]
+
+    yield make_engine
+    for engine in engines:
+        engine.dispose()
+
+
+def test_engine_url():
+    assert engine_url("postgresql://u:p@db/app", "psycopg") == "postgresql+psycopg://u:p@db/app"
+    assert engine_url("postgresql+psycopg://db/app", "psycopg2") == "postgresql+psycopg2://db/app"
+    assert engine_url("sqlite://", "psycopg") == "sqlite://"
+
+
+class TestPreparedStatements:
+    def prepared_after_hot_queries(self, engine) -> int:
+        with engine.connect() as connection:
+            for _ in range(6):
+                connection.execute(HOT_QUERY, {"name": "pg_class"}).scalar()
+            return connection.execute(PREPARED).scalar()
+
+    def test_psycopg_prepares_repeated_statements(self, make_engine):
+        assert self.prepared_after_hot_queries(make_engine("psycopg")) >= 1
+
+    def test_pgbouncer_mode_does_not_prepare(self, make_engine):
+        engine = make_engine("psycopg", pgbouncer=True)
+        assert self.prepared_after_hot_queries(engine) == 0
+
+    def test_psycopg2_does_not_prepare(self, make_engine):
+        assert self.prepared_after_hot_queries(make_engine("psycopg2")) == 0
+
+
+@pytest.mark.parametrize("driver", ["psycopg2", "psycopg"])
+class TestIntegrityErrors:
+    def integrity_error(self, engine, statement) -> tuple[Session, exc.IntegrityError]:
+        session = Session(engine)
+        session.execute(text("CREATE TEMP TABLE parent (id int PRIMARY KEY)"))
+        session.execute(
+            text(
+                "CREATE TEMP TABLE child (id int PRIMARY KEY, "
+                "code text CONSTRAINT child_code_key UNIQUE, "
+                "parent_id int CONSTRAINT child_parent_fk REFERENCES parent)"
+            )
+        )
+        session.execute(text("INSERT INTO parent VALUES (1)"))
+        session.execute(text("INSERT INTO child VALUES (1, 'a', 1)"))
+        with pytest.raises(exc.IntegrityError) as exc_info:
+            session.execute(text(statement))
+        return session, exc_info.value
+
+    def test_unique_violation(self, make_engine, driver):
+        session, error = self.integrity_error(
+            make_engine(driver), "INSERT INTO child VALUES (2, 'a', 1)"
+        )
+        with pytest.raises(HTTPException) as exc_info:
+            handle_integrity_error(session, error)
+        assert exc_info.value.status_code == 422
+        assert exc_info.value.detail[0]["loc"] == ["body", "code"]
+
+    def test_missing_foreign_key(self, make_engine, driver):
+        session, error = self.integrity_error(
+            make_engine(driver), "INSERT INTO child VALUES (2, 'b', 2)"
+        )
+        with pytest.raises(InvalidForeignKey) as exc_info:
+            handle_integrity_error(session, error)
+        assert exc_info.value.detail[0]["msg"].endswith("for parent")
+
+    def test_protected_foreign_key(self, make_engine, driver):
+        session, error = self.integrity_error(
+            make_engine(driver), "DELETE FROM parent WHERE id = 1"
+        )
+        with pytest.raises(ForeignKeyProtectedException) as exc_info:
+            handle_integrity_error(session, error)
+        assert exc_info.value.detail[0]["msg"].endswith("child_parent_fk")
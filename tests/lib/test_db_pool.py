@@ -0,0 +1,106 @@
+import pytest
+from sqlalchemy import create_engine, event, exc, text
+from sqlalchemy.pool import NullPool
+
+from core.config import config
+from core.db.pool import InstrumentedQueuePool, PoolLivenessChecker, prewarm_pool
+
+
+@pytest.fixture
+def make_engine(postgresql_proc):
+    engines = []
+
+    def make_engine(**kwargs):
+        url = (
+            f"postgresql+psycopg2://{postgresql_proc.user}@{postgresql_proc.host}"
+            f":{postgresql_proc.port}/postgres"
+        )
+        kwargs.setdefault("poolclass", InstrumentedQueuePool)
+        engines.append(create_engine(url, **kwargs))
+        return engines[-1]
+
+    yield make_engine
+    for engine in engines:
+        engine.dispose()
+
+
+class TestInstrumentedQueuePool:
+    def test_snapshot(self, make_engine):
+        engine = make_engine(pool_size=1, max_overflow=1)
+        with engine.connect(), engine.connect():
+            snapshot = engine.pool.snapshot()
+            assert snapshot["in_use"] == 2
+            assert snapshot["overflow"] == 1
+        snapshot = engine.pool.snapshot()
+        assert snapshot["in_use"] == 0
+        assert snapshot["idle"] == 1
+        assert snapshot["checkouts"] == 2
+        assert snapshot["wait_max_ms"] > 0
+
+    def test_timeouts_are_counted(self, make_engine):
+        engine = make_engine(pool_size=1, max_overflow=0, pool_timeout=0.05)
+        with engine.connect():
+            with pytest.raises(exc.TimeoutError):
+                engine.connect()
+        snapshot = engine.pool.snapshot(reset_max=True)
+        assert snapshot["timeouts"] == 1
+        assert snapshot["wait_max_ms"] >= 50
+        assert engine.pool.snapshot()["wait_max_ms"] == 0
+
+    def test_stats_survive_dispose(self, make_engine):
+        engine = make_engine()
+        with engine.connect():
+            pass
+        engine.dispose()
+        assert engine.pool.snapshot()["checkouts"] == 1
+
+
+class TestPoolMaintenance:
+    def test_prewarm(self, make_engine):
+        engine = make_engine(pool_size=3)
+        assert prewarm_pool(engine, 3) == 3
+        assert engine.pool.snapshot()["idle"] == 3
+
+    def test_liveness_check_takes_one_connection_at_a_time(self, make_engine):
+        engine = make_engine(pool_size=3)
+        prewarm_pool(engine, 3)
+        pinged, in_use = set(), []
+
+        @event.listens_for(engine.pool, "checkout")
+        def on_checkout(dbapi_connection, record, proxy):
+            pinged.add(id(dbapi_connection))
+            in_use.append(engine.pool.checkedout())
+
+        assert PoolLivenessChecker(engine, interval=60).check() == 0
+        assert len(pinged) == 3
+        assert max(in_use) == 1
+        # Maintenance checkouts are not request traffic
+        assert engine.pool.snapshot()["checkouts"] == 0
+
+    def test_liveness_check_drops_dead_connections(self, make_engine):
+        engine = make_engine(pool_size=2)
+        prewarm_pool(engine, 2)
+        checker = PoolLivenessChecker(engine, interval=60)
+        assert checker.check() == 0
+
+        with make_engine(poolclass=NullPool).connect() as admin:
+            admin.execute(
+                text(
+                    "SELECT pg_terminate_backend(pid) FROM pg_stat_activity "
+                    "WHERE pid <> pg_backend_pid() AND datname = 'postgres' "
+                    "AND backend_type = 'client backend'"
+                )
+            )
+        assert checker.check() == 2
+        with engine.connect() as connection:
+            assert connection.execute(text("SELECT 1")).scalar() == 1
+
+
+def test_metrics_require_the_internal_token(main_client, monkeypatch):
+    assert main_client.get("/metrics/db-pool").status_code == 401
+    monkeypatch.setattr(config, "internal_token", "secret")
+    wrong = main_client.get("/metrics/db-pool", headers={"X-Internal-Token": "guess"})
+    assert wrong.status_code == 401
+    response = main_client.get("/metrics/db-pool", headers={"X-Internal-Token": "secret"})
+    assert response.status_code == 200
+    assert "in_use" in response.json()
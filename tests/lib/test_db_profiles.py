@@ -0,0 +1,109 @@
+import pytest
+from fastapi import Depends, FastAPI
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from starlette.testclient import TestClient
+
+from core.db.deadlines import DeadlineMiddleware
+from core.db.profiles import SettingsProfile, resolve_profile
+from core.db.session import RequestSessionMiddleware, get_db
+from core.lib.decorators import action
+from core.lib.viewsets import GenericViewSet
+
+
+def show_settings(db: Session) -> dict:
+    return {
+        name: db.execute(text(f"SHOW {name}")).scalar() for name in ["work_mem", "jit"]
+    }
+
+
+def make_app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(RequestSessionMiddleware)
+
+    @app.get("/report", dependencies=[Depends(SettingsProfile("report"))])
+    def report(db: Session = Depends(get_db)):
+        settings = show_settings(db)
+        db.commit()
+        # A new transaction gets them again
+        return [settings, show_settings(db)]
+
+    @app.get("/lookup")
+    def lookup(db: Session = Depends(get_db)):
+        return show_settings(db)
+
+    return app
+
+
+class TestSettingsProfiles:
+    def test_applied_per_transaction_and_reset(self, pg_session_maker):
+        with TestClient(make_app()) as client:
+            defaults = client.get("/lookup").json()
+            report = client.get("/report").json()
+            assert report == [{"work_mem": "64MB", "jit": "off"}] * 2
+            # The connection went back with the defaults
+            assert client.get("/lookup").json() == defaults
+        assert defaults["work_mem"] != "64MB"
+
+    def test_one_round_trip_with_the_deadline(self, pg_session_maker):
+        app = make_app()
+        app.add_middleware(DeadlineMiddleware, timeout=5)
+        statements = []
+
+        def count(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        with TestClient(app) as client:
+            engine = pg_session_maker.kw["bind"]
+            event.listen(engine, "before_cursor_execute", count)
+            try:
+                client.get("/report")
+            finally:
+                event.remove(engine, "before_cursor_execute", count)
+        set_configs = [x for x in statements if "set_config" in x]
+        # One per transaction, each with the profile and statement_timeout
+        assert len(set_configs) == 2
+        assert all(x.count("set_config(") == 3 for x in set_configs)
+        assert not [x for x in statements if x.startswith("SET")]
+
+    def test_session_info_outside_a_request(self, pg_session_maker):
+        db = pg_session_maker()
+        try:
+            db.info["db_settings"] = {"work_mem": "32MB"}
+            assert show_settings(db)["work_mem"] == "32MB"
+        finally:
+            db.close()
+
+    def test_resolve_profile(self):
+        assert resolve_profile("report") == {"work_mem": "64MB", "jit": "off"}
+        assert resolve_profile({"work_mem": 65536}) == {"work_mem": "65536"}
+        with pytest.raises(ValueError):
+            resolve_profile("missing")
+        with pytest.raises(ValueError):
+            resolve_profile({"statement_timeout": "1s"})
+
+    def test_viewset_and_action_profiles(self):
+        class ExportViewSet(GenericViewSet):
+            settings_profile = "report"
+
+            @action(methods=["GET"])
+            def orders(self):
+                return {}
+
+            @action(methods=["GET"], settings_profile={"work_mem": "256MB"})
+            def ledger(self):
+                return {}
+
+        router, _ = ExportViewSet.as_view()
+        profiles = {
+            route.path: [
+                dependency.dependency.settings
+                for dependency in route.dependencies
+                if isinstance(dependency.dependency, SettingsProfile)
+            ]
+            for route in router.routes
+        }
+        assert profiles == {
+            "/export/orders": [{"work_mem": "64MB", "jit": "off"}],
+            "/export/ledger": [{"work_mem": "256MB"}],
+        }
@@ -0,0 +1,129 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine, exc, text
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+
+from core.db import retry
+from core.db.retry import RetryPolicy, is_transient, retry_transient
+
+
+class FakeOrig(Exception):
+    def __init__(self, sqlstate):
+        super().__init__(sqlstate)
+        self.sqlstate = sqlstate
+
+
+def db_error(sqlstate, invalidated=False):
+    return exc.OperationalError("SELECT 1", {}, FakeOrig(sqlstate), connection_invalidated=invalidated)
+
+
+class Flaky:
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    slept = []
+    monkeypatch.setattr(retry.time, "sleep", slept.append)
+    return slept
+
+
+def test_is_transient():
+    assert is_transient(db_error("40001"))
+    assert is_transient(db_error("57P01"))
+    assert is_transient(db_error(None, invalidated=True))
+    assert not is_transient(db_error("23505"))
+    assert not is_transient(ValueError())
+
+
+class TestRetryPolicy:
+    def test_retries_transient_errors(self, no_sleep):
+        func = Flaky(db_error("40001"), db_error("40P01"))
+        assert RetryPolicy(attempts=3, base_delay=0.05).call(func) == "ok"
+        assert func.calls == 3
+        assert len(no_sleep) == 2
+        assert 0 <= no_sleep[0] <= 0.05 and 0 <= no_sleep[1] <= 0.1
+
+    def test_gives_up_after_attempts(self):
+        func = Flaky(db_error("40001"), db_error("40001"))
+        with pytest.raises(exc.OperationalError):
+            RetryPolicy(attempts=2).call(func)
+        assert func.calls == 2
+
+    def test_other_errors_are_not_retried(self):
+        func = Flaky(db_error("23505"))
+        with pytest.raises(exc.OperationalError):
+            RetryPolicy().call(func)
+        assert func.calls == 1
+
+    def test_budget(self):
+        func = Flaky(db_error("40001"))
+        with pytest.raises(exc.OperationalError):
+            RetryPolicy(base_delay=1, max_delay=1, budget=0).call(func)
+        assert func.calls == 1
+
+    def test_async(self, monkeypatch):
+        async def no_sleep(delay):
+            pass
+
+        monkeypatch.setattr(retry.asyncio, "sleep", no_sleep)
+        flaky = Flaky(db_error("40001"))
+
+        @retry_transient()
+        async def read():
+            return flaky()
+
+        assert asyncio.run(read()) == "ok"
+        assert flaky.calls == 2
+
+
+class TestRetryTransient:
+    def test_rolls_back_the_viewset_session(self):
+        rolled_back = []
+
+        class FakeSession(Session):
+            def rollback(self):
+                rolled_back.append(True)
+
+        class View:
+            db = FakeSession()
+            flaky = Flaky(db_error("40001"))
+
+            @retry_transient()
+            def summary(self, id: int):
+                return self.flaky()
+
+        assert View().summary(1) == "ok"
+        assert rolled_back == [True]
+        assert View.summary.__wrapped__.__name__ == "summary"
+
+    def test_recovers_from_a_dropped_connection(self, postgresql_proc):
+        url = (
+            f"postgresql+psycopg2://{postgresql_proc.user}@{postgresql_proc.host}"
+            f":{postgresql_proc.port}/postgres"
+        )
+        engine = create_engine(url)
+        admin = create_engine(url, poolclass=NullPool)
+        try:
+            with Session(engine) as db:
+                pid = db.execute(text("SELECT pg_backend_pid()")).scalar()
+                with admin.connect() as connection:
+                    connection.execute(text(f"SELECT pg_terminate_backend({pid})"))
+
+                def read():
+                    return db.execute(text("SELECT pg_backend_pid()")).scalar()
+
+                assert RetryPolicy().call(read, db) != pid
+        finally:
+            engine.dispose()
+            admin.dispose()
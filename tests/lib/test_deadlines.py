@@ -0,0 +1,225 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import Depends, FastAPI, Request
+from sqlalchemy import text
+from sqlalchemy.exc import DatabaseError
+from sqlalchemy.orm import Session
+from starlette.testclient import TestClient
+
+from core.db.deadlines import (
+    Deadline,
+    DeadlineMiddleware,
+    requested_timeout,
+    restart_budget,
+    set_deadline,
+)
+from core.db.session import RequestSessionMiddleware, get_db
+from core.lib.decorators import action
+from core.lib.viewsets import GenericViewSet
+from core.main import handle_db_error
+
+
+def http_scope(method: str, path: str, query_string: bytes = b"") -> dict:
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query_string,
+        "headers": [],
+        "client": ("test", 1),
+        "server": ("test", 80),
+    }
+
+
+def make_app(timeout: float | None = 5) -> FastAPI:
+    app = FastAPI()
+    app.add_exception_handler(DatabaseError, handle_db_error)
+    app.add_middleware(RequestSessionMiddleware)
+    app.add_middleware(DeadlineMiddleware, timeout=timeout)
+
+    @app.get("/sleep")
+    def sleep(seconds: float, db: Session = Depends(get_db)):
+        db.execute(text("SELECT pg_sleep(:seconds)"), {"seconds": seconds})
+        return {}
+
+    @app.get("/fast", dependencies=[Depends(Deadline(0.3))])
+    def fast(seconds: float, db: Session = Depends(get_db)):
+        db.execute(text("SELECT pg_sleep(:seconds)"), {"seconds": seconds})
+        return {}
+
+    @app.get("/statement-timeout")
+    def statement_timeout(db: Session = Depends(get_db)):
+        return {"timeout": db.execute(text("SHOW statement_timeout")).scalar()}
+
+    @app.post("/upload")
+    async def upload(request: Request, db: Session = Depends(get_db)):
+        body = await request.body()
+        db.execute(text("SELECT 1"))
+        return {"size": len(body)}
+
+    @app.get("/late")
+    def late(db: Session = Depends(get_db)):
+        time.sleep(0.3)
+        db.execute(text("SELECT 1"))
+        return {}
+
+    return app
+
+
+class TestDeadlines:
+    def test_statement_timeout_is_the_remaining_budget(self, pg_session_maker):
+        with TestClient(make_app()) as client:
+            timeout = client.get("/statement-timeout").json()["timeout"]
+        assert timeout.endswith("ms")
+        assert 4000 < int(timeout[:-2]) <= 5000
+
+    def test_route_budget_stops_the_query(self, pg_session_maker):
+        with TestClient(make_app()) as client:
+            started_at = time.monotonic()
+            response = client.get("/fast", params={"seconds": 3})
+        assert time.monotonic() - started_at < 2
+        assert response.status_code == 408
+        assert response.json()["detail"][0]["type"] == "request_timeout"
+
+    def test_client_header_shortens_the_budget(self, pg_session_maker):
+        with TestClient(make_app()) as client:
+            response = client.get(
+                "/sleep", params={"seconds": 3}, headers={"X-Request-Timeout": "0.3"}
+            )
+            assert response.status_code == 408
+            # Not past the route budget
+            timeout = client.get("/statement-timeout", headers={"X-Request-Timeout": "60"})
+            assert int(timeout.json()["timeout"][:-2]) <= 5000
+
+    def test_no_transaction_starts_after_the_deadline(self, pg_session_maker):
+        with TestClient(make_app(timeout=0.1)) as client:
+            response = client.get("/late")
+        assert response.status_code == 408
+
+    def test_no_deadline(self, pg_session_maker):
+        with TestClient(make_app(timeout=None)) as client:
+            assert client.get("/statement-timeout").json()["timeout"] == "0"
+
+    def test_disconnect_cancels_the_query(self, pg_session_maker):
+        app = make_app()
+        sent = []
+        messages = [{"type": "http.request", "body": b"", "more_body": False}]
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            await asyncio.sleep(0.3)
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+
+        started_at = time.monotonic()
+        asyncio.run(app(http_scope("GET", "/sleep", b"seconds=4"), receive, send))
+        assert time.monotonic() - started_at < 2
+        assert sent[0]["status"] == 408
+
+    def test_slow_upload_keeps_its_budget(self, pg_session_maker):
+        sent = []
+        chunks = [b"a", b"b", b"c"]
+
+        async def receive():
+            await asyncio.sleep(0.3)
+            body = chunks.pop(0)
+            return {"type": "http.request", "body": body, "more_body": bool(chunks)}
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(make_app(timeout=0.5)(http_scope("POST", "/upload"), receive, send))
+        assert sent[0]["status"] == 200
+        assert sent[1]["body"] == b'{"size":3}'
+
+    def test_body_is_not_read_ahead(self):
+        pulled = []
+        consumed = []
+
+        async def receive():
+            if len(pulled) == 10:
+                # Like a server, nothing more until the client goes away
+                await asyncio.Event().wait()
+            pulled.append(1)
+            return {"type": "http.request", "body": b"x", "more_body": len(pulled) < 10}
+
+        async def app(scope, receive, send):
+            await receive()
+            await asyncio.sleep(0.05)
+            consumed.append(len(pulled))
+            while (await receive()).get("more_body"):
+                pass
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+
+        async def send(message):
+            pass
+
+        asyncio.run(DeadlineMiddleware(app, timeout=5)(http_scope("POST", "/"), receive, send))
+        # One message queued and one waiting in the watcher, not the body
+        assert consumed == [3]
+
+
+class TestSetDeadline:
+    def scope(self, headers=()):
+        return {"type": "http", "headers": list(headers), "state": {"started_at": 100.0}}
+
+    def test_client_can_only_shorten(self):
+        scope = self.scope([(b"x-request-timeout", b"2")])
+        set_deadline(scope, 10)
+        assert scope["state"]["deadline"] == 102
+        set_deadline(scope, 1)
+        assert scope["state"]["deadline"] == 101
+
+    def test_invalid_header_is_ignored(self):
+        for value in [b"soon", b"-1", b"0"]:
+            assert requested_timeout(self.scope([(b"x-request-timeout", value)])) is None
+
+    def test_restart_keeps_the_budget(self):
+        scope = self.scope()
+        set_deadline(scope, 10)
+        restart_budget(scope["state"])
+        state = scope["state"]
+        assert state["started_at"] > 100
+        assert state["deadline"] - state["started_at"] == pytest.approx(10)
+
+    def test_none_removes_the_deadline(self):
+        scope = self.scope()
+        set_deadline(scope, 10)
+        set_deadline(scope, None)
+        assert "deadline" not in scope["state"]
+
+
+class TestViewSetTimeouts:
+    def test_viewset_and_action_budgets(self):
+        class ReportViewSet(GenericViewSet):
+            timeout = 10
+
+            @action(methods=["GET"])
+            def summary(self):
+                return {}
+
+            @action(methods=["GET"], timeout=60)
+            def export(self):
+                return {}
+
+        router, _ = ReportViewSet.as_view()
+        budgets = {
+            route.path: [
+                dependency.dependency.seconds
+                for dependency in route.dependencies
+                if isinstance(dependency.dependency, Deadline)
+            ]
+            for route in router.routes
+        }
+        assert budgets == {"/report/summary": [10], "/report/export": [60]}
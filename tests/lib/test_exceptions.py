@@ -9,6 +9,8 @@ from core.lib.exceptions import (
     InvalidForeignKey,
     LimitExceeded,
     NotFound,
+    PayloadTooLarge,
+    ServiceUnavailable,
     SuccessResponse,
     SuspiciousError,
 )
@@ -99,6 +101,25 @@ class TestCustomExceptions:
         assert exc_info.value.detail[0]["type"] == "Limit Exceeded"
         assert exc_info.value.headers is None
 
+    # Test Payload Too Large
+    def test_payload_too_large(self):
+        with pytest.raises(PayloadTooLarge) as exc_info:
+            raise PayloadTooLarge(exception_type="Payload Too Large")
+
+        assert exc_info.value.status_code == 413
+        assert exc_info.value.detail[0]["type"] == "Payload Too Large"
+        assert exc_info.value.headers is None
+
+    def test_service_unavailable_exception(self):
+        with pytest.raises(ServiceUnavailable) as exc_info:
+            raise ServiceUnavailable(
+                exception_type="Busy", headers={"Retry-After": "1"}
+            )
+
+        assert exc_info.value.status_code == 503
+        assert exc_info.value.detail[0]["type"] == "Busy"
+        assert exc_info.value.headers == {"Retry-After": "1"}
+
     # Test Authenticatin Error
     def test_authentication_error(self):
         with pytest.raises(AuthenticationError) as exc_info:
@@ -0,0 +1,191 @@
+import hashlib
+import io
+import time
+
+import pytest
+from fastapi import Request, UploadFile
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+
+from core.lib import file
+from core.lib.authentication import create_access_token
+from core.lib.file import parse_range, router
+from core.lib.media import download_signature
+from core.lib.storage import FileSystemStorage, get_storage
+from core.lib.viewsets import ModelViewSet
+from core.main import create_app
+
+DATA = bytes(range(256)) * 4
+
+
+def link(key: str, expires: int | None = None) -> str:
+    expires = expires or int(time.time()) + 60
+    return f"/files/{key}?expires={expires}&signature={download_signature(key, expires)}"
+
+
+@pytest.fixture()
+def file_client(tmp_path):
+    storage = FileSystemStorage(root=str(tmp_path))
+    stored = storage.save(io.BytesIO(DATA), filename="document.bin")
+    app = create_app()
+    app.include_router(router)
+    app.dependency_overrides[get_storage] = lambda: storage
+    token = create_access_token({"udi": "60123456789", "sid": None})
+    with TestClient(app, headers={"access-token": token}) as client:
+        client.storage = storage
+        yield client, stored.key
+
+
+class TestDownload:
+    def test_requires_authentication(self, file_client):
+        client, key = file_client
+        response = client.get(link(key), headers={"access-token": ""})
+        assert response.status_code == 401
+
+    def test_full_download(self, file_client):
+        client, key = file_client
+        response = client.get(link(key))
+        assert response.status_code == 200
+        assert response.content == DATA
+        assert response.headers["etag"] == f'"{hashlib.sha256(DATA).hexdigest()}"'
+        assert response.headers["accept-ranges"] == "bytes"
+
+    def test_if_none_match(self, file_client):
+        client, key = file_client
+        etag = client.get(link(key)).headers["etag"]
+        response = client.get(link(key), headers={"if-none-match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+
+    def test_range(self, file_client):
+        client, key = file_client
+        response = client.get(link(key), headers={"range": "bytes=10-19"})
+        assert response.status_code == 206
+        assert response.content == DATA[10:20]
+        assert response.headers["content-range"] == f"bytes 10-19/{len(DATA)}"
+
+    def test_unsatisfiable_range(self, file_client):
+        client, key = file_client
+        response = client.get(link(key), headers={"range": "bytes=5000-"})
+        assert response.status_code == 416
+        assert response.headers["content-range"] == f"bytes */{len(DATA)}"
+
+    def test_missing_file(self, file_client):
+        client, _ = file_client
+        response = client.get(link(f"{'0' * 64}.bin"))
+        assert response.status_code == 404
+
+    def test_requires_a_signed_link(self, file_client):
+        client, key = file_client
+        assert client.get(f"/files/{key}").status_code == 403
+        expired = int(time.time()) - 1
+        assert client.get(link(key, expires=expired)).status_code == 403
+        tampered = link(key).replace("signature=", "signature=0")
+        assert client.get(tampered).status_code == 403
+
+    def test_active_content_is_an_attachment(self, file_client):
+        client, _ = file_client
+        page = client.storage.save(io.BytesIO(b"<script>alert(1)</script>"), filename="a.html")
+        response = client.get(link(page.key))
+        assert response.headers["content-type"] == "application/octet-stream"
+        assert response.headers["content-disposition"] == "attachment"
+        assert response.headers["x-content-type-options"] == "nosniff"
+        # The same bytes under an image extension are not sniffed as HTML
+        image = link(page.key.replace(".html", ".png"))
+        response = client.get(image)
+        assert response.headers["content-type"] == "image/png"
+        assert response.headers["x-content-type-options"] == "nosniff"
+        assert "sandbox" in response.headers["content-security-policy"]
+
+
+class TestParseRange:
+    def test_suffix_range(self):
+        assert parse_range("bytes=-100", 1024) == (924, 100)
+
+    def test_open_ended_range(self):
+        assert parse_range("bytes=1000-", 1024) == (1000, 24)
+
+    def test_multi_range_sends_full_content(self):
+        assert parse_range("bytes=0-1,5-6", 1024) is None
+
+
+class UploadBase(DeclarativeBase):
+    pass
+
+
+class Attachment(UploadBase):
+    __tablename__ = "attachment"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column(unique=True)
+    document: Mapped[str | None]
+
+
+class AttachmentSchema(BaseModel):
+    name: str
+    document: UploadFile | None = None
+
+
+class AttachmentViewSet(ModelViewSet):
+    model = Attachment
+    schema = AttachmentSchema
+
+
+class RecordingStorage(FileSystemStorage):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.deleted = []
+
+    def delete(self, key: str):
+        self.deleted.append(key)
+
+
+@pytest.fixture()
+def uploads(tmp_path, pg_session_maker, monkeypatch):
+    storage = RecordingStorage(root=str(tmp_path))
+    monkeypatch.setattr(file, "get_storage", lambda: storage)
+    db = pg_session_maker()
+    UploadBase.metadata.create_all(db.get_bind())
+    db.add_all([Attachment(id=1, name="a", document="old.bin"), Attachment(id=2, name="b")])
+    db.commit()
+    yield AttachmentViewSet(), db, storage
+    db.rollback()
+    UploadBase.metadata.drop_all(db.get_bind())
+    db.close()
+
+
+def upload(content: bytes = DATA) -> UploadFile:
+    return UploadFile(io.BytesIO(content), size=len(content), filename="document.bin")
+
+
+class TestUpdateWithUpload:
+    def test_replaced_file_is_deleted(self, uploads):
+        viewset, db, storage = uploads
+        obj = viewset.update_with_upload(
+            Request({"type": "http"}), db=db, id=1, name="a", document=upload()
+        )
+        assert obj.document != "old.bin"
+        assert storage.deleted == ["old.bin"]
+
+    def test_file_not_sent_is_kept(self, uploads):
+        viewset, db, storage = uploads
+        obj = viewset.update_with_upload(
+            Request({"type": "http"}), db=db, id=1, name="c", document=None
+        )
+        assert obj.document == "old.bin"
+        assert storage.deleted == []
+
+    def test_uploads_are_deleted_on_any_error(self, uploads, monkeypatch):
+        viewset, db, storage = uploads
+
+        def commit():
+            raise RuntimeError("connection lost")
+
+        monkeypatch.setattr(db, "commit", commit)
+        with pytest.raises(RuntimeError):
+            viewset.update_with_upload(
+                Request({"type": "http"}), db=db, id=1, name="a", document=upload()
+            )
+        assert len(storage.deleted) == 1
+        assert "old.bin" not in storage.deleted
@@ -0,0 +1,132 @@
+import base64
+import json
+import uuid
+
+import pytest
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+
+from core.lib.media import MediaURLSigner, download_signature, presign_media, verify_download
+from core.lib.pydantic import MediaURL, Schema
+
+UNTRANSLATE = str.maketrans("-_~", "+=/")
+
+
+@pytest.fixture(scope="module")
+def private_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+@pytest.fixture()
+def signer(private_key, tmp_path):
+    key_path = tmp_path / "cloudfront.pem"
+    key_path.write_bytes(
+        private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+    )
+    return MediaURLSigner(
+        base_url="https://cdn.example.com",
+        key_pair_id="KTEST",
+        private_key_path=str(key_path),
+    )
+
+
+class TestMediaURLSigner:
+    def test_signature_is_valid_custom_policy(self, signer, private_key):
+        url = signer.url_for("avatars/a.png")
+        resource, query = url.split("?")
+        params = dict(x.split("=", 1) for x in query.split("&"))
+        assert resource == "https://cdn.example.com/avatars/a.png"
+        assert params["Key-Pair-Id"] == "KTEST"
+
+        policy = base64.b64decode(params["Policy"].translate(UNTRANSLATE))
+        statement = json.loads(policy)["Statement"][0]
+        assert statement["Resource"] == "https://cdn.example.com/avatars/*"
+        expires = statement["Condition"]["DateLessThan"]["AWS:EpochTime"]
+        assert expires % signer.expiry_granularity == 0
+        signature = base64.b64decode(params["Signature"].translate(UNTRANSLATE))
+        private_key.public_key().verify(
+            signature, policy, padding.PKCS1v15(), hashes.SHA1()
+        )
+
+    def test_one_signature_per_prefix(self, signer):
+        calls = []
+        sign = signer._sign
+        signer._sign = lambda scope, expires: calls.append(scope) or sign(scope, expires)
+
+        keys = ["avatars/a.png", "avatars/b.png", "docs/c.pdf", "d.png", "avatars/a.png", None]
+        urls = signer.sign_many(keys)
+        assert signer.sign_many(keys) == urls
+        assert sorted(calls) == ["", "avatars/", "docs/"]
+        assert urls["avatars/b.png"].startswith("https://cdn.example.com/avatars/b.png?")
+
+    def test_expiring_signature_is_renewed(self, signer):
+        url = signer.url_for("a.png")
+        signer._cache[""] = ("stale", 0)
+        assert signer.url_for("a.png") == url
+        assert signer._cache[""][1] > 0
+
+    def test_own_urls_are_signed_again(self, signer):
+        url = signer.url_for("avatars/a.png")
+        for value in ["https://cdn.example.com/avatars/a.png", url.split("&")[0]]:
+            assert signer.url_for(value) == url
+        assert signer.url_for("https://other/b.png") == "https://other/b.png"
+
+    def test_download_links_without_cloudfront(self):
+        signer = MediaURLSigner()
+        path, query = signer.url_for("a.png").split("?")
+        params = dict(x.split("=") for x in query.split("&"))
+        assert path == "/authentication/files/a.png"
+        assert verify_download("a.png", int(params["expires"]), params["signature"])
+        assert not verify_download("b.png", int(params["expires"]), params["signature"])
+        assert not verify_download("a.png", int(params["expires"]) + 1, params["signature"])
+        assert not verify_download("a.png", 1, download_signature("a.png", 1))
+
+    def test_unsigned_without_key_pair(self):
+        signer = MediaURLSigner(base_url="https://cdn.example.com/")
+        assert signer.url_for("a.png") == "https://cdn.example.com/a.png"
+        assert signer.url_for("https://other/b.png") == "https://other/b.png"
+
+
+class AvatarSchema(Schema):
+    name: str
+    profile_picture: MediaURL | None = None
+
+
+class TestMediaURLField:
+    def test_field_renders_url(self):
+        row = AvatarSchema(name="a", profile_picture="abc.png")
+        path, query = row.profile_picture.split("?")
+        assert path == "/authentication/files/abc.png"
+        params = dict(x.split("=") for x in query.split("&"))
+        assert verify_download("abc.png", int(params["expires"]), params["signature"])
+        assert AvatarSchema(name="a").profile_picture is None
+        # validating an already rendered URL keeps it as is
+        assert AvatarSchema(**row.dict()).profile_picture == row.profile_picture
+
+    def test_presign_media_signs_page_once(self, signer, monkeypatch):
+        monkeypatch.setattr("core.lib.media.media_signer", signer)
+        rows = [{"name": str(i), "profile_picture": f"{i % 3}.png"} for i in range(9)]
+        presign_media(AvatarSchema, rows)
+        assert set(signer._cache) == {""}
+
+    def test_manage_user_body_keeps_the_stored_key(self):
+        from apps.user.routers.manage import ManageUserViewSet
+
+        viewset = ManageUserViewSet()
+        data = {
+            "id": uuid.uuid4(),
+            "name": "a",
+            "email": "a@example.com",
+            "profile_picture": "abc.png",
+            "phone_number": "+95900000000",
+            "is_active": True,
+            "is_locked": False,
+        }
+        for action in ["create", "update"]:
+            body = viewset.get_schema_class(action)(**data)
+            assert body.dict()["profile_picture"] == "abc.png"
+        assert viewset.get_schema_class("retrieve").__fields__["profile_picture"].type_ is MediaURL
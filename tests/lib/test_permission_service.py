@@ -0,0 +1,165 @@
+import asyncio
+import uuid
+
+import grpc
+import pytest
+from starlette.requests import Request
+
+from core.lib import permissions
+from core.lib.exceptions import ServiceUnavailable
+from core.lib.permissions import (
+    PermissionClient,
+    get_remote_permission_mask,
+    permission_bits,
+    route_permission_keys,
+)
+from core.protos.permissions_pb2 import BatchCheckRequest, PermissionCheck
+from services.permissions.server import PermissionServicer
+
+ALICE = str(uuid.uuid4())
+BOB = str(uuid.uuid4())
+GRANTS = {
+    ALICE: frozenset({("PermissionPolicy", "List"), ("PermissionPolicy", "Create")}),
+    BOB: frozenset({("PermissionPolicy", "List")}),
+}
+
+
+class CountingServicer(PermissionServicer):
+    def __init__(self):
+        super().__init__(resolve=lambda subject: GRANTS.get(subject, frozenset()))
+        self.batches = []
+
+    def BatchCheck(self, request, context):
+        self.batches.append(len(request.checks))
+        return super().BatchCheck(request, context)
+
+
+@pytest.fixture(scope="module")
+def grpc_add_to_server():
+    from core.protos.permissions_pb2_grpc import add_PermissionServiceServicer_to_server
+
+    return add_PermissionServiceServicer_to_server
+
+
+@pytest.fixture(scope="module")
+def grpc_servicer():
+    return CountingServicer()
+
+
+@pytest.fixture(scope="module")
+def grpc_stub_cls():
+    from core.protos.permissions_pb2_grpc import PermissionServiceStub
+
+    return PermissionServiceStub
+
+
+@pytest.fixture
+def client(grpc_create_channel, grpc_servicer):
+    grpc_servicer.batches.clear()
+    channels = []
+
+    def channel_factory():
+        channels.append(grpc_create_channel())
+        return channels[-1]
+
+    client = PermissionClient("test", pool_size=2, channel_factory=channel_factory)
+    client.created_channels = channels
+    yield client
+    client.close()
+
+
+class TestPermissionServicer:
+    def test_check(self, grpc_stub):
+        decision = grpc_stub.Check(
+            PermissionCheck(subject=BOB, model="PermissionPolicy", action="List")
+        )
+        assert decision.allowed
+        assert decision.ttl_seconds > 0
+
+    def test_batch_check_keeps_order(self, grpc_stub):
+        response = grpc_stub.BatchCheck(
+            BatchCheckRequest(
+                checks=[
+                    PermissionCheck(subject=BOB, model="PermissionPolicy", action="Create"),
+                    PermissionCheck(subject=ALICE, model="PermissionPolicy", action="Create"),
+                    PermissionCheck(subject="nobody", model="PermissionPolicy", action="List"),
+                ]
+            )
+        )
+        assert [x.allowed for x in response.decisions] == [False, True, False]
+
+
+class TestPermissionClient:
+    def test_decisions_are_cached(self, client, grpc_servicer):
+        assert client.check(ALICE, "PermissionPolicy", "List")
+        assert client.check(ALICE, "PermissionPolicy", "List")
+        assert not client.check(BOB, "PermissionPolicy", "Create")
+        assert grpc_servicer.batches == [1, 1]
+
+    def test_misses_are_batched(self, client, grpc_servicer):
+        client.check(BOB, "PermissionPolicy", "List")
+        checks = [
+            (BOB, "PermissionPolicy", "List"),
+            (ALICE, "PermissionPolicy", "Create"),
+            (ALICE, "PermissionPolicy", "Delete"),
+            (ALICE, "PermissionPolicy", "Create"),
+        ]
+        assert client.check_many(checks) == [True, True, False, True]
+        # The cached decision is not sent again, duplicates only once
+        assert grpc_servicer.batches == [1, 2]
+
+    def test_channels_are_pooled(self, client):
+        for action in ["List", "Create", "Update", "Delete"]:
+            client.check(ALICE, "PermissionPolicy", action)
+        assert len(client.created_channels) == 2
+
+    def test_invalidation_drops_decisions(self, client, grpc_servicer):
+        client.check(ALICE, "PermissionPolicy", "List")
+        permissions.invalidation_bus.dispatch(f"principal:policy:{1}")
+        client.check(ALICE, "PermissionPolicy", "List")
+        assert grpc_servicer.batches == [1, 1]
+
+    def test_server_ttl_caps_the_cache(self, client, grpc_servicer, monkeypatch):
+        monkeypatch.setattr(grpc_servicer, "decision_ttl", 0)
+        client.check(ALICE, "PermissionPolicy", "List")
+        client.check(ALICE, "PermissionPolicy", "List")
+        assert grpc_servicer.batches == [1, 1]
+
+    def test_async_check(self, client, grpc_servicer):
+        assert asyncio.run(client.acheck(ALICE, "PermissionPolicy", "Create"))
+        assert asyncio.run(client.acheck_many([(ALICE, "PermissionPolicy", "Create")])) == [
+            True
+        ]
+        assert grpc_servicer.batches == [1]
+
+    def test_unavailable_service(self):
+        client = PermissionClient(
+            "test",
+            timeout=0.2,
+            channel_factory=lambda: grpc.insecure_channel("localhost:1"),
+        )
+        with pytest.raises(ServiceUnavailable):
+            client.check(ALICE, "PermissionPolicy", "List")
+        client.close()
+
+
+def make_request(endpoint, method="GET"):
+    return Request({"type": "http", "method": method, "endpoint": endpoint, "headers": []})
+
+
+class TestRemotePermissionMask:
+    def test_mask_for_route(self, client, monkeypatch):
+        def endpoint():
+            pass
+
+        monkeypatch.setattr(permissions, "permission_client", client)
+        monkeypatch.setitem(route_permission_keys, (endpoint, "GET"), ("PermissionPolicy", "List"))
+        monkeypatch.setitem(route_permission_keys, (endpoint, "POST"), ("PermissionPolicy", "Create"))
+        bit = permission_bits[("PermissionPolicy", "List")]
+
+        request = make_request(endpoint)
+        assert asyncio.run(get_remote_permission_mask(request, BOB)) == bit
+        request = make_request(endpoint, "POST")
+        assert asyncio.run(get_remote_permission_mask(request, BOB)) == 0
+        # Routes outside the catalog need no decision
+        assert asyncio.run(get_remote_permission_mask(make_request(None), BOB)) == 0
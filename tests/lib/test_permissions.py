@@ -0,0 +1,165 @@
+import uuid
+
+from fastapi import Depends, Request
+from fastapi.testclient import TestClient
+
+from apps.backoffice.permissions import PERMISSIONS
+from core.lib.authentication import create_access_token
+from core.lib.decorators import action
+from core.lib import viewsets
+from core.lib.permissions import (
+    AllowAny,
+    IsAuthenticated,
+    IsBackofficeUser,
+    PermissionGuard,
+    compile_permissions,
+    get_route_permission_key,
+    permission_bits,
+)
+from core.lib.viewsets import GenericViewSet
+from core.main import create_app
+
+
+class PushNotificationViewSet(GenericViewSet):
+    permission_classes = [IsBackofficeUser]
+
+    @action(detail=False, method="POST")
+    def send(self):
+        return {}
+
+    @action(detail=False, method="GET", permission_key="List")
+    def all(self):
+        return {}
+
+    @action(detail=False, method="GET")
+    def ping(self):
+        return {}
+
+    @action(detail=False, method="GET", permission_classes=[AllowAny])
+    def status(self):
+        return {}
+
+
+def make_client(granted):
+    async def attach_permissions(request: Request):
+        request.state.permission_mask = compile_permissions(frozenset(granted))
+
+    app = create_app(dependencies=[Depends(attach_permissions)])
+    PushNotificationViewSet.add_to(app)
+    token = create_access_token(
+        {
+            "udi": "bo@example.com",
+            "sid": str(uuid.uuid4()),
+            "is_active": True,
+            "scopes": ["Backoffice", "Staff"],
+        }
+    )
+    return TestClient(app, headers={"Authorization": f"Bearer {token}"})
+
+
+class TestPermissionBits:
+    def test_catalog_has_distinct_bits(self):
+        bits = [permission_bits[permission] for permission in PERMISSIONS]
+        assert len(set(bits)) == len(PERMISSIONS)
+        assert all(bit and not bit & (bit - 1) for bit in bits)
+
+    def test_compile_ignores_unknown_permissions(self):
+        mask = compile_permissions(frozenset({("PushNotification", "List"), ("Nope", "List")}))
+        assert mask == permission_bits[("PushNotification", "List")]
+
+    def test_route_permission_key(self):
+        view = PushNotificationViewSet()
+        assert get_route_permission_key(view, "_list", "GET") == (
+            "PushNotification",
+            "List",
+        )
+        assert get_route_permission_key(view, "initial_form_data", "GET") == (
+            "PushNotification",
+            "Update",
+        )
+        assert get_route_permission_key(
+            view, "locked_history", "GET", is_action=True
+        ) == ("PushNotification", "View Locked History")
+
+
+class TestIsBackofficeUser:
+    def test_granted(self):
+        client = make_client({("PushNotification", "Send"), ("PushNotification", "List")})
+        assert client.post("/push-notification/send").status_code == 200
+        assert client.get("/push-notification/all").status_code == 200
+
+    def test_not_granted(self):
+        client = make_client({("PushNotification", "List")})
+        response = client.post("/push-notification/send")
+        assert response.status_code == 403
+        assert response.json() == {
+            "detail": "You are not permitted to perform this action."
+        }
+
+    def test_route_outside_catalog_only_needs_scope(self):
+        assert make_client(set()).get("/push-notification/ping").status_code == 200
+
+
+def build_app(monkeypatch=None, legacy=False):
+    if legacy:
+        monkeypatch.setattr(
+            viewsets,
+            "permission_dependencies",
+            lambda classes: [Depends(x) for x in classes],
+        )
+    app = create_app()
+    PushNotificationViewSet.add_to(app)
+    return app
+
+
+class TestPermissionGuard:
+    def test_one_guard_per_route(self):
+        app = build_app()
+        routes = {route.path: route for route in app.routes}
+        guards = [
+            dep.dependency
+            for dep in routes["/push-notification/ping"].dependencies
+        ]
+        assert len(guards) == 1 and isinstance(guards[0], PermissionGuard)
+        assert guards[0].permission_classes == (IsBackofficeUser,)
+
+    def test_same_openapi_security(self, monkeypatch):
+        schema = build_app().openapi()
+        legacy = build_app(monkeypatch, legacy=True).openapi()
+        assert schema["paths"] == legacy["paths"]
+        assert schema["components"]["securitySchemes"] == (
+            legacy["components"]["securitySchemes"]
+        )
+        assert schema["paths"]["/push-notification/ping"]["get"]["security"]
+
+    def test_same_errors(self, monkeypatch):
+        clients = [
+            TestClient(build_app()),
+            TestClient(build_app(monkeypatch, legacy=True)),
+        ]
+        mobile_token = create_access_token({"udi": "60123456789", "sid": None})
+        for headers in [
+            {},
+            {"Authorization": "Bearer"},
+            {"access-token": mobile_token},
+        ]:
+            guarded, legacy = [
+                client.get("/push-notification/ping", headers=headers)
+                for client in clients
+            ]
+            assert (guarded.status_code, guarded.json()) == (
+                legacy.status_code,
+                legacy.json(),
+            )
+            assert guarded.status_code in (401, 403)
+
+    def test_action_override(self):
+        assert TestClient(build_app()).get("/push-notification/status").status_code == 200
+
+    def test_guard_is_not_built_for_custom_constructors(self):
+        class NeedsHeader(IsAuthenticated):
+            def __init__(self, request: Request, tenant: str):
+                super().__init__(request)
+
+        dependencies = viewsets.permission_dependencies([NeedsHeader])
+        assert [x.dependency for x in dependencies] == [NeedsHeader]
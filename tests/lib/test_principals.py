@@ -0,0 +1,230 @@
+import asyncio
+import uuid
+
+import pytest
+from fastapi import Depends
+from fastapi.testclient import TestClient
+
+from apps.backoffice.helpers import (
+    ALL_PERMISSIONS,
+    ALL_PERMISSIONS_MASK,
+    attach_staff_user,
+    policy_permissions,
+    resolve_permission_mask,
+    resolve_permissions,
+    staff_principals,
+)
+from apps.backoffice.models import PermissionPolicy, StaffUser
+from apps.user.helpers import UserPrincipal, user_principals
+from apps.user.models import User
+from core.lib import cache as cache_module
+from core.lib import principals
+from core.lib.authentication import create_access_token
+from core.lib.cache import InvalidationBus, invalidation_bus
+from core.lib.decorators import action
+from core.lib.permissions import IsAuthenticated, compile_permissions
+from core.lib.viewsets import GenericViewSet
+from core.main import create_app
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.values[key] = value.encode() if isinstance(value, str) else value
+
+    def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def delete(self, *keys):
+        self.commands.append(lambda: self.redis.delete(*keys))
+
+    def publish(self, channel, message):
+        pass
+
+    def execute(self):
+        for command in self.commands:
+            command()
+
+
+@pytest.fixture()
+def fake_redis(monkeypatch, pgs):
+    fake = FakeRedis()
+    monkeypatch.setattr(principals, "async_cache", fake)
+    monkeypatch.setattr(cache_module, "cache", fake)
+    monkeypatch.setattr(InvalidationBus, "ensure_started", lambda self: None)
+    monkeypatch.setattr(invalidation_bus, "healthy", True)
+    invalidation_bus.dispatch(None)
+    return fake
+
+
+@pytest.fixture()
+def loads(monkeypatch):
+    calls = []
+    load = user_principals.load
+
+    def counting_load(db, id):
+        calls.append(id)
+        return load(db, id)
+
+    monkeypatch.setattr(user_principals, "load", counting_load)
+    return calls
+
+
+@pytest.fixture()
+def user(pgs):
+    user = User(name="Ali", phone_number=f"60{uuid.uuid4().int % 10**9:09}")
+    pgs.add(user)
+    pgs.commit()
+    yield user
+    pgs.delete(user)
+    pgs.commit()
+
+
+class TestUserPrincipals:
+    def test_user_is_loaded_once(self, fake_redis, loads, user):
+        first = asyncio.run(user_principals.get(user.id))
+        second = asyncio.run(user_principals.get(user.id))
+        assert first == second == UserPrincipal.from_model(user)
+        assert loads == [user.id]
+
+    def test_redis_copy_is_used_by_other_workers(self, fake_redis, loads, user):
+        asyncio.run(user_principals.get(user.id))
+        user_principals.entries.clear()
+        assert asyncio.run(user_principals.get(user.id)).name == "Ali"
+        assert loads == [user.id]
+
+    def test_commit_invalidates(self, fake_redis, loads, pgs, user):
+        asyncio.run(user_principals.get(user.id))
+        user.name = "Abu"
+        pgs.commit()
+        assert user_principals.key(user.id) not in fake_redis.values
+        assert asyncio.run(user_principals.get(user.id)).name == "Abu"
+        assert len(loads) == 2
+
+    def test_rollback_does_not_invalidate(self, fake_redis, loads, pgs, user):
+        asyncio.run(user_principals.get(user.id))
+        user.name = "Abu"
+        pgs.flush()
+        pgs.rollback()
+        assert asyncio.run(user_principals.get(user.id)).name == "Ali"
+        assert loads == [user.id]
+
+    def test_missing_user_is_cached(self, fake_redis, loads):
+        user_id = uuid.uuid4()
+        assert asyncio.run(user_principals.get(user_id)) is None
+        assert asyncio.run(user_principals.get(user_id)) is None
+        assert loads == [user_id]
+        assert fake_redis.values[user_principals.key(user_id)] == b""
+
+
+@pytest.fixture()
+def staff_user(pgs):
+    policy = PermissionPolicy(
+        name=f"Policy {uuid.uuid4().hex}",
+        is_active=True,
+        permissions=[["User", "List"], ["User", "Retrieve"]],
+    )
+    user = StaffUser(
+        role="Backoffice",
+        name="Staff",
+        username=f"{uuid.uuid4().hex}@example.com",
+        phone_number="60123456789",
+        password="x",
+        status="Active",
+        permission_policy=policy,
+    )
+    pgs.add(user)
+    pgs.commit()
+    yield user
+    pgs.delete(user)
+    pgs.delete(policy)
+    pgs.commit()
+
+
+class MaskViewSet(GenericViewSet):
+    permission_classes = [IsAuthenticated]
+
+    @action(detail=False, method="GET")
+    def granted(self):
+        return {"mask": self.request.state.permission_mask}
+
+
+class TestStaffPrincipals:
+    def test_permissions_are_resolved_once(self, fake_redis, staff_user):
+        async def lookup():
+            user = await staff_principals.get(staff_user.id)
+            return user, await resolve_permissions(user)
+
+        user, permissions = asyncio.run(lookup())
+        assert user.is_active
+        assert permissions == {("User", "List"), ("User", "Retrieve")}
+        assert asyncio.run(resolve_permission_mask(user)) == compile_permissions(
+            permissions
+        )
+        staff_principals.entries.clear()
+        policy_permissions.entries.clear()
+        assert asyncio.run(lookup()) == (user, permissions)  # served from Redis
+
+    def test_bulk_status_update_invalidates(self, fake_redis, pgs, staff_user):
+        assert asyncio.run(staff_principals.get(staff_user.id)).is_active
+        pgs.query(StaffUser).filter(StaffUser.id == staff_user.id).update(
+            {"status": "Blocked"}
+        )
+        pgs.commit()
+        assert not asyncio.run(staff_principals.get(staff_user.id)).is_active
+
+    def test_policy_change_invalidates(self, fake_redis, pgs, staff_user):
+        user = asyncio.run(staff_principals.get(staff_user.id))
+        assert asyncio.run(resolve_permissions(user))
+        staff_user.permission_policy.is_active = False
+        pgs.commit()
+        assert asyncio.run(resolve_permissions(user)) == frozenset()
+
+    def test_superuser_has_every_permission(self, fake_redis, pgs, staff_user):
+        staff_user.is_superuser = True
+        pgs.commit()
+        user = asyncio.run(staff_principals.get(staff_user.id))
+        assert asyncio.run(resolve_permissions(user)) is ALL_PERMISSIONS
+        assert asyncio.run(resolve_permission_mask(user)) == ALL_PERMISSIONS_MASK
+
+    def test_blocked_user_is_denied(self, fake_redis, pgs, staff_user):
+        staff_user.is_superuser = True
+        pgs.commit()
+        app = create_app(dependencies=[Depends(attach_staff_user)])
+        MaskViewSet.add_to(app)
+        token = create_access_token(
+            {"udi": staff_user.username, "sid": str(staff_user.id), "scopes": ["Staff"]}
+        )
+        with TestClient(app, headers={"Authorization": f"Bearer {token}"}) as client:
+            assert client.get("/mask/granted").json() == {"mask": ALL_PERMISSIONS_MASK}
+            pgs.query(StaffUser).filter(StaffUser.id == staff_user.id).update(
+                {"status": "Blocked"}
+            )
+            pgs.commit()
+            response = client.get("/mask/granted")
+        assert response.status_code == 401
+        assert response.json()["detail"][0]["type"] == "user.inactive"
+        user = asyncio.run(staff_principals.get(staff_user.id))
+        assert asyncio.run(resolve_permission_mask(user)) == 0
+        assert asyncio.run(resolve_permissions(user)) == frozenset()
@@ -0,0 +1,172 @@
+import asyncio
+import math
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+from core.lib import ratelimit
+from core.lib.decorators import action
+from core.lib.permissions import AllowAny
+from core.lib.ratelimit import (
+    LocalTokenBuckets,
+    RateLimit,
+    RateLimiter,
+    parse_rate,
+)
+from core.lib.viewsets import GenericViewSet
+from core.main import create_app
+
+calls = []
+
+
+class ForgotPasswordBody(BaseModel):
+    username: str
+
+
+class AccountViewSet(GenericViewSet):
+    @action(
+        detail=False,
+        method="POST",
+        permission_classes=[AllowAny],
+        rate_limit=RateLimit("2/minute", key="username"),
+    )
+    def forgot_password(self, body: ForgotPasswordBody):
+        calls.append(body.username)
+        return {}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def local_limiter(monkeypatch):
+    limiter = RateLimiter()
+    limiter._fallback_until = math.inf
+    monkeypatch.setattr(ratelimit, "rate_limiter", limiter)
+    calls.clear()
+    return limiter
+
+
+class TestParseRate:
+    def test_units(self):
+        assert parse_rate("5/minute") == (5, 60)
+        assert parse_rate("100/10 seconds") == (100, 10)
+        assert parse_rate("3 / hour") == (3, 3600)
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            parse_rate("5 per minute")
+
+
+class TestLocalTokenBuckets:
+    def test_burst_then_refill(self, clock):
+        buckets = LocalTokenBuckets(maxsize=10)
+        rate = 2 / 60
+        assert buckets.take("k", rate, 2) == (True, 0.0)
+        assert buckets.take("k", rate, 2) == (True, 0.0)
+        allowed, wait = buckets.take("k", rate, 2)
+        assert not allowed
+        assert wait == pytest.approx(30)
+        # Other keys have their own bucket
+        assert buckets.take("other", rate, 2)[0]
+
+        clock.now += 30
+        assert buckets.take("k", rate, 2)[0]
+        assert not buckets.take("k", rate, 2)[0]
+
+
+class FailingScript:
+    def __init__(self):
+        self.calls = 0
+
+    async def __call__(self, keys, args):
+        self.calls += 1
+        raise ConnectionError("redis down")
+
+
+class TestRateLimiter:
+    def test_uses_redis_script(self):
+        limiter = RateLimiter()
+
+        async def script(keys, args):
+            assert keys == ["bucket"]
+            assert args == [0.5, 3, 1]
+            return [0, b"1.5"]
+
+        limiter._script = script
+        assert asyncio.run(limiter.take("bucket", 0.5, 3)) == (False, 1.5)
+
+    def test_falls_back_while_redis_is_down(self, clock):
+        limiter = RateLimiter()
+        limiter._script = script = FailingScript()
+        assert asyncio.run(limiter.take("bucket", 1.0, 1)) == (True, 0.0)
+        assert asyncio.run(limiter.take("bucket", 1.0, 1))[0] is False
+        # Redis is not retried until the fallback window has passed
+        assert script.calls == 1
+        clock.now += ratelimit.config.rate_limit.fallback_seconds
+        asyncio.run(limiter.take("bucket", 1.0, 1))
+        assert script.calls == 2
+
+
+class TestRateLimitDependency:
+    def make_client(self):
+        app = create_app()
+        AccountViewSet.add_to(app)
+        return TestClient(app)
+
+    def test_action_rate_limit(self, local_limiter):
+        client = self.make_client()
+        url = "/account/forgot-password"
+        for _ in range(2):
+            assert client.post(url, json={"username": "a@example.com"}).status_code == 200
+        response = client.post(url, json={"username": "A@example.com "})
+        assert response.status_code == 429
+        assert response.json()["detail"][0]["type"] == "request.rate_limited"
+        assert int(response.headers["retry-after"]) > 0
+        # Rejected before the endpoint ran
+        assert calls == ["a@example.com", "a@example.com"]
+        assert client.post(url, json={"username": "b@example.com"}).status_code == 200
+
+    def test_form_body_and_plain_dependency(self, local_limiter):
+        app = FastAPI()
+
+        @app.post(
+            "/token",
+            dependencies=[
+                Depends(RateLimit("1/minute", key="username")),
+                Depends(RateLimit("3/minute", key="ip")),
+            ],
+        )
+        def token():
+            return {}
+
+        client = TestClient(app)
+        assert client.post("/token", data={"username": "a"}).status_code == 200
+        assert client.post("/token", data={"username": "a"}).status_code == 429
+        assert client.post("/token", data={"username": "b"}).status_code == 200
+        assert client.post("/token", data={"username": "c"}).status_code == 200
+        # The per-ip bucket is exhausted by now
+        assert client.post("/token", data={"username": "d"}).status_code == 429
+
+    def test_disabled(self, local_limiter, monkeypatch):
+        monkeypatch.setattr(ratelimit.config.rate_limit, "enable", False)
+        client = self.make_client()
+        for _ in range(3):
+            response = client.post(
+                "/account/forgot-password", json={"username": "a@example.com"}
+            )
+            assert response.status_code == 200
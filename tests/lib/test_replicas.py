@@ -0,0 +1,79 @@
+import pytest
+from sqlalchemy import Column, Integer, MetaData, Table, insert, select, text
+from sqlalchemy.orm import Session
+from starlette.requests import Request
+
+from core.db.replicas import STICKY_PREFIX, ReplicaRouter, client_key
+from core.lib.cache import invalidation_bus
+
+
+@pytest.fixture
+def replica_url(postgresql_proc):
+    return (
+        f"postgresql+psycopg2://{postgresql_proc.user}@{postgresql_proc.host}"
+        f":{postgresql_proc.port}/postgres"
+    )
+
+
+@pytest.fixture
+def make_router():
+    routers = []
+
+    def make_router(urls, max_lag=5):
+        routers.append(
+            ReplicaRouter(urls, max_lag=max_lag, check_interval=60, sticky_seconds=60)
+        )
+        return routers[-1]
+
+    yield make_router
+    for router in routers:
+        router.close()
+
+
+class TestReplicaRouter:
+    def test_disabled_without_replicas(self, make_router):
+        router = make_router([])
+        assert not router.enabled
+        assert router.pick("user:1") is None
+
+    def test_healthy_replica_is_picked(self, make_router, replica_url):
+        router = make_router([replica_url])
+        assert router.pick() is None
+        router.check()
+        assert router.pick() is router.engines[0]
+        assert list(router.lag.values()) == [0]
+
+    def test_unreachable_replica_is_skipped(self, make_router, replica_url):
+        router = make_router([replica_url, "postgresql+psycopg2://x@localhost:1/postgres"])
+        router.check()
+        assert router.healthy == router.engines[:1]
+        assert all(router.pick() is router.engines[0] for _ in range(3))
+
+    def test_lagging_replica_is_skipped(self, make_router, replica_url):
+        router = make_router([replica_url], max_lag=-1)
+        router.check()
+        assert router.pick() is None
+
+    def test_writer_sticks_to_primary(self, make_router, replica_url):
+        router = make_router([replica_url])
+        router.check()
+        invalidation_bus.dispatch(f"{STICKY_PREFIX}user:1")
+        assert router.pick("user:1") is None
+        assert router.pick("user:2") is router.engines[0]
+
+    def test_writes_mark_the_client(self, make_router, replica_url):
+        router = make_router([replica_url])
+        table = Table("replica_writes", MetaData(), Column("id", Integer))
+        with Session(router.engines[0]) as session:
+            session.info["client"] = "user:1"
+            session.execute(text("CREATE TEMP TABLE replica_writes (id int)"))
+            session.execute(select(table))
+            assert not session.info.get("cache_invalidations")
+            session.execute(insert(table).values(id=1))
+            assert f"{STICKY_PREFIX}user:1" in session.info["cache_invalidations"]
+            session.rollback()
+
+
+def test_client_key():
+    request = Request({"type": "http", "headers": [], "client": ("10.0.0.1", 1)})
+    assert client_key(request) == "ip:10.0.0.1"
@@ -0,0 +1,104 @@
+import uuid
+
+from fastapi import Depends, FastAPI, Request
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from starlette.testclient import TestClient
+
+from apps.user.helpers import user_principals
+from core.db import session as db_session
+from core.db.session import RequestSessionMiddleware, get_db, request_session
+from core.main import handle_db_error
+
+
+def make_app():
+    app = FastAPI()
+    app.add_middleware(RequestSessionMiddleware)
+    seen = {}
+
+    async def attach(request: Request):
+        seen["dependency"] = request_session(request)
+
+    @app.get("/with-db", dependencies=[Depends(attach)])
+    def with_db(db: Session = Depends(get_db)):
+        seen["endpoint"] = db
+        return {"one": db.execute(text("SELECT 1")).scalar()}
+
+    @app.get("/without-db", dependencies=[Depends(attach)])
+    def without_db(request: Request):
+        request_session(request).execute(text("SELECT 1"))
+        return {}
+
+    @app.get("/no-queries")
+    def no_queries(db: Session = Depends(get_db)):
+        return {}
+
+    return app, seen
+
+
+class TestRequestSession:
+    def test_dependencies_share_one_session(self, pg_session_maker):
+        app, seen = make_app()
+        with TestClient(app) as client:
+            assert client.get("/with-db").json() == {"one": 1}
+        assert seen["dependency"] is seen["endpoint"]
+        assert not seen["endpoint"].in_transaction()
+
+    def test_session_without_get_db_is_closed(self, pg_session_maker):
+        app, seen = make_app()
+        with TestClient(app) as client:
+            client.get("/without-db")
+        assert not seen["dependency"].in_transaction()
+
+    def test_connection_is_checked_out_on_first_statement(self, pg_session_maker):
+        engine = pg_session_maker.kw["bind"]
+        checkouts = []
+
+        def on_checkout(*args):
+            checkouts.append(1)
+
+        event.listen(engine, "checkout", on_checkout)
+        try:
+            app, _ = make_app()
+            with TestClient(app) as client:
+                client.get("/no-queries")
+                assert checkouts == []
+                client.get("/with-db")
+                assert len(checkouts) == 1
+        finally:
+            event.remove(engine, "checkout", on_checkout)
+
+
+class TestHandleDbError:
+    def test_rolls_back_the_request_session(self):
+        rolled_back = []
+
+        class FakeSession:
+            def rollback(self):
+                rolled_back.append(True)
+
+        request = Request({"type": "http", "state": {"db": FakeSession()}})
+        error = RuntimeError("boom")
+        try:
+            handle_db_error(request, error)
+        except RuntimeError as raised:
+            assert raised is error
+        assert rolled_back == [True]
+
+    def test_opens_no_session(self, monkeypatch):
+        def no_session():
+            raise AssertionError("no new session expected")
+
+        monkeypatch.setattr(db_session, "SessionLocal", no_session)
+        request = Request({"type": "http"})
+        try:
+            handle_db_error(request, RuntimeError("boom"))
+        except RuntimeError:
+            pass
+
+
+def test_principal_load_releases_the_connection(pgs):
+    session = Session(bind=pgs.get_bind())
+    assert user_principals._load(uuid.uuid4(), session) is None
+    assert not session.in_transaction()
+    session.close()
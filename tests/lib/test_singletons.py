@@ -0,0 +1,219 @@
+import threading
+
+import pytest
+from sqlalchemy import String, event, func, select, update
+from sqlalchemy.orm import Mapped, mapped_column
+
+from core.lib import cache as cache_module
+from core.lib import singletons
+from core.lib.cache import invalidation_bus
+from core.lib.models import SingletonBase
+from core.lib.singletons import get_or_create_singleton, singleton_key
+
+
+class SiteSetting(SingletonBase):
+    id: Mapped[int] = mapped_column(primary_key=True)
+    title: Mapped[str] = mapped_column(String(50))
+    maintenance: Mapped[bool] = mapped_column(default=False)
+
+    initial_data = {"title": "Default"}
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, nx=False):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+
+    def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def delete(self, *keys):
+        self.commands.append(lambda: self.redis.delete(*keys))
+
+    def publish(self, channel, message):
+        pass
+
+    def execute(self):
+        for command in self.commands:
+            command()
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(singletons, "cache", fake)
+    monkeypatch.setattr(cache_module, "cache", fake)
+    invalidation_bus.dispatch(None)
+    return fake
+
+
+@pytest.fixture
+def db(pgs, fake_redis):
+    yield pgs
+    pgs.rollback()
+    pgs.query(SiteSetting).delete()
+    pgs.commit()
+    invalidation_bus.dispatch(None)
+
+
+@pytest.fixture
+def queries(db):
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    engine = db.get_bind()
+    event.listen(engine, "before_cursor_execute", count)
+    yield statements
+    event.remove(engine, "before_cursor_execute", count)
+
+
+class TestSingletonCache:
+    def test_default_is_created_once(self, db, fake_redis):
+        setting = SiteSetting.get(db)
+        assert setting.title == "Default"
+        assert SiteSetting.get(db).id == setting.id
+        assert db.scalar(select(func.count()).select_from(SiteSetting)) == 1
+
+    def test_reads_are_served_from_memory(self, db, fake_redis, queries, monkeypatch):
+        # Creating the default row invalidates, the next call loads it once
+        SiteSetting.get(db)
+        db.expunge_all()
+        SiteSetting.get(db)
+        db.expunge_all()
+        queries.clear()
+        # Bus down: the version token is checked in Redis, not Postgres
+        assert SiteSetting.get(db).title == "Default"
+        monkeypatch.setattr(invalidation_bus, "healthy", True)
+        assert SiteSetting.get(db).title == "Default"
+        assert queries == []
+
+    def test_update_invalidates(self, db, fake_redis):
+        setting = SiteSetting.get(db)
+        setting.title = "Changed"
+        db.commit()
+        db.expunge_all()
+        assert SiteSetting.get(db).title == "Changed"
+
+        db.execute(update(SiteSetting).values(maintenance=True))
+        db.commit()
+        db.expunge_all()
+        assert SiteSetting.get(db).maintenance is True
+
+    def test_version_change_from_another_process(self, db, fake_redis):
+        SiteSetting.get(db)
+        db.execute(
+            update(SiteSetting)
+            .values(title="Elsewhere")
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        # Another node committed, only Redis saw it: the local entry is stale
+        singletons.singleton_cache.entries.set(
+            singleton_key(SiteSetting),
+            (b"old", {"id": 1, "title": "Stale", "maintenance": False}),
+        )
+        db.expunge_all()
+        assert SiteSetting.get(db).title == "Elsewhere"
+
+    def test_cached_instance_can_be_updated(self, db, fake_redis):
+        SiteSetting.get(db)
+        db.expunge_all()
+        setting = SiteSetting.get(db)
+        setting.title = "Through cache"
+        db.commit()
+        db.expunge_all()
+        assert db.scalar(select(SiteSetting.title)) == "Through cache"
+        assert SiteSetting.get(db).title == "Through cache"
+
+    def test_healthy_bus_does_not_ask_redis(self, db, queries, monkeypatch):
+        class DownRedis(FakeRedis):
+            def get(self, key):
+                raise ConnectionError("down")
+
+        SiteSetting.get(db)
+        db.expunge_all()
+        monkeypatch.setattr(singletons, "cache", DownRedis())
+        monkeypatch.setattr(invalidation_bus, "healthy", True)
+        invalidation_bus.dispatch(None)
+        assert SiteSetting.get(db).title == "Default"
+        db.expunge_all()
+        queries.clear()
+        assert SiteSetting.get(db).title == "Default"
+        assert queries == []
+
+    def test_models_are_registered_when_defined(self):
+        class WriteOnlySetting(SingletonBase):
+            id: Mapped[int] = mapped_column(primary_key=True)
+
+        SingletonBase.metadata.remove(WriteOnlySetting.__table__)
+        assert WriteOnlySetting in cache_module._invalidators
+
+    def test_works_without_redis(self, db, monkeypatch):
+        class DownRedis(FakeRedis):
+            def get(self, key):
+                raise ConnectionError("down")
+
+        monkeypatch.setattr(singletons, "cache", DownRedis())
+        monkeypatch.setattr(cache_module, "cache", DownRedis())
+        invalidation_bus.dispatch(None)
+        assert SiteSetting.get(db).title == "Default"
+        assert singletons.singleton_cache.entries.get(singleton_key(SiteSetting)) is cache_module.MISSING
+
+
+def test_concurrent_first_calls_insert_once(pgs, fake_redis, postgresql_proc):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+
+    engine = create_engine(
+        f"postgresql+psycopg2://{postgresql_proc.user}:secret_password@{postgresql_proc.host}"
+        f":{postgresql_proc.port}/test_database"
+    )
+    barrier = threading.Barrier(4)
+    errors = []
+
+    def first_call():
+        with Session(engine) as session:
+            barrier.wait()
+            try:
+                get_or_create_singleton(session, SiteSetting)
+            except Exception as error:
+                errors.append(error)
+
+    threads = [threading.Thread(target=first_call) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    try:
+        assert errors == []
+        assert pgs.scalar(select(func.count()).select_from(SiteSetting)) == 1
+    finally:
+        pgs.query(SiteSetting).delete()
+        pgs.commit()
+        engine.dispose()
@@ -0,0 +1,86 @@
+import hashlib
+import io
+import os
+import time
+
+import pytest
+
+from core.lib.exceptions import PayloadTooLarge
+from core.lib.storage import FileSystemStorage, MultipartETag, S3Storage
+
+
+class TestFileSystemStorage:
+    def test_save_streams_and_hashes(self, tmp_path):
+        storage = FileSystemStorage(root=str(tmp_path), chunk_size=4)
+        data = b"passport scan bytes"
+        stored = storage.save(io.BytesIO(data), filename="Passport.PDF", prefix="kyc")
+
+        digest = hashlib.sha256(data).hexdigest()
+        assert stored.key == f"{digest}.pdf"
+        assert stored.size == len(data)
+        assert stored.sha256 == digest
+        assert stored.content_type == "application/pdf"
+        with storage.open(stored.key) as f:
+            assert f.read() == data
+
+    def test_duplicate_content_shares_blob(self, tmp_path):
+        storage = FileSystemStorage(root=str(tmp_path))
+        first = storage.save(io.BytesIO(b"avatar"), filename="a.png")
+        second = storage.save(io.BytesIO(b"avatar"), filename="b.png", prefix="user")
+
+        assert first.key == second.key
+        assert storage.path(first.key) == storage.path(f"{first.sha256}.jpg")
+        blobs = [p for p in (tmp_path / "blobs").rglob("*") if p.is_file()]
+        assert len(blobs) == 1
+
+    def test_save_rejects_oversized_file(self, tmp_path):
+        storage = FileSystemStorage(root=str(tmp_path), chunk_size=4, max_size=8)
+        with pytest.raises(PayloadTooLarge) as exc_info:
+            storage.save(io.BytesIO(b"x" * 9), filename="big.bin")
+
+        assert exc_info.value.status_code == 413
+        assert list((tmp_path / ".tmp").iterdir()) == []
+
+    def test_key_cannot_escape_root(self, tmp_path):
+        storage = FileSystemStorage(root=str(tmp_path))
+        assert not storage.exists("../../etc/passwd")
+
+    def test_collect_garbage_keeps_referenced_and_recent_blobs(self, tmp_path):
+        storage = FileSystemStorage(root=str(tmp_path))
+        kept = storage.save(io.BytesIO(b"kept"), filename="a.png")
+        orphan = storage.save(io.BytesIO(b"orphan"), filename="b.png")
+        assert storage.collect_garbage([kept.key]) == 0
+        assert storage.collect_garbage([kept.key], grace_seconds=0) == 1
+        assert storage.exists(kept.key)
+        assert not storage.exists(orphan.key)
+
+    def test_saving_again_keeps_an_old_blob(self, tmp_path):
+        storage = FileSystemStorage(root=str(tmp_path))
+        stored = storage.save(io.BytesIO(b"again"), filename="a.png")
+        day_ago = time.time() - 2 * 86400
+        os.utime(storage.path(stored.key), (day_ago, day_ago))
+        again = storage.save(io.BytesIO(b"again"), filename="b.png")
+        assert storage.collect_garbage([]) == 0
+        assert storage.exists(again.key)
+
+
+class TestS3Storage:
+    def test_head_returns_multipart_etag(self, tmp_path):
+        storage = S3Storage(root=str(tmp_path), bucket="test", chunk_size=3)
+        storage.part_size = 5
+        data = b"0123456789ab"
+        stored = storage.save(io.BytesIO(data), filename="doc.txt")
+
+        parts = [hashlib.md5(data[i : i + 5]).digest() for i in range(0, 12, 5)]
+        expected = f"{hashlib.md5(b''.join(parts)).hexdigest()}-3"
+        assert stored.etag == expected
+        assert storage.head(stored.key)["ETag"] == f'"{expected}"'
+        assert storage.head(stored.key)["ContentLength"] == len(data)
+
+        storage.delete(stored.key)
+        assert not storage.exists(stored.key)
+
+    def test_single_part_etag_is_md5(self):
+        etag = MultipartETag(part_size=10)
+        etag.update(b"abc")
+        assert etag.hexdigest() == hashlib.md5(b"abc").hexdigest()